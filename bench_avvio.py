@@ -0,0 +1,78 @@
+import os
+import re
+import ast
+import sys
+import subprocess
+import importlib.util
+
+# =========================
+# BENCHMARK DEGLI IMPORT ALL'AVVIO DELL'APP (-X importtime)
+# =========================
+APP_FILE = "streamlit_app.py"
+# Import della versione precedente, tutti in testa al file (genai compreso, PIL e xlsxwriter
+# caricati da thumbnails e match_log all'import)
+PRIMA = ["streamlit", "pandas", "hashlib", "json", "base64", "re", "io", "concurrent.futures", "datetime",
+         "google.generativeai", "data_store", "match_log", "catalogo", "thumbnails", "PIL.Image", "xlsxwriter",
+         "requests"]
+# Importati dentro funzioni che l'app chiama sempre dopo il login (GitHubFiles crea la sessione HTTP)
+DOPO_LOGIN = ["requests"]
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def app_imports(path=APP_FILE):
+    """Moduli importati a livello di modulo dall'app: (prima del login, dopo il login)."""
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    before, after = [], []
+    current = before
+    for node in ast.parse(source).body:
+        if current is before and "st.stop()" in (ast.get_source_segment(source, node) or ""):
+            current = after   # il blocco del login: da qui in poi solo sessioni già autenticate
+        if isinstance(node, ast.Import):
+            current.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            current.append(node.module)
+    return before, after
+
+def available(modules):
+    found = []
+    for name in modules:
+        try:
+            if importlib.util.find_spec(name) is not None: found.append(name)
+        except ModuleNotFoundError:
+            pass
+    return found
+
+def _top_level(code):
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    top = {}
+    for line in r.stderr.splitlines():
+        m = LINE.match(line)
+        if m and len(m.group(3)) == 1: top[m.group(4)] = int(m.group(2))
+    return top
+
+def measure(modules, repeat=5):
+    """Tempo cumulativo (µs) degli import e dettaglio per modulo di primo livello; il migliore di `repeat`.
+    I moduli che l'interprete carica comunque all'avvio (site, encodings, ...) non contano."""
+    startup = set(_top_level("pass"))
+    best = None
+    for _ in range(repeat):
+        top = {name: us for name, us in _top_level("; ".join(f"import {m}" for m in modules) or "pass").items()
+               if name not in startup}
+        total = sum(top.values())
+        if best is None or total < best[0]: best = (total, top)
+    return best
+
+def run_benchmark(repeat=5):
+    login, resto = app_imports()
+    casi = [("prima (tutto in testa)", PRIMA), ("login", login), ("login + app completa", login + resto + DOPO_LOGIN)]
+    for label, modules in casi:
+        mods = available(modules)
+        missing = sorted(set(modules) - set(mods))
+        total, top = measure(mods, repeat)
+        print(f"[IMPORT] {label:<24} {total / 1000:8.1f} ms" + (f"  (non installati: {', '.join(missing)})" if missing else ""))
+        heaviest = sorted(top.items(), key=lambda kv: -kv[1])[:5]
+        print("         " + ", ".join(f"{name} {us / 1000:.0f} ms" for name, us in heaviest))
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    run_benchmark(*(int(a) for a in sys.argv[1:2]))
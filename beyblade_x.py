@@ -5,8 +5,18 @@ import re
 import os
 import hashlib
 import sys
+import json
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from requests.adapters import HTTPAdapter
 from PIL import Image as PILImage
 from io import BytesIO
+from infobox_parser import parse_page, clean_value, find_image_filename, is_x_system
+import catalogo
 
 # Forza lo script a lavorare nella cartella dove risiede il file .py
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
@@ -16,9 +26,178 @@ HEADERS = {
     "User-Agent": "BeybladeX-Infobox-Only/4.3 (contact: local-script)"
 }
 CSV_FILE = "beyblade_x.csv"
+MANIFEST_FILE = "scrape_manifest.json"
+CACHE_DIR = ".cache"
+COMPONENT_CACHE_FILE = os.path.join(CACHE_DIR, "componenti.json")
+COMPONENT_CACHE_TTL = float(os.environ.get("BEY_CACHE_TTL_DAYS", "7")) * 86400
+COMPONENT_CACHE_MAX = 5000
+CHECKPOINT_FILE = os.path.join(CACHE_DIR, "checkpoint.jsonl")
+CHECKPOINT_EVERY = 100   # pagine elaborate tra un salvataggio del checkpoint e l'altro
+MAX_RETRIES = int(os.environ.get("BEY_MAX_RETRIES", "10"))
+IMAGES_DIR = "images"
+IMG_FORMAT = os.environ.get("BEY_IMG_FORMAT", "webp")                # webp | png8 | png
+IMG_BYTE_BUDGET = int(os.environ.get("BEY_IMG_BUDGET", "30000"))     # byte per l'immagine da 300px
+THUMB_BYTE_BUDGET = int(os.environ.get("BEY_THUMB_BUDGET", "8000"))  # byte per ogni miniatura
+THUMB_SIZES = (80, 100, 150)   # lati delle miniature quadrate mostrate da streamlit_app.py
+IMG_EXTENSIONS = {"webp": ".webp", "png8": ".png", "png": ".png"}
+STATIC_DIR = "static"            # servita da Streamlit su app/static (enableStaticServing)
+SPRITE_SIZE = 80                 # lato delle miniature del Builder
+SPRITE_COLUMNS = 16
+SPRITE_BYTE_BUDGET = int(os.environ.get("BEY_SPRITE_BUDGET", "800000"))
+CASSETTE_MODE = os.environ.get("BEY_CASSETTE", "")   # "" | registra | riproduci
+CASSETTE_DIR = os.environ.get("BEY_CASSETTE_DIR", os.path.join("fixtures", "cassetta"))
+CASSETTE_IMG_SIZE = 64   # lato massimo delle immagini salvate nella cassetta (versionata nel repository)
+
+# Parallelismo e limite di richieste (sovrascrivibili da variabili d'ambiente)
+MAX_WORKERS = int(os.environ.get("BEY_WORKERS", "8"))
+RATE_LIMIT = float(os.environ.get("BEY_RATE", "10"))   # richieste al secondo
+RATE_BURST = int(os.environ.get("BEY_BURST", "10"))
+IMG_DOWNLOAD_WORKERS = int(os.environ.get("BEY_IMG_DOWNLOAD_WORKERS", "8"))
+IMG_PROCESS_WORKERS = int(os.environ.get("BEY_IMG_PROCESS_WORKERS", str(os.cpu_count() or 2)))
+IMG_QUEUE_SIZE = int(os.environ.get("BEY_IMG_QUEUE", "32"))   # immagini in volo al massimo
 
 session = requests.Session()
 session.headers.update(HEADERS)
+# Pool di connessioni keep-alive dimensionato sul numero di thread
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
+# =========================
+# RATE LIMITER (TOKEN BUCKET)
+# =========================
+class TokenBucket:
+    """Limite di richieste condiviso tra tutti i thread: `rate` gettoni al secondo, fino a `burst` accumulati."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+rate_limiter = TokenBucket(RATE_LIMIT, RATE_BURST)
+
+# =========================
+# TRASPORTO HTTP CON CASSETTA (REGISTRA / RIPRODUCI)
+# =========================
+class CassetteMiss(RuntimeError):
+    """Richiesta assente dalla cassetta: in riproduzione non ha senso ritentare."""
+
+class CassetteResponse:
+    """Risposta letta dalla cassetta, con la parte di interfaccia di requests.Response usata qui."""
+
+    def __init__(self, url, status_code, headers, content, size=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = content
+        self.size = len(content) if size is None else size   # byte della risposta originale
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} (cassetta) per {self.url}", response=self)
+
+class Transport:
+    """Tutte le GET dello scraper passano da qui: limite di richieste, contatori di traffico e cassetta.
+
+    In modalità "registra" ogni risposta viene salvata in `directory` (metadati .json + corpo .bin);
+    in "riproduci" viene letta da lì senza toccare la rete né il rate limiter. La cassetta sta nel
+    repository: delle immagini si salva una copia ridotta (CASSETTE_IMG_SIZE) e la dimensione
+    originale, che in riproduzione resta quella contata nel traffico.
+    """
+
+    def __init__(self, session, mode="", directory=CASSETTE_DIR):
+        self.session = session
+        self.mode = mode
+        self.directory = os.path.abspath(directory)
+        self.requests = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def key(self, url, params=None, headers=None):
+        # Nella chiave entrano solo gli header condizionali: sono gli unici che cambiano la risposta
+        cond = {k: v for k, v in (headers or {}).items() if k.lower().startswith("if-")}
+        raw = json.dumps([url, sorted((k, str(v)) for k, v in (params or {}).items()), sorted(cond.items())])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        key = self.key(url, params, headers)
+        meta_path = os.path.join(self.directory, f"{key}.json")
+        if self.mode == "riproduci":
+            if not os.path.exists(meta_path):
+                raise CassetteMiss(f"Risposta non registrata nella cassetta: {url} {params or ''}")
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(os.path.join(self.directory, f"{key}.bin"), "rb") as f:
+                resp = CassetteResponse(url, meta["status"], meta["headers"], f.read(), meta.get("bytes"))
+        else:
+            rate_limiter.acquire()
+            resp = self.session.get(url, params=params, headers=headers, timeout=timeout)
+            # Si registrano solo le risposte definitive: errori temporanei (429, 5xx) riprodotti
+            # dalla cassetta verrebbero ritentati fino a MAX_RETRIES senza mai cambiare
+            if self.mode == "registra" and (resp.status_code < 400 or resp.status_code == 404):
+                self.record(key, url, params, resp)
+        with self.lock:
+            self.requests += 1
+            self.bytes += getattr(resp, "size", len(resp.content))
+        return resp
+
+    def record(self, key, url, params, resp):
+        content = resp.content
+        meta = {"url": url, "params": params, "status": resp.status_code,
+                "headers": {k: v for k, v in resp.headers.items() if k.lower() != "set-cookie"}}
+        if url != API_URL and content:
+            content = shrink_image(content)
+            meta["bytes"] = len(resp.content)
+        os.makedirs(self.directory, exist_ok=True)
+        with atomic_open(os.path.join(self.directory, f"{key}.bin"), "wb") as f:
+            f.write(content)
+        with atomic_open(os.path.join(self.directory, f"{key}.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1, sort_keys=True)
+            f.write("\n")
+
+def shrink_image(content, size=CASSETTE_IMG_SIZE):
+    """Copia ridotta (PNG) di un'immagine per la cassetta; i byte originali se non è un'immagine."""
+    try:
+        img = PILImage.open(BytesIO(content))
+        img.thumbnail((size, size))
+        out = BytesIO()
+        img.save(out, "PNG", optimize=True)
+    except (OSError, ValueError):
+        return content
+    return out.getvalue()
+
+transport = Transport(session, CASSETTE_MODE)
+
+# Tempo, richieste e byte accumulati per fase, riportati da --benchmark
+STAGES = {}
+
+@contextmanager
+def stage(name):
+    start, requests0, bytes0 = time.perf_counter(), transport.requests, transport.bytes
+    try:
+        yield
+    finally:
+        s = STAGES.setdefault(name, {"requests": 0, "bytes": 0, "seconds": 0.0})
+        s["requests"] += transport.requests - requests0
+        s["bytes"] += transport.bytes - bytes0
+        s["seconds"] += time.perf_counter() - start
 
 # =========================
 # API CALL CON RETRY SICURO
@@ -28,8 +207,11 @@ def api_call(params, label=""):
     wait = 1.0
     while True:
         attempt += 1
+        if attempt > MAX_RETRIES:
+            # Meglio fermare il giro (e riprenderlo dal checkpoint) che restare appesi per sempre
+            raise RuntimeError(f"API non raggiungibile dopo {MAX_RETRIES} tentativi [{label}]")
         try:
-            r = session.get(API_URL, params=params, timeout=30)
+            r = transport.get(API_URL, params=params, timeout=30)
             r.raise_for_status()
             return r.json()
         except requests.exceptions.RequestException as e:
@@ -63,100 +245,292 @@ def get_beyblade_infobox_pages():
             titles.extend(p["title"] for p in data["query"]["embeddedin"])
         cont = data.get("continue", {}).get("eicontinue")
         if not cont: break
-        time.sleep(0.4)
     titles = sorted(set(titles))
     print(f"[OK] Totale pagine candidate: {len(titles)}\n")
     return titles
 
-def get_wikitext(title):
-    data = api_call({
-        "action": "query",
-        "prop": "revisions",
-        "titles": title,
-        "rvslots": "main",
-        "rvprop": "content",
-        "format": "json"
-    }, f"wikitext:{title}")
-    try:
-        pages = data.get("query", {}).get("pages", {})
-        if not pages: return ""
-        page = next(iter(pages.values()))
+# =========================
+# QUERY A BLOCCHI (FINO A 50 TITOLI PER RICHIESTA)
+# =========================
+BATCH_SIZE = 50
+
+def _chunks(items, size=BATCH_SIZE):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def query_titles(titles, params, label=""):
+    """Esegue `action=query` su più titoli per richiesta e restituisce {titolo richiesto: pagina}.
+
+    Le voci `normalized` e `redirects` della risposta vengono seguite per ricondurre ogni
+    pagina al titolo chiesto in origine; i blocchi sono interrogati in parallelo.
+    """
+    titles = [t for t in dict.fromkeys(titles) if t and t != "n/a"]
+
+    def run_chunk(chunk):
+        req = dict(params, action="query", titles="|".join(chunk), format="json")
+        pages, aliases = {}, {}
+        while True:
+            data = api_call(req, f"{label}:{chunk[0]} (+{len(chunk) - 1})")
+            q = data.get("query", {})
+            for entry in q.get("normalized", []) + q.get("redirects", []):
+                aliases[entry["from"]] = entry["to"]
+            for page in q.get("pages", {}).values():
+                pages.setdefault(page.get("title"), {}).update(page)
+            cont = data.get("continue")
+            if not cont: break
+            req = dict(req, **cont)
+        result = {}
+        for title in chunk:
+            target, seen = title, set()
+            while target in aliases and target not in seen:
+                seen.add(target)
+                target = aliases[target]
+            if target in pages: result[title] = pages[target]
+        return result
+
+    merged = {}
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for part in pool.map(run_chunk, _chunks(titles)):
+            merged.update(part)
+    return merged
+
+def get_wikitexts(titles):
+    pages = query_titles(titles, {"prop": "revisions", "rvslots": "main", "rvprop": "content"}, "wikitext")
+    result = {}
+    for title, page in pages.items():
         revisions = page.get("revisions", [])
-        if not revisions: return ""
-        return revisions[0].get("slots", {}).get("main", {}).get("*", "")
-    except: return ""
-
-def extract_infobox(wikitext):
-    if not wikitext: return {}
-    m = re.search(r"\{\{Beyblade Infobox(.*?)\n\}\}", wikitext, re.S | re.I)
-    if not m: return {}
-    block = m.group(1)
-    fields = {}
-    current = None
-    buf = []
-    for line in block.splitlines():
-        if line.strip().startswith("|"):
-            if current: fields[current] = "\n".join(buf).strip()
-            parts = line[1:].split("=", 1)
-            current = parts[0].strip()
-            buf = [parts[1].strip()] if len(parts) > 1 else []
-        else:
-            if current: buf.append(line.strip())
-    if current: fields[current] = "\n".join(buf).strip()
-    return fields
+        if revisions: result[title] = revisions[0].get("slots", {}).get("main", {}).get("*", "")
+    return result
+
+def get_wikitext(title):
+    return get_wikitexts([title]).get(title, "")
 
-def clean_value(val):
-    if not val: return "n/a"
-    val = re.sub(r"\{\{.*?\}\}", "", val, flags=re.S)
-    val = re.sub(r"\[\[([^|\]]*\|)?([^\]]+)\]\]", r"\2", val)
-    val = re.sub(r"<.*?>", "", val)
-    return val.strip() if val.strip() else "n/a"
+def get_page_info(titles):
+    """Solo metadati di revisione (niente wikitext): {titolo: {pageid, revid, touched}}."""
+    pages = query_titles(titles, {"prop": "info"}, "info")
+    return {t: {"pageid": page["pageid"], "revid": page.get("lastrevid"), "touched": page.get("touched")}
+            for t, page in pages.items() if int(page.get("pageid", -1)) > 0}
+
+def get_infobox_images(titles):
+    """Per ogni pagina componente restituisce l'URL dell'immagine dell'infobox (o "n/a")."""
+    wikitexts = get_wikitexts(titles)
+    filenames = {t: find_image_filename(wikitexts.get(t, "")) for t in titles if t != "n/a"}
+    files = query_titles([f"File:{fn}" for fn in filenames.values() if fn],
+                         {"prop": "imageinfo", "iiprop": "url"}, "file")
+    result = {}
+    for title, filename in filenames.items():
+        info = files.get(f"File:{filename}", {}).get("imageinfo") if filename else None
+        result[title] = info[0]["url"] if info else "n/a"
+    return result
 
 def get_infobox_image(title):
     if title == "n/a": return "n/a"
-    try:
-        wikitext = get_wikitext(title)
-        m = re.search(r"\|\s*image\s*=\s*([^\n|]+)", wikitext, re.I)
-        if not m: m = re.search(r"\[\[\s*File\s*:\s*([^\|\]]+)", wikitext, re.I)
-        if not m: return "n/a"
-        filename = m.group(1).strip()
-        data = api_call({
-            "action": "query", "titles": f"File:{filename}",
-            "prop": "imageinfo", "iiprop": "url", "format": "json"
-        }, f"file:{filename}")
-        page = next(iter(data.get("query", {}).get("pages", {}).values()))
-        info = page.get("imageinfo")
-        return info[0]["url"] if info else "n/a"
-    except: return "n/a"
+    return get_infobox_images([title]).get(title, "n/a")
+
+def get_pageimages(titles):
+    pages = query_titles(titles, {"prop": "pageimages", "pithumbsize": 400, "pilimit": BATCH_SIZE}, "pageimg")
+    return {t: page.get("thumbnail", {}).get("source", "n/a") for t, page in pages.items()}
 
 def get_pageimage(title):
     if title == "n/a": return "n/a"
-    try:
-        data = api_call({
-            "action": "query", "titles": title, "prop": "pageimages",
-            "pithumbsize": 400, "format": "json"
-        }, f"pageimg:{title}")
-        page = next(iter(data.get("query", {}).get("pages", {}).values()))
-        return page.get("thumbnail", {}).get("source", "n/a")
-    except: return "n/a"
+    return get_pageimages([title]).get(title, "n/a")
+
+def resolve_component_pages(titles):
+    """Restituisce {titolo richiesto: titolo reale} per le pagine esistenti, seguendo i redirect."""
+    pages = query_titles(titles, {"redirects": 1}, "resolve")
+    return {t: page.get("title", "n/a") for t, page in pages.items() if int(page.get("pageid", -1)) > 0}
 
 def resolve_component_page(name, prefixes):
     if name == "n/a": return "n/a"
+    resolved = resolve_component_pages([f"{prefix}{name}" for prefix in prefixes])
     for prefix in prefixes:
         title = f"{prefix}{name}"
-        try:
-            data = api_call({
-                "action": "query", "titles": title, "redirects": 1, "format": "json"
-            }, f"resolve:{title}")
-            page = next(iter(data.get("query", {}).get("pages", {}).values()))
-            if int(page.get("pageid", -1)) > 0: return page.get("title", "n/a")
-        except: pass
-        time.sleep(0.1)
+        if title in resolved: return resolved[title]
     return "n/a"
 
+# =========================
+# ARCHIVIO IMMAGINI
+# =========================
+def canonical_image_url(url):
+    """URL senza il cache-buster (`?cb=...`): identifica il file sul wiki tra un ricaricamento e l'altro."""
+    return url.split("?", 1)[0]
+
+class ImageStore:
+    """Archivio di images/ indirizzato per contenuto.
+
+    Ogni file prende il nome dall'md5 dei propri byte, quindi immagini identiche vengono salvate
+    una volta sola; `images/manifest.json` associa ogni URL al suo file e ricorda ETag e
+    Last-Modified dell'ultimo download per fare GET condizionali. Accanto a ogni file ci sono
+    le miniature già pronte `<hash>_<lato>.<ext>` per le dimensioni in THUMB_SIZES.
+    """
+
+    def __init__(self, directory=IMAGES_DIR):
+        self.dir = directory
+        self.path = os.path.join(directory, "manifest.json")
+        self.format = IMG_FORMAT
+        self.urls = {}
+        self.sources = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.format = data.get("format", "png")
+            self.urls = data.get("urls", {})
+            self.sources = data.get("sources", {})
+
+    def save(self):
+        with atomic_open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"format": self.format, "thumb_sizes": list(THUMB_SIZES),
+                       "urls": self.urls, "sources": self.sources}, f, indent=1, sort_keys=True)
+            f.write("\n")
+
+    def blob_path(self, blob):
+        return os.path.join(self.dir, blob)
+
+    def has(self, url):
+        blob = self.urls.get(url)
+        return bool(blob) and os.path.exists(self.blob_path(blob))
+
+    def add_blob(self, rendered, fmt=IMG_FORMAT):
+        """Salva l'immagine e le sue miniature (output di `render_image`); restituisce il nome del file."""
+        master, thumbs = rendered
+        stem, ext = hashlib.md5(master).hexdigest(), IMG_EXTENSIONS[fmt]
+        files = {f"{stem}{ext}": master}
+        files.update({f"{stem}_{size}{ext}": data for size, data in thumbs.items()})
+        for name, data in files.items():
+            path = self.blob_path(name)
+            if not os.path.exists(path):
+                with open(path, "wb") as f:
+                    f.write(data)
+        return f"{stem}{ext}"
+
+    def convert(self, path, fmt=IMG_FORMAT, rendered=None):
+        """Ricodifica un file esistente nel formato corrente (con miniature) e rimuove l'originale."""
+        blob = self.add_blob(rendered or rerender_file(path, fmt), fmt)
+        if self.blob_path(blob) != path:
+            os.remove(path)
+            stem, ext = os.path.splitext(path)
+            for size in THUMB_SIZES:
+                if os.path.exists(f"{stem}_{size}{ext}"): os.remove(f"{stem}_{size}{ext}")
+        return blob
+
+    @staticmethod
+    def legacy_name(url):
+        return hashlib.md5(url.encode()).hexdigest() + ".png"
+
+    def legacy_path(self, url):
+        """File del vecchio schema (md5 dell'URL) per `url`; None se non c'è."""
+        path = self.blob_path(self.legacy_name(url))
+        return path if os.path.exists(path) else None
+
+    def adopt_legacy(self, url, convert=True, rendered=None):
+        """Importa un file del vecchio schema convertendolo (con `rendered` già calcolato dal
+        pool di processi, se c'è) e rinominandolo per contenuto."""
+        legacy = self.legacy_path(url)
+        if not legacy: return False
+        self.urls[url] = self.convert(legacy, rendered=rendered) if convert else os.path.basename(legacy)
+        return True
+
+    def conditional_headers(self, url):
+        src = self.sources.get(canonical_image_url(url))
+        if not src or not os.path.exists(self.blob_path(src["blob"])): return {}
+        headers = {}
+        if src.get("etag"): headers["If-None-Match"] = src["etag"]
+        if src.get("last_modified"): headers["If-Modified-Since"] = src["last_modified"]
+        return headers
+
+    def record(self, url, blob, headers=None):
+        self.urls[url] = blob
+        if headers is not None:
+            self.sources[canonical_image_url(url)] = {
+                "blob": blob, "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")
+            }
+
+    def gc(self, referenced_urls):
+        """Elimina alias, sorgenti e file non più referenziati dal CSV. Restituisce i file rimossi.
+
+        I file del vecchio schema di un URL ancora referenziato restano: finché non sono stati
+        convertiti sono l'unica copia dell'immagine.
+        """
+        self.urls = {u: b for u, b in self.urls.items() if u in referenced_urls}
+        live = set(self.urls.values())
+        self.sources = {c: s for c, s in self.sources.items() if s["blob"] in live}
+        live_stems = {os.path.splitext(b)[0] for b in live}
+        live |= {self.legacy_name(u) for u in referenced_urls}
+        removed = 0
+        for name in os.listdir(self.dir):
+            stem, ext = os.path.splitext(name)
+            if ext in (".png", ".webp") and name not in live and stem.split("_")[0] not in live_stems:
+                os.remove(self.blob_path(name))
+                removed += 1
+        return removed
+
+def download_image(url, headers=None):
+    start = time.perf_counter()
+    resp = transport.get(url, headers=headers, timeout=20)
+    resp.raise_for_status()
+    return resp.status_code, resp.content, resp.headers, time.perf_counter() - start
+
+def encode_image(img, fmt, budget):
+    """Codifica nel formato richiesto scendendo di qualità finché i byte rientrano nel budget.
+
+    Se nessun tentativo ci sta, restituisce la versione più piccola ottenuta.
+    """
+    if fmt == "webp": steps = [90, 80, 70, 60, 45, 30]
+    elif fmt == "png8": steps = [256, 128, 64, 32]
+    else: steps = [None]
+    best = None
+    for step in steps:
+        out = BytesIO()
+        if fmt == "webp":
+            img.save(out, "WEBP", quality=step)
+        elif fmt == "png8":
+            img.quantize(colors=step, method=PILImage.Quantize.FASTOCTREE).save(out, "PNG", optimize=True)
+        else:
+            img.save(out, "PNG", optimize=True)
+        data = out.getvalue()
+        if best is None or len(data) < len(best): best = data
+        if len(data) <= budget: return data
+    return best
+
+def render_image(img, fmt):
+    """Immagine larga 300px più le miniature quadrate alle dimensioni usate dall'app."""
+    if img.mode != 'RGBA': img = img.convert('RGBA')
+    if img.size[0] != 300:
+        target_w = 300
+        w_percent = (target_w / float(img.size[0]))
+        target_h = int((float(img.size[1]) * float(w_percent)))
+        img = img.resize((target_w, target_h), PILImage.Resampling.LANCZOS)
+    master = encode_image(img, fmt, IMG_BYTE_BUDGET)
+    thumbs = {size: encode_image(img.resize((size, size), PILImage.Resampling.LANCZOS), fmt, THUMB_BYTE_BUDGET)
+              for size in THUMB_SIZES}
+    return master, thumbs
+
+def rerender_image(content, fmt=IMG_FORMAT):
+    return render_image(PILImage.open(BytesIO(content)), fmt)
+
+def rerender_file(path, fmt=IMG_FORMAT):
+    with open(path, "rb") as f:
+        return rerender_image(f.read(), fmt)
+
+def optimize_image(content, fmt=IMG_FORMAT):
+    """Decodifica, ridimensiona e codifica immagine e miniature. Gira nel pool di processi."""
+    start = time.perf_counter()
+    rendered = rerender_image(content, fmt)
+    return rendered, time.perf_counter() - start
+
+def process_pool():
+    """Pool di processi per l'elaborazione delle immagini.
+
+    I worker partono da un forkserver (o con spawn dove non c'è) e non da un fork del processo
+    principale: un fork fatto mentre i thread di download sono attivi può bloccarsi su un lock
+    ereditato a metà.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=IMG_PROCESS_WORKERS, mp_context=context)
+
 def download_and_optimize_images():
     print("\n[STEP] Sincronizzazione immagini...")
-    if not os.path.exists("images"): os.makedirs("images")
+    if not os.path.exists(IMAGES_DIR): os.makedirs(IMAGES_DIR)
     image_urls = set()
     if os.path.exists(CSV_FILE):
         with open(CSV_FILE, "r", encoding="utf-8") as f:
@@ -168,104 +542,545 @@ def download_and_optimize_images():
                         if url and url != "n/a": image_urls.add(url)
     
     print(f"    → Link da verificare: {len(image_urls)}")
-    downloaded, skipped = 0, 0
-    for url in image_urls:
-        filename = hashlib.md5(url.encode()).hexdigest() + ".png"
-        filepath = os.path.join("images", filename)
-        if os.path.exists(filepath):
-            skipped += 1
-            continue
-        try:
-            resp = session.get(url, timeout=20)
-            resp.raise_for_status()
-            img = PILImage.open(BytesIO(resp.content))
-            if img.mode != 'RGBA': img = img.convert('RGBA')
-            target_w = 300
-            w_percent = (target_w / float(img.size[0]))
-            target_h = int((float(img.size[1]) * float(w_percent)))
-            img = img.resize((target_w, target_h), PILImage.Resampling.LANCZOS)
-            img.save(filepath, "PNG", optimize=True)
-            print(f"    ✔ Salvato: {filename}")
-            downloaded += 1
-            time.sleep(0.1)
-        except Exception as e:
-            print(f"    ✘ Errore {url}: {type(e).__name__}")
-    print(f"\n[FINE] Sincronizzazione: {downloaded} scaricate, {skipped} già presenti.")
+    store = ImageStore()
+    if store.format != IMG_FORMAT:
+        print(f"    ! Archivio in formato '{store.format}', nuovi file in '{IMG_FORMAT}': usare --migra-immagini")
+    missing = [url for url in sorted(image_urls) if not store.has(url)]
+    # I file del vecchio schema non si riscaricano: si convertono nel pool di processi
+    legacy = {url: store.legacy_path(url) for url in missing if store.legacy_path(url)}
+    todo = [url for url in missing if url not in legacy]
+    downloaded, revalidated, adopted, errors, skipped = 0, 0, 0, 0, len(image_urls) - len(missing)
+    t_download, t_process, wall_start = 0.0, 0.0, time.perf_counter()
+    if todo or legacy:
+        # Pipeline: i thread scaricano e passano i byte al pool di processi che decodifica,
+        # ridimensiona e codifica. Al massimo IMG_QUEUE_SIZE immagini sono in volo o in attesa di
+        # essere salvate: oltre, prima di inviarne altre si salvano le più vecchie.
+        with process_pool() as cpu_pool, ThreadPoolExecutor(max_workers=IMG_DOWNLOAD_WORKERS) as dl_pool:
+            def fetch(url, headers):
+                status, content, resp_headers, elapsed = download_image(url, headers)
+                job = cpu_pool.submit(optimize_image, content, IMG_FORMAT) if status != 304 else None
+                return resp_headers, elapsed, job
+
+            def submit(url):
+                if url in legacy:
+                    # Percorsi assoluti: i worker importano il modulo da capo e lavorano nella cartella dello script
+                    return url, cpu_pool.submit(rerender_file, os.path.abspath(legacy[url]), IMG_FORMAT)
+                return url, dl_pool.submit(fetch, url, store.conditional_headers(url))
+
+            def consume(url, job):
+                nonlocal downloaded, revalidated, adopted, errors, t_download, t_process
+                if url in legacy:
+                    try:
+                        store.adopt_legacy(url, rendered=job.result())
+                        adopted += 1
+                    except Exception as e:
+                        print(f"    ✘ Errore conversione {url}: {type(e).__name__}")
+                        errors += 1
+                    return
+                try:
+                    resp_headers, elapsed, process_job = job.result()
+                    t_download += elapsed
+                    if process_job is None:
+                        # 304: stesso contenuto del download precedente, basta un alias
+                        store.record(url, store.sources[canonical_image_url(url)]["blob"])
+                        revalidated += 1
+                        return
+                    data, elapsed = process_job.result()
+                    t_process += elapsed
+                    blob = store.add_blob(data)
+                    store.record(url, blob, resp_headers)
+                    print(f"    ✔ Salvato: {blob}")
+                    downloaded += 1
+                except Exception as e:
+                    print(f"    ✘ Errore {url}: {type(e).__name__}")
+                    errors += 1
+
+            pending = deque()
+            for url in list(legacy) + todo:
+                if len(pending) >= IMG_QUEUE_SIZE: consume(*pending.popleft())
+                pending.append(submit(url))
+            while pending: consume(*pending.popleft())
+    if errors:
+        # Con download o conversioni fallite l'archivio non è completo: non si elimina niente
+        print(f"    ! {errors} errori: pulizia dei file non referenziati rimandata")
+        removed = 0
+    else:
+        removed = store.gc(image_urls) if image_urls else 0
+    store.save()
+    wall = time.perf_counter() - wall_start
+    print(f"\n[FINE] Sincronizzazione: {downloaded} scaricate, {revalidated} invariate (304), "
+          f"{adopted} convertite dal vecchio schema, {skipped} già presenti, {errors} errori, {removed} rimosse. "
+          f"Tempi: download {t_download:.1f}s, elaborazione {t_process:.1f}s (somma sui worker), totale {wall:.1f}s.")
+
+def migrate_images(fmt=IMG_FORMAT):
+    """Converte l'intera cartella images/ nel formato indicato, con miniature, aggiornando il manifest."""
+    print(f"\n[STEP] Migrazione immagini nel formato '{fmt}'...")
+    store = ImageStore()
+    before = sum(os.path.getsize(store.blob_path(n)) for n in os.listdir(store.dir) if n != "manifest.json")
+    legacy = set()
+    if os.path.exists(CSV_FILE):
+        with open(CSV_FILE, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                for key, url in row.items():
+                    if "_image" in key and url and url != "n/a" and url not in store.urls:
+                        if store.adopt_legacy(url, convert=False): legacy.add(store.urls[url])
+    # Se l'archivio è già nel formato richiesto si convertono solo i file del vecchio schema,
+    # così le immagini lossy non vengono ricompresse a ogni esecuzione
+    blobs = set(store.urls.values()) if store.format != fmt else legacy
+    blobs = [b for b in sorted(blobs) if os.path.exists(store.blob_path(b))]
+    with process_pool() as cpu_pool:
+        paths = [store.blob_path(b) for b in blobs]
+        rendered = cpu_pool.map(rerender_file, [os.path.abspath(p) for p in paths], [fmt] * len(paths))
+        converted = {b: store.convert(path, fmt, r) for b, path, r in zip(blobs, paths, rendered)}
+    store.urls = {u: converted.get(b, b) for u, b in store.urls.items()}
+    for src in store.sources.values():
+        src["blob"] = converted.get(src["blob"], src["blob"])
+    removed = store.gc(set(store.urls))
+    store.format = fmt
+    store.save()
+    after = sum(os.path.getsize(store.blob_path(n)) for n in os.listdir(store.dir) if n != "manifest.json")
+    print(f"[FINE] Migrazione: {len(converted)} immagini convertite, {removed} file rimossi, "
+          f"{before / 1e6:.1f} MB -> {after / 1e6:.1f} MB (miniature incluse).")
+
+def build_sprite_sheet(size=SPRITE_SIZE, directory=STATIC_DIR):
+    """Impacchetta le miniature delle componenti in un unico foglio sprite per il Builder.
+
+    Accanto scrive `sprites_<lato>.json` con il nome del foglio e la posizione di ogni URL.
+    Il nome del foglio contiene l'hash del contenuto, così il browser non usa mai una versione
+    vecchia con posizioni diverse.
+    """
+    print("\n[STEP] Generazione foglio sprite delle componenti...")
+    urls = set()
+    if os.path.exists(CSV_FILE):
+        with open(CSV_FILE, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                for key, url in row.items():
+                    if key.endswith("_image") and key != "beyblade_page_image" and url and url != "n/a":
+                        urls.add(url)
+    store = ImageStore()
+    tiles = []
+    for url in sorted(urls):
+        blob = store.urls.get(url) or f"{hashlib.md5(url.encode()).hexdigest()}.png"
+        path = store.blob_path(blob)
+        stem, ext = os.path.splitext(path)
+        thumb = f"{stem}_{size}{ext}"
+        if os.path.exists(thumb): tiles.append((url, thumb))
+        elif os.path.exists(path): tiles.append((url, path))
+    if not tiles:
+        print("    ! Nessuna immagine da impacchettare")
+        return
+
+    rows = -(-len(tiles) // SPRITE_COLUMNS)
+    sheet = PILImage.new("RGBA", (SPRITE_COLUMNS * size, rows * size), (0, 0, 0, 0))
+    positions = {}
+    for i, (url, path) in enumerate(tiles):
+        with PILImage.open(path) as img:
+            tile = img.convert("RGBA")
+        if tile.size != (size, size): tile = tile.resize((size, size), PILImage.Resampling.LANCZOS)
+        x, y = (i % SPRITE_COLUMNS) * size, (i // SPRITE_COLUMNS) * size
+        sheet.paste(tile, (x, y))
+        positions[url] = [x, y]
+    data = encode_image(sheet, IMG_FORMAT, SPRITE_BYTE_BUDGET)
+
+    os.makedirs(directory, exist_ok=True)
+    name = f"sprites_{size}_{hashlib.md5(data).hexdigest()[:10]}{IMG_EXTENSIONS[IMG_FORMAT]}"
+    with atomic_open(os.path.join(directory, name), "wb") as f:
+        f.write(data)
+    with atomic_open(os.path.join(directory, f"sprites_{size}.json"), "w", encoding="utf-8") as f:
+        json.dump({"file": name, "size": size, "width": sheet.size[0], "height": sheet.size[1],
+                   "tiles": positions}, f, indent=1, sort_keys=True)
+        f.write("\n")
+    for old in os.listdir(directory):
+        if old.startswith(f"sprites_{size}_") and old != name: os.remove(os.path.join(directory, old))
+    print(f"[OK] Foglio sprite {name}: {len(positions)} miniature, {len(data) / 1e3:.0f} KB")
+
+def save_wikitext_fixtures(directory=os.path.join("fixtures", "wikitext")):
+    """Salva il wikitext di tutte le pagine candidate, corpus per il benchmark di infobox_parser.py."""
+    os.makedirs(directory, exist_ok=True)
+    wikitexts = get_wikitexts(get_beyblade_infobox_pages())
+    for title, text in wikitexts.items():
+        name = re.sub(r"[^\w\-]+", "_", title).strip("_")
+        with open(os.path.join(directory, f"{name}.wiki"), "w", encoding="utf-8") as f:
+            f.write(text)
+    print(f"[OK] {len(wikitexts)} fixture salvate in {directory}")
 
 # =========================
 # MAIN
 # =========================
-def create_csv():
-    titles = get_beyblade_infobox_pages()
-    fields = ["name", "beyblade_page_image", "blade", "blade_image", "over_blade", "over_blade_image", 
-              "metal_blade", "metal_blade_image", "main_blade", "main_blade_image",
-              "assist_blade", "assist_blade_image", "lock_chip", "lock_chip_image", "ratchet", "ratchet_image",
-              "ratchet_integrated_blade", "ratchet_integrated_blade_image",
-              "ratchet_integrated_bit", "ratchet_integrated_bit_image", "bit", "bit_image"]
-
-    with open(CSV_FILE, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fields)
+FIELDS = ["name", "beyblade_page_image", "blade", "blade_image", "over_blade", "over_blade_image", 
+          "metal_blade", "metal_blade_image", "main_blade", "main_blade_image",
+          "assist_blade", "assist_blade_image", "lock_chip", "lock_chip_image", "ratchet", "ratchet_image",
+          "ratchet_integrated_blade", "ratchet_integrated_blade_image",
+          "ratchet_integrated_bit", "ratchet_integrated_bit_image", "bit", "bit_image"]
+
+COMPONENTS = {
+    "blade": ["BladeX", "Blade"], "main_blade": ["MainBlade"],
+    "over_blade": ["OverBlade"], "metal_blade": ["MetalBlade"],
+    "assist_blade": ["AssistBlade"], "lock_chip": ["LockChip", "Lock Bit"],
+    "ratchet": ["Ratchet"], "ratchet_integrated_blade": ["RatchetBlade"],
+    "ratchet_integrated_bit": ["RatchetBit"],
+    "bit": ["Bit", "PerformanceTip"]
+}
+
+def component_prefix(comp):
+    if comp == "ratchet_integrated_blade": return "Ratchet-Integrated Blade - "
+    if comp == "ratchet_integrated_bit": return "Ratchet-Integrated Bit - "
+    return f"{comp.replace('_', ' ').title()} - "
+
+def parse_title(title, wikitext, idx, total):
+    """Valuta una pagina candidata: restituisce la riga (senza immagini) oppure None se scartata."""
+    info, p_code, system_val = parse_page(wikitext)
+
+    # LOG DI VALUTAZIONE
+    if not is_x_system(p_code, system_val):
+        print(f"[{idx}/{total}] {title} -> ❌ [SKIP] (Altro Sistema)")
+        return None
+
+    print(f"[{idx}/{total}] {title} -> ✅ [KEEP] (X System)")
+    row = {k: "n/a" for k in FIELDS}
+    row["name"] = title
+    for comp, keys in COMPONENTS.items():
+        for k in keys:
+            val = clean_value(info.get(k))
+            if val != "n/a":
+                row[comp] = val
+                break
+    return row
+
+# =========================
+# CACHE DELLE COMPONENTI
+# =========================
+class ComponentCache:
+    """Cache (tipo componente, nome) -> pagina e URL immagine.
+
+    Vive in memoria durante il giro e viene salvata su disco tra un giro e l'altro: le voci
+    più vecchie di `ttl` secondi vengono scartate al caricamento e, oltre `max_entries`,
+    si eliminano le meno recenti. Le ricerche fallite ("n/a") non vengono salvate: al giro
+    successivo si riprova. Dopo `refresh()` valgono solo le voci risolte da quel momento.
+    """
+
+    def __init__(self, path=COMPONENT_CACHE_FILE, ttl=COMPONENT_CACHE_TTL, max_entries=COMPONENT_CACHE_MAX):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.since = 0
+        self.load()
+
+    @staticmethod
+    def _key(comp, name):
+        return f"{comp}|{name}"
+
+    def load(self):
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except ValueError:
+            return
+        now = time.time()
+        self.entries = {k: v for k, v in data.items() if now - v.get("ts", 0) < self.ttl}
+
+    def save(self):
+        if len(self.entries) > self.max_entries:
+            newest = sorted(self.entries.items(), key=lambda kv: kv[1]["ts"], reverse=True)
+            self.entries = dict(newest[:self.max_entries])
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with atomic_open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+
+    def refresh(self):
+        # Giro completo: le voci già in cache restano su disco ma vanno risolte di nuovo
+        self.since = time.time()
+
+    def __contains__(self, key):
+        return self.get(*key) is not None
+
+    def get(self, comp, name):
+        entry = self.entries.get(self._key(comp, name))
+        return entry if entry and entry["ts"] >= self.since else None
+
+    def put(self, comp, name, page, image):
+        if page == "n/a": return
+        self.entries[self._key(comp, name)] = {"page": page, "image": image, "ts": time.time()}
+
+component_cache = ComponentCache()
+
+def fill_images(rows):
+    """Completa le colonne immagine di tutte le righe con poche richieste a blocchi."""
+    page_imgs = get_pageimages([row["name"] for row in rows])
+    for row in rows:
+        row["beyblade_page_image"] = page_imgs.get(row["name"], "n/a")
+
+    # Ogni componente distinta viene risolta una sola volta, e solo se non è già in cache
+    lookups = [(comp, row[comp]) for row in rows for comp in COMPONENTS if row[comp] != "n/a"]
+    missing = sorted(set(key for key in lookups if key not in component_cache))
+    component_cache.misses += len(missing)
+    component_cache.hits += len(lookups) - len(missing)
+
+    comp_titles = {key: f"{component_prefix(key[0])}{key[1]}" for key in missing}
+    resolved = resolve_component_pages(list(comp_titles.values()))
+    comp_pages = {key: resolved.get(title, "n/a") for key, title in comp_titles.items()}
+
+    pages = sorted(set(p for p in comp_pages.values() if p != "n/a"))
+    imgs = get_infobox_images(pages)
+    fallback = get_pageimages([p for p in pages if imgs.get(p, "n/a") == "n/a"])
+    for p in pages:
+        if imgs.get(p, "n/a") == "n/a": imgs[p] = fallback.get(p, "n/a")
+    for key, page in comp_pages.items():
+        component_cache.put(*key, page, imgs.get(page, "n/a"))
+
+    for row in rows:
+        for comp in COMPONENTS:
+            entry = component_cache.get(comp, row[comp]) if row[comp] != "n/a" else None
+            row[f"{comp}_image"] = entry["image"] if entry else "n/a"
+
+# =========================
+# SCRITTURA ATOMICA E CHECKPOINT
+# =========================
+@contextmanager
+def atomic_open(path, mode="w", **kwargs):
+    """Scrive su un file temporaneo e lo sostituisce all'originale solo a scrittura completata."""
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+
+def load_checkpoint():
+    """Pagine già elaborate da un giro interrotto: {titolo: {"revid": ..., "row": riga o None}}."""
+    done = {}
+    if not os.path.exists(CHECKPOINT_FILE): return done
+    with open(CHECKPOINT_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break   # ultima riga troncata da un'interruzione
+            done[entry["title"]] = entry
+    return done
+
+def append_checkpoint(entries):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(CHECKPOINT_FILE, "a", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def clear_checkpoint():
+    if os.path.exists(CHECKPOINT_FILE): os.remove(CHECKPOINT_FILE)
+
+# =========================
+# MANIFEST DELLE REVISIONI
+# =========================
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE): return {}
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    with atomic_open(MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+
+def load_csv_rows():
+    if not os.path.exists(CSV_FILE): return {}
+    with open(CSV_FILE, "r", newline="", encoding="utf-8") as f:
+        return {row["name"]: row for row in csv.DictReader(f)}
+
+def write_csv(rows):
+    """Scrive le righe (anche da un generatore) su file temporaneo e lo rinomina a fine scrittura."""
+    count = 0
+    with atomic_open(CSV_FILE, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
         writer.writeheader()
-        kept = 0
-        for idx, title in enumerate(titles, 1):
-            wikitext = get_wikitext(title)
-            m = re.search(r"\|\s*ProductCode\s*=\s*([^\n|]+)", wikitext)
-            s = re.search(r"\|\s*System\s*=\s*([^\n|]+)", wikitext)
-            p_code = clean_value(m.group(1)) if m else ""
-            system_val = clean_value(s.group(1)) if s else ""
-            check_text = (p_code + " " + system_val).upper()
-
-            # LOG DI VALUTAZIONE
-            if any(k in check_text for k in ["BX", "UX", "CX", "CUSTOM LINE", "BASIC LINE", "UNIQUE LINE"]):
-                print(f"[{idx}/{len(titles)}] {title} -> ✅ [KEEP] (X System)")
-                info = extract_infobox(wikitext)
-                row = {k: "n/a" for k in fields}
-                row["name"] = title
-                row["beyblade_page_image"] = get_pageimage(title)
-                components = {
-                    "blade": ["BladeX", "Blade"], "main_blade": ["MainBlade"],
-                    "over_blade": ["OverBlade"], "metal_blade": ["MetalBlade"],
-                    "assist_blade": ["AssistBlade"], "lock_chip": ["LockChip", "Lock Bit"],
-                    "ratchet": ["Ratchet"], "ratchet_integrated_blade": ["RatchetBlade"],
-                    "ratchet_integrated_bit": ["RatchetBit"],
-                    "bit": ["Bit", "PerformanceTip"]
-                }
-                for comp, keys in components.items():
-                    for k in keys:
-                        val = clean_value(info.get(k))
-                        if val != "n/a":
-                            row[comp] = val
-                            break
-                    
-                    prefix = f"{comp.replace('_', ' ').title()} - "
-                    if comp == "ratchet_integrated_blade":
-                        prefix = "Ratchet-Integrated Blade - "
-                    elif comp == "ratchet_integrated_bit":
-                        prefix = "Ratchet-Integrated Bit - "
-                        
-                    page = resolve_component_page(row[comp], [prefix])
-                    img = get_infobox_image(page)
-                    if img == "n/a": img = get_pageimage(page)
-                    row[f"{comp}_image"] = img
-                writer.writerow(row)
-                kept += 1
-            else:
-                print(f"[{idx}/{len(titles)}] {title} -> ❌ [SKIP] (Altro Sistema)")
-            
-            time.sleep(0.1)
-            
-        print(f"\n[OK] CSV generato con {kept} Beyblades.")
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+def scrape_titles(titles, info):
+    """Scarica, valuta e completa le righe per i titoli indicati, a blocchi con checkpoint.
+
+    Un giro interrotto riparte dalle pagine non ancora salvate nel checkpoint, purché la
+    revisione nel frattempo non sia cambiata.
+    """
+    done = {t: e for t, e in load_checkpoint().items() if t in info and e.get("revid") == info[t]["revid"]}
+    todo = [t for t in titles if t not in done]
+    if done: print(f"[RIPRESA] {len(done)} pagine già elaborate nel checkpoint, {len(todo)} da elaborare")
+    total = len(titles)
+    position = {t: idx for idx, t in enumerate(titles, 1)}
+
+    for start in range(0, len(todo), CHECKPOINT_EVERY):
+        chunk = todo[start:start + CHECKPOINT_EVERY]
+        print(f"[STEP 2] Download wikitext ({start + 1}-{start + len(chunk)} di {len(todo)})")
+        with stage("wikitext"):
+            wikitexts = get_wikitexts(chunk)
+            rows = [parse_title(t, wikitexts.get(t, ""), position[t], total) for t in chunk]
+        kept = [row for row in rows if row]
+
+        print(f"\n[STEP 3] Risoluzione componenti e immagini per {len(kept)} Beyblades")
+        with stage("componenti"):
+            fill_images(kept)
+        entries = [{"title": t, "revid": info[t]["revid"], "row": row} for t, row in zip(chunk, rows)]
+        append_checkpoint(entries)
+        component_cache.save()
+        done.update((e["title"], e) for e in entries)
+
+    return {t: done[t]["row"] for t in titles if done[t]["row"]}
+
+def create_csv(incremental=False):
+    with stage("embeddedin"):
+        titles = get_beyblade_infobox_pages()
+        info = get_page_info(titles)
+    titles = [t for t in titles if t in info]
+    manifest = load_manifest()
+    old_rows = load_csv_rows()
+
+    if incremental and manifest and old_rows:
+        # Una pagina va riscaricata se è nuova, se la revisione è cambiata o se il CSV
+        # non contiene più la riga che il manifest si aspetta
+        changed = [t for t in titles if t not in manifest
+                   or manifest[t].get("revid") != info[t]["revid"]
+                   or (manifest[t].get("keep") and t not in old_rows)]
+        deleted = sorted(set(manifest) - set(titles))
+        print(f"[INCREMENTALE] {len(changed)} pagine nuove/modificate, {len(deleted)} rimosse")
+        for t in deleted: print(f"    ✘ Rimossa: {t}")
+        if not changed and not deleted:
+            print("\n[OK] Nessuna modifica: CSV invariato.")
+            return
+    else:
+        changed, deleted = titles, sorted(set(manifest) - set(titles))
+        old_rows = {}
+        # Il giro completo settimanale serve proprio ad aggiornare pagine e immagini delle componenti
+        component_cache.refresh()
+
+    new_rows = scrape_titles(changed, info)
+
+    # Il "touched" viene aggiornato solo per le pagine riscaricate, così una notte senza
+    # modifiche non produce differenze nel manifest
+    for t in deleted: manifest.pop(t, None)
+    for t in changed: manifest[t] = dict(info[t], keep=t in new_rows)
+
+    changed_set = set(changed)
+    def merged_rows():
+        for t in titles:
+            if t in new_rows: yield new_rows[t]
+            elif t not in changed_set and t in old_rows: yield old_rows[t]
+    count = write_csv(merged_rows())
+    save_manifest(manifest)
+    component_cache.save()
+    clear_checkpoint()
+    print(f"\n[OK] CSV generato con {count} Beyblades.")
+    print(f"[CACHE] Componenti: {component_cache.hits} hit, {component_cache.misses} miss")
+
+# =========================
+# BENCHMARK CON CASSETTA
+# =========================
+def print_stage_report():
+    print("\n[FASI]  fase          richieste        byte      tempo")
+    for name, s in STAGES.items():
+        print(f"        {name:<12} {s['requests']:>10} {s['bytes'] / 1e6:>9.2f} MB {s['seconds']:>8.2f}s")
+
+def isolated_run(mode, directory=CASSETTE_DIR):
+    """Giro completo (CSV + immagini) in una cartella temporanea, con la cassetta in `mode`.
+
+    Si parte da zero (niente CSV, manifest, cache componenti o immagini) così registrazione e
+    riproduzione fanno esattamente le stesse richieste e i file del repository non vengono toccati.
+    """
+    import resource
+    import shutil
+    import tempfile
+    global component_cache
+    directory = os.path.abspath(directory)
+    recorded = [n for n in os.listdir(directory) if n.endswith(".json")] if os.path.isdir(directory) else []
+    if mode == "riproduci" and not recorded:
+        print(f"Errore: nessuna cassetta in {directory}. Registrarla con --registra-cassetta.")
+        return
+    if mode == "registra":
+        # Una registrazione sostituisce la precedente: niente risposte orfane nel repository
+        for name in recorded:
+            stem = os.path.join(directory, name[:-len(".json")])
+            for path in (f"{stem}.json", f"{stem}.bin"):
+                if os.path.exists(path): os.remove(path)
+    transport.mode, transport.directory = mode, directory
+    transport.requests = transport.bytes = 0
+    STAGES.clear()
+    home, workdir = os.getcwd(), tempfile.mkdtemp(prefix="beyblade_bench_")
+    os.chdir(workdir)
+    component_cache = ComponentCache()
+    start = time.perf_counter()
+    try:
+        create_csv()
+        with stage("immagini"):
+            download_and_optimize_images()
+    finally:
+        wall = time.perf_counter() - start
+        os.chdir(home)
+        shutil.rmtree(workdir, ignore_errors=True)
+    # ru_maxrss è in KB su Linux; i worker del pool immagini sono contati a parte
+    peak_main = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    peak_workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print_stage_report()
+    print(f"        {'totale':<12} {transport.requests:>10} {transport.bytes / 1e6:>9.2f} MB {wall:>8.2f}s")
+    print(f"[MEMORIA] Picco RSS: {peak_main:.0f} MB processo principale, {peak_workers:.0f} MB worker")
+    print(f"[CASSETTA] {'Registrata in' if mode == 'registra' else 'Riprodotta da'} {directory} "
+          f"(immagini ridotte a {CASSETTE_IMG_SIZE}px: il tempo di elaborazione immagini è inferiore al reale)")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggiornamento database Beyblade X")
+    parser.add_argument("--incrementale", action="store_true",
+                        help="Riscarica solo le pagine nuove o con una revisione diversa da quella del manifest")
+    parser.add_argument("--migra-immagini", action="store_true",
+                        help="Converte le immagini esistenti nel formato BEY_IMG_FORMAT ed esce")
+    parser.add_argument("--salva-fixture", action="store_true",
+                        help="Salva il wikitext delle pagine candidate in fixtures/wikitext ed esce")
+    parser.add_argument("--sprite", action="store_true",
+                        help="Rigenera solo il foglio sprite delle componenti in static/ ed esce")
+    parser.add_argument("--registra-cassetta", action="store_true",
+                        help="Esegue un giro completo in una cartella temporanea registrando le risposte in BEY_CASSETTE_DIR")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Riproduce dalla cassetta un giro completo e riporta richieste, byte, tempi per fase e memoria")
+    args = parser.parse_args()
+
+    if args.registra_cassetta or args.benchmark:
+        isolated_run("registra" if args.registra_cassetta else "riproduci")
+        sys.exit(0)
+
+    if args.salva_fixture:
+        save_wikitext_fixtures()
+        sys.exit(0)
+    if args.migra_immagini:
+        migrate_images()
+        build_sprite_sheet()
+        sys.exit(0)
+    if args.sprite:
+        build_sprite_sheet()
+        sys.exit(0)
+
     print("=== OFFICINA BEYBLADE X - AGGIORNAMENTO AUTOMATICO ===")
     
     # 1. Crea/Aggiorna il file CSV
-    create_csv()
+    create_csv(incremental=args.incrementale)
     
-    # 2. Scarica le nuove immagini mancanti
+    # 2. Artefatto precompilato del catalogo per l'avvio dell'app, poi le nuove immagini mancanti
     if os.path.exists(CSV_FILE):
-        download_and_optimize_images()
+        if catalogo.write_catalog(CSV_FILE):
+            print(f"[OK] Catalogo precompilato in {catalogo.CATALOG_FILE}")
+        else:
+            print(f"[OK] {catalogo.CATALOG_FILE} già aggiornato")
+        with stage("immagini"):
+            download_and_optimize_images()
+            build_sprite_sheet()
     else:
         print(f"Errore critico: {CSV_FILE} non è stato generato!")
+    print_stage_report()
     
-    print("\n[✔] Lavoro notturno terminato con successo.")
\ No newline at end of file
+    print("\n[✔] Lavoro notturno terminato con successo.")
@@ -0,0 +1,257 @@
+import re
+import os
+import csv
+import sys
+import time
+import pickle
+import bisect
+import hashlib
+from collections import Counter
+
+# =========================
+# INDICE DI RICERCA DEL CATALOGO
+# =========================
+COMPONENT_FIELDS = ["blade", "over_blade", "metal_blade", "main_blade", "assist_blade", "lock_chip",
+                    "ratchet", "ratchet_integrated_blade", "ratchet_integrated_bit", "bit"]
+FIELD_WEIGHTS = {"name": 2.0, **{f: 1.0 for f in COMPONENT_FIELDS}}
+# Punteggio di una parola della ricerca: uguale a un token, prefisso di un token, simile (refusi)
+EXACT, PREFIX, FUZZY = 3.0, 2.0, 1.5
+MIN_SIMILARITY = 0.5   # coefficiente di Dice sui trigrammi
+
+WORD = re.compile(r"[A-Za-z0-9]+(?:-[A-Za-z0-9]+)*")
+# Spezza CamelCase e passaggi lettere/cifre: "DranBuster" -> Dran, Buster; "2-60HN" -> 2, 60, HN
+PART = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+HAS_DIGIT = re.compile(r"\d")
+
+def tokenize(text):
+    """Token di un testo: ogni parola intera, le sue parti CamelCase e la forma senza trattini."""
+    tokens = []
+    for word in WORD.findall(text or ""):
+        low = word.lower()
+        tokens.append(low)
+        if "-" in low: tokens.append(low.replace("-", ""))
+        parts = PART.findall(word)
+        if len(parts) > 1: tokens.extend(p.lower() for p in parts)
+    return tokens
+
+def query_words(text):
+    # Della ricerca si usano le parole intere: le parti CamelCase sono già nell'indice
+    return [w.lower() for w in WORD.findall(text or "")]
+
+def _trigrams(token):
+    padded = f"#{token}#"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SearchIndex:
+    """Indice invertito token -> {riga: peso del campo}, con vocabolario ordinato per i prefissi
+    e trigrammi per la ricerca approssimata. Solo strutture Python semplici (serializzabili)."""
+
+    def __init__(self, rows):
+        self.names = []
+        self.postings = {}
+        for doc, row in enumerate(rows):
+            self.names.append(row.get("name", ""))
+            for field, weight in FIELD_WEIGHTS.items():
+                value = row.get(field, "")
+                if not value or value == "n/a": continue
+                for tok in tokenize(value):
+                    docs = self.postings.setdefault(tok, {})
+                    if docs.get(doc, 0) < weight: docs[doc] = weight
+        self.vocab = sorted(self.postings)
+        self.grams = {}
+        for tok in self.vocab:
+            # Codici con cifre (ratchet "3-60", bit "1-60HN") solo esatti o per prefisso: a una
+            # cifra di distanza sono pezzi diversi, non refusi
+            if len(tok) < 3 or HAS_DIGIT.search(tok): continue
+            # Ordine fisso (non quello dei set, che dipende da PYTHONHASHSEED): l'artefatto
+            # serializzato resta identico byte per byte a parità di CSV
+            for g in sorted(_trigrams(tok)): self.grams.setdefault(g, []).append(tok)
+
+    def to_state(self):
+        return {"names": self.names, "postings": self.postings, "vocab": self.vocab, "grams": self.grams}
+
+    @classmethod
+    def from_state(cls, state):
+        index = cls.__new__(cls)
+        index.__dict__.update(state)
+        return index
+
+    def _matches(self, word):
+        """Token dell'indice che corrispondono a una parola, con il punteggio della corrispondenza."""
+        found = {}
+        i = bisect.bisect_left(self.vocab, word)
+        while i < len(self.vocab) and self.vocab[i].startswith(word):
+            tok = self.vocab[i]
+            found[tok] = EXACT if tok == word else PREFIX
+            i += 1
+        # Approssimata solo se la parola non compare già come token o prefisso
+        if not found and len(word) >= 4 and not HAS_DIGIT.search(word):
+            grams = _trigrams(word)
+            shared = Counter(tok for g in grams for tok in self.grams.get(g, ()))
+            for tok, n in shared.items():
+                # Con il padding "#tok#" un token ha len(tok) trigrammi (a meno di ripetizioni)
+                sim = 2 * n / (len(grams) + len(tok))
+                if sim >= MIN_SIMILARITY: found[tok] = FUZZY * sim
+        return found
+
+    def search(self, text, limit=None):
+        """Righe che contengono tutte le parole cercate, dalla più pertinente; lista di indici."""
+        words = query_words(text)
+        if not words: return []
+        scores = None
+        for word in words:
+            word_scores = {}
+            for tok, match in self._matches(word).items():
+                for doc, weight in self.postings[tok].items():
+                    s = match * weight
+                    if s > word_scores.get(doc, 0): word_scores[doc] = s
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {doc: s + word_scores[doc] for doc, s in scores.items() if doc in word_scores}
+            if not scores: return []
+        ranked = sorted(scores, key=lambda d: (-scores[d], self.names[d].lower()))
+        return ranked[:limit] if limit else ranked
+
+# =========================
+# ARTEFATTO PRECOMPILATO DEL CATALOGO
+# =========================
+CSV_FILE = "beyblade_x.csv"
+CATALOG_FILE = "catalogo.pkl"
+CATALOG_VERSION = 2   # 2: niente trigrammi per i token con cifre
+PICKLE_PROTOCOL = 4   # leggibile da tutte le versioni di Python supportate da Streamlit Cloud
+
+# (colonna del CSV, colonna dell'immagine, chiave dell'inventario)
+MAPPING = [("lock_chip", "lock_chip_image", "lock_chip"),
+           ("blade", "blade_image", "blade"),
+           ("over_blade", "over_blade_image", "over_blade"),
+           ("metal_blade", "metal_blade_image", "metal_blade"),
+           ("main_blade", "main_blade_image", "main_blade"),
+           ("assist_blade", "assist_blade_image", "assist_blade"),
+           ("ratchet_integrated_blade", "ratchet_integrated_blade_image", "r_i_blade"),
+           ("ratchet", "ratchet_image", "ratchet"),
+           ("bit", "bit_image", "bit"),
+           ("ratchet_integrated_bit", "ratchet_integrated_bit_image", "r_i_bit")]
+
+# Valori che pd.read_csv considera mancanti (e load_db trasformava in ""): l'artefatto li tratta allo stesso modo
+NA_VALUES = {"", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+             "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"}
+
+def _csv_digest(raw):
+    return hashlib.sha1(raw).hexdigest()
+
+def build_catalog(raw):
+    """Catalogo pronto per l'app a partire dai byte del CSV, solo con tipi Python di base:
+    colonne del DataFrame, mappa componente -> immagine, opzioni teoriche e indice di ricerca."""
+    reader = csv.DictReader(raw.decode("utf-8").splitlines())
+    rows = list(reader)
+    fields = reader.fieldnames or []
+    for row in rows:
+        for f in fields:
+            if row.get(f) is None or row[f] in NA_VALUES: row[f] = ""
+    columns = {f: [row[f] for row in rows] for f in fields}
+
+    theory_opts = {state_key: ["-"] for _, _, state_key in MAPPING}
+    for csv_col, _, state_key in MAPPING:
+        if csv_col in columns:
+            theory_opts[state_key] = ["-"] + sorted({x for x in columns[csv_col] if x and x != "n/a"})
+
+    img_map = {}
+    pairs = [(columns[c], columns[i]) for c, i, _ in MAPPING if c in columns and i in columns]
+    for r in range(len(rows)):
+        for vals, imgs in pairs:
+            val, img = vals[r], imgs[r]
+            if val and val != "n/a" and img and img != "n/a":
+                img_map[val] = img
+
+    return {"version": CATALOG_VERSION, "csv_sha1": _csv_digest(raw), "columns": columns,
+            "img_map": img_map, "theory_opts": theory_opts, "search_index": SearchIndex(rows).to_state()}
+
+def _artifact_matches(path, digest):
+    try:
+        with open(path, "rb") as f:
+            catalog = pickle.load(f)
+        return catalog.get("version") == CATALOG_VERSION and catalog.get("csv_sha1") == digest
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return False
+
+def write_catalog(csv_file=CSV_FILE, path=CATALOG_FILE):
+    """Rigenera l'artefatto dal CSV (scrittura su file temporaneo e rename).
+    Restituisce False senza toccare il file se è già aggiornato rispetto al CSV."""
+    with open(csv_file, "rb") as f:
+        raw = f.read()
+    if os.path.exists(path) and _artifact_matches(path, _csv_digest(raw)): return False
+    catalog = build_catalog(raw)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(catalog, f, protocol=PICKLE_PROTOCOL)
+    os.replace(tmp, path)
+    return True
+
+def load_catalog(csv_file=CSV_FILE, path=CATALOG_FILE):
+    """Catalogo dall'artefatto se corrisponde al CSV attuale, altrimenti ricostruito dal CSV.
+    Restituisce (catalogo, origine); None se il CSV non esiste."""
+    if not os.path.exists(csv_file): return None, None
+    with open(csv_file, "rb") as f:
+        raw = f.read()
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                catalog = pickle.load(f)
+            if catalog.get("version") == CATALOG_VERSION and catalog.get("csv_sha1") == _csv_digest(raw):
+                return catalog, path
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            print(f"Artefatto {path} illeggibile, si usa il CSV: {e}")
+    return build_catalog(raw), csv_file
+
+# =========================
+# MICRO-BENCHMARK
+# =========================
+def run_startup_benchmark(csv_file=CSV_FILE, repeat=20):
+    """Tempo di avvio del catalogo: vecchio percorso pandas (read_csv + iterrows), ricostruzione
+    dal CSV senza pandas e lettura dell'artefatto precompilato."""
+    import pandas as pd
+    def old_load_db():
+        df = pd.read_csv(csv_file).fillna("")
+        theory_opts = {k: ["-"] + sorted([x for x in df[c].unique().tolist() if x and x != "n/a"])
+                       for c, _, k in MAPPING if c in df.columns}
+        img_map = {}
+        for _, r in df.iterrows():
+            for c_col, i_col, _ in MAPPING:
+                if c_col in df.columns and i_col in df.columns:
+                    val, img = str(r[c_col]), str(r[i_col])
+                    if val and val != "n/a" and img and img != "n/a": img_map[val] = img
+        return df, img_map, theory_opts, SearchIndex(df.to_dict("records"))
+    def from_csv():
+        with open(csv_file, "rb") as f:
+            catalog = build_catalog(f.read())
+        return pd.DataFrame(catalog["columns"]), SearchIndex.from_state(catalog["search_index"])
+    def from_artifact():
+        catalog, _ = load_catalog(csv_file)
+        return pd.DataFrame(catalog["columns"]), SearchIndex.from_state(catalog["search_index"])
+    write_catalog(csv_file)
+    for label, fn in [("pandas + iterrows", old_load_db), ("CSV senza pandas", from_csv), ("artefatto", from_artifact)]:
+        start = time.perf_counter()
+        for _ in range(repeat): fn()
+        print(f"[AVVIO] {label:<18} {(time.perf_counter() - start) / repeat * 1000:7.1f} ms")
+
+def run_benchmark(csv_file=CSV_FILE, repeat=200):
+    with open(csv_file, "r", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    start = time.perf_counter()
+    index = SearchIndex(rows)
+    t_build = time.perf_counter() - start
+    print(f"[BENCH] {len(rows)} righe, {len(index.vocab)} token, indice costruito in {t_build * 1000:.1f} ms")
+    for q in ["dran", "dranbuster", "dranbustr", "3-70", "shark scale", "wizard rod 1-60", "png", "(+)"]:
+        start = time.perf_counter()
+        for _ in range(repeat): hits = index.search(q)
+        elapsed = (time.perf_counter() - start) / repeat
+        top = ", ".join(index.names[d] for d in hits[:3])
+        print(f"    {q!r:<20} {elapsed * 1e6:7.0f} µs  {len(hits):3d} risultati  {top}")
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if sys.argv[1:2] == ["avvio"]:
+        run_startup_benchmark(*sys.argv[2:3])
+    else:
+        run_benchmark(*sys.argv[1:2])
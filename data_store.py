@@ -0,0 +1,316 @@
+import os
+import json
+import copy
+import time
+import base64
+import atexit
+import threading
+
+# =========================
+# FILE JSON SU GITHUB (CONTENTS API)
+# =========================
+NO_BASE = object()   # versione di partenza delle modifiche locali sconosciuta
+
+def merge_json(base, local, remote):
+    """Fusione a tre vie: si tengono le modifiche di entrambe le parti rispetto a `base`.
+
+    I dizionari si fondono chiave per chiave; due liste che si sono solo allungate diventano
+    base + aggiunte remote + aggiunte locali. Negli altri conflitti vince la versione locale.
+    """
+    if local == remote or remote == base: return local
+    if local == base: return remote
+    if isinstance(local, dict) and isinstance(remote, dict):
+        base = base if isinstance(base, dict) else {}
+        merged = {}
+        for k in list(remote) + [k for k in local if k not in remote]:
+            if k in local and k in remote:
+                merged[k] = merge_json(base.get(k), local[k], remote[k])
+            elif k in local:
+                if k not in base or base[k] != local[k]: merged[k] = local[k]    # altrimenti cancellata sul remoto
+            elif k not in base or base[k] != remote[k]:
+                merged[k] = remote[k]                                             # altrimenti cancellata in locale
+        return merged
+    if isinstance(local, list) and isinstance(remote, list):
+        base = base if isinstance(base, list) else []
+        n = len(base)
+        if local[:n] == base and remote[:n] == base:
+            return remote + local[n:]
+    return local
+
+def encode_file(path, data):
+    # I file .jsonl sono liste di record, uno per riga; gli altri JSON indentato come sempre
+    if path.endswith(".jsonl"):
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in data)
+    return json.dumps(data, indent=4)
+
+def decode_file(path, text):
+    if path.endswith(".jsonl"):
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return json.loads(text)
+
+class GitHubFiles:
+    """Lettura e scrittura dei file JSON di un repository tramite le Contents API.
+
+    Per ogni file tiene in memoria (contenuto, sha, ETag): le letture sono condizionali
+    (304 senza corpo se il file non è cambiato) e lo sha restituito da ogni PUT serve alla
+    scrittura successiva senza una GET preliminare. Se nel frattempo il file è cambiato sul
+    repository (409/422) lo si rilegge e si fondono le modifiche con `merge_json`.
+    Le chiavi sono quelle di `files` oppure direttamente un percorso nel repository.
+    """
+
+    API_URL = "https://api.github.com"
+
+    def __init__(self, token, repo, files, max_attempts=3):
+        self.repo = repo
+        self.files = files
+        self.max_attempts = max_attempts
+        self.cache = {}
+        self.listings = {}
+        self.lock = threading.RLock()
+        import requests   # qui e non in testa: l'app importa questo modulo già nella schermata di login
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"token {token}", "Accept": "application/vnd.github.v3+json"})
+
+    def path(self, key):
+        return self.files.get(key, key)
+
+    def _url(self, key):
+        return f"{self.API_URL}/repos/{self.repo}/contents/{self.path(key)}"
+
+    def sha(self, key):
+        entry = self.cache.get(key)
+        return entry["sha"] if entry else None
+
+    def list(self, directory):
+        """{nome: sha} dei file in una cartella del repository, con richiesta condizionale."""
+        with self.lock:
+            etag, files = self.listings.get(directory, (None, {}))
+            r = self.session.get(self._url(directory), headers={"If-None-Match": etag} if etag else {}, timeout=20)
+            if r.status_code == 304: return files
+            if r.status_code == 404: return {}
+            r.raise_for_status()
+            files = {item["name"]: item["sha"] for item in r.json() if item.get("type") == "file"}
+            self.listings[directory] = (r.headers.get("ETag"), files)
+            return files
+
+    def read(self, key):
+        """Contenuto del file (None se non esiste). Solleva requests.RequestException sugli errori."""
+        with self.lock:
+            entry = self.cache.get(key)
+            headers = {"If-None-Match": entry["etag"]} if entry and entry["etag"] else {}
+            r = self.session.get(self._url(key), headers=headers, timeout=20)
+            if r.status_code == 304:
+                return entry["content"]
+            if r.status_code == 404:
+                entry = {"content": None, "sha": None, "etag": None}
+            else:
+                r.raise_for_status()
+                body = r.json()
+                raw = body.get("content", "")
+                if body.get("encoding") == "none":
+                    # Oltre 1 MB la Contents API non include il contenuto: lo si legge come blob
+                    blob = self.session.get(body["git_url"], timeout=60)
+                    blob.raise_for_status()
+                    raw = blob.json()["content"]
+                entry = {"content": decode_file(self.path(key), base64.b64decode(raw).decode("utf-8")),
+                         "sha": body["sha"], "etag": r.headers.get("ETag")}
+            self.cache[key] = entry
+            return entry["content"]
+
+    def write(self, key, data, base=NO_BASE):
+        """Scrive il file e restituisce il contenuto scritto (False se non riuscito).
+
+        In caso di conflitto rilegge, fonde e ritenta: il contenuto scritto può quindi includere
+        modifiche remote. `base` è la versione del file da cui partono le modifiche di `data`;
+        se il remoto noto è diverso (per esempio dopo un riavvio) le due versioni si fondono.
+        """
+        with self.lock:
+            if base is not NO_BASE:
+                if key not in self.cache: self.read(key)
+                remote = self.cache[key]["content"]
+                if remote != base: data = merge_json(base, data, remote)
+            for _ in range(self.max_attempts):
+                if key not in self.cache: self.read(key)
+                entry = self.cache[key]
+                payload = {
+                    "message": f"App Update {self.path(key)}",
+                    "content": base64.b64encode(encode_file(self.path(key), data).encode("utf-8")).decode("utf-8")
+                }
+                if entry["sha"]: payload["sha"] = entry["sha"]
+                r = self.session.put(self._url(key), json=payload, timeout=30)
+                if r.status_code in (200, 201):
+                    # L'ETag della nuova versione non è noto: la prossima lettura sarà completa
+                    self.cache[key] = {"content": data, "sha": r.json()["content"]["sha"], "etag": None}
+                    return data
+                if r.status_code not in (409, 422):
+                    r.raise_for_status()
+                    return False
+                print(f"Conflitto su {self.path(key)}: rilettura e fusione delle modifiche")
+                self.cache[key] = dict(entry, etag=None)
+                data = merge_json(entry["content"], data, self.read(key))
+            return False
+
+# =========================
+# ARCHIVIO LOCALE WRITE-THROUGH
+# =========================
+STORE_DIR = os.path.join(".cache", "store")
+FLUSH_DELAY = 10.0    # secondi di quiete prima di inviare le modifiche accumulate
+RETRY_DELAY = 60.0    # attesa prima di ritentare un invio fallito
+
+class DataStore:
+    """Copia locale dei file JSON dell'app, con invio al remoto differito e accorpato.
+
+    Letture e scritture lavorano in memoria; ogni scrittura aggiorna anche il journal su disco
+    (così le modifiche non ancora inviate sopravvivono a un riavvio) e fa ripartire un timer.
+    Allo scadere le modifiche accumulate partono con un solo `push` per file; `flush()` le
+    invia subito. `fetch(key)` e `push(key, data, base)` sono le operazioni sul remoto: `fetch`
+    restituisce False in caso di errore, `push` il contenuto effettivamente scritto (False se
+    l'invio non è riuscito). `base` è l'ultima versione remota nota su cui poggiano le modifiche
+    locali: viene salvata nel journal insieme ai dati, così anche dopo un riavvio l'invio fonde
+    le modifiche con quelle arrivate nel frattempo sul remoto. Se `push` ha fuso modifiche
+    remote, il risultato sostituisce la copia in memoria.
+    """
+
+    def __init__(self, fetch, push, files, directory=STORE_DIR, delay=FLUSH_DELAY):
+        self.fetch = fetch
+        self.push = push
+        self.files = files
+        self.directory = directory
+        self.delay = delay
+        self.data = {}
+        self.base = {}
+        self.versions = {}
+        self.dirty = set()
+        self.last_error = None
+        self.last_sync = None
+        self.timer = None
+        self.lock = threading.RLock()
+        self.flush_lock = threading.Lock()
+        self._load_journal()
+        atexit.register(self.flush)
+
+    # --- journal su disco ---
+    def _journal_path(self, key):
+        return os.path.join(self.directory, self.files.get(key, key).replace("/", "_"))
+
+    def _write_file(self, path, data):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _write_journal(self, key):
+        entry = {"data": self.data[key]}
+        if key in self.base: entry["base"] = self.base[key]
+        self._write_file(self._journal_path(key), entry)
+
+    def _write_pending(self):
+        self._write_file(os.path.join(self.directory, "pending.json"), sorted(self.dirty))
+
+    def _load_journal(self):
+        pending_path = os.path.join(self.directory, "pending.json")
+        if not os.path.exists(pending_path): return
+        try:
+            with open(pending_path, "r", encoding="utf-8") as f:
+                pending = json.load(f)
+            for key in pending:
+                with open(self._journal_path(key), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                if not (isinstance(entry, dict) and "data" in entry): entry = {"data": entry}   # journal senza base
+                self.data[key] = entry["data"]
+                if "base" in entry: self.base[key] = entry["base"]
+                self.versions[key] = 1
+                self.dirty.add(key)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Journal locale illeggibile, ignorato: {e}")
+            return
+        if self.dirty: self._schedule(0)
+
+    # --- letture e scritture ---
+    def get(self, key):
+        with self.lock:
+            if key not in self.data:
+                value = self.fetch(key)
+                if value is False: return False   # errore di rete: si riprova alla prossima lettura
+                self.data[key] = self.base[key] = value
+                self.versions[key] = self.versions.get(key, 0) + 1
+            # Copia: chi legge può modificare il risultato senza toccare l'archivio condiviso
+            return copy.deepcopy(self.data[key])
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = copy.deepcopy(value)
+            self.versions[key] = self.versions.get(key, 0) + 1
+            self.dirty.add(key)
+            self._write_journal(key)
+            self._write_pending()
+            self._schedule(self.delay)
+
+    def refresh(self, keys=None):
+        """Dimentica i file senza modifiche in sospeso (tutti o solo `keys`): verranno riletti dal remoto."""
+        with self.lock:
+            for key in [k for k in self.data if k not in self.dirty and (keys is None or k in keys)]:
+                del self.data[key]
+                self.base.pop(key, None)
+
+    def keys(self, prefix=""):
+        """Chiavi già in memoria che iniziano con `prefix`, comprese quelle non ancora inviate."""
+        with self.lock:
+            return [k for k in self.data if k.startswith(prefix)]
+
+    def version(self, key):
+        """Contatore che cambia a ogni nuovo contenuto in memoria per `key` (None se non caricata)."""
+        with self.lock:
+            return self.versions.get(key) if key in self.data else None
+
+    @property
+    def pending(self):
+        with self.lock:
+            return len(self.dirty)
+
+    # --- invio al remoto ---
+    def _schedule(self, delay):
+        if self.timer: self.timer.cancel()
+        self.timer = threading.Timer(delay, self.flush)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def flush(self):
+        """Invia subito tutte le modifiche in sospeso. Restituisce True se non ne resta nessuna."""
+        with self.flush_lock:
+            with self.lock:
+                if self.timer:
+                    self.timer.cancel()
+                    self.timer = None
+                todo = {k: (self.versions[k], self.data[k], self.base.get(k, NO_BASE)) for k in self.dirty}
+            failed = []
+            for key, (version, value, base) in todo.items():
+                # I valori in archivio non vengono mai modificati sul posto, quindi si possono
+                # inviare fuori dal lock mentre altre sessioni continuano a scrivere
+                written = self.push(key, value, base)
+                if written is False:
+                    failed.append(key)
+                    continue
+                with self.lock:
+                    self.base[key] = written
+                    if self.versions[key] == version:
+                        self.dirty.discard(key)
+                        if written == value: continue
+                        # Il remoto aveva modifiche di altri: in memoria va il contenuto fuso
+                        self.data[key] = written
+                    else:
+                        # Scritture locali arrivate durante l'invio, fatte sulla versione non fusa:
+                        # si riportano sul contenuto scritto e restano da inviare
+                        self.data[key] = merge_json(value, self.data[key], written)
+                        self._write_journal(key)
+                    self.versions[key] += 1
+            with self.lock:
+                if todo: self._write_pending()
+                if failed:
+                    self.last_error = f"Invio non riuscito: {', '.join(self.files.get(k, k) for k in failed)}"
+                    self._schedule(RETRY_DELAY)
+                else:
+                    if todo: self.last_sync = time.time()
+                    self.last_error = None
+                return not self.dirty
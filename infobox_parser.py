@@ -0,0 +1,316 @@
+import re
+import os
+import sys
+import csv
+import glob
+import json
+import time
+
+# =========================
+# PATTERN PRECOMPILATI
+# =========================
+INFOBOX_START = re.compile(r"\{\{\s*Beyblade Infobox", re.I)
+# Un intero parametro "|nome = valore" in un solo match: testo semplice, template annidati
+# fino a tre livelli e link (anche con un link nella didascalia). I cicli sono "srotolati"
+# (testo* (annidato testo*)*) così il tempo resta lineare anche su wikitext malformato.
+_T3 = r"\{\{ [^{}]* \}\}"
+_T2 = rf"\{{\{{ [^{{}}]* (?: {_T3} [^{{}}]* )* \}}\}}"
+_T1 = rf"\{{\{{ [^{{}}]* (?: {_T2} [^{{}}]* )* \}}\}}"
+_LINK = r"\[\[ [^\[\]]* (?: \[\[ [^\[\]]* \]\] [^\[\]]* )* \]\]"
+_SINGLE = r"\{(?!\{) | \}(?!\}) | \[(?!\[) | \](?!\])"
+PARAM = re.compile(rf"\| ( [^|{{}}\[\]]* (?: (?: {_T1} | {_LINK} | {_SINGLE} ) [^|{{}}\[\]]* )* )", re.X)
+PARAMS_START = re.compile(r"[^|{}]*")
+# Token per il percorso lento, usato solo quando l'annidamento supera quello previsto da PARAM
+TOKENS = re.compile(r"\{\{|\}\}|\[\[|\]\]|\||=")
+# Template, link (tenendo l'etichetta), note <ref> con il loro contenuto e tag HTML
+CLEAN_TOKENS = re.compile(r"\{\{|\}\}|\[\[(?:[^\[\]|]*\|)?|\]\]|<ref[^>]*/>|<ref[^>]*>.*?</ref>|<[^<>\n]*>", re.S | re.I)
+IMAGE_REF = re.compile(r"\|\s*image\s*=\s*([^\n|]+)|\[\[\s*File\s*:\s*([^\|\]]+)", re.I)
+PRODUCT_CODE = re.compile(r"\|\s*ProductCode\s*=\s*([^\n|]+)")
+SYSTEM = re.compile(r"\|\s*System\s*=\s*([^\n|]+)")
+CODE_PATTERNS = {"ProductCode": PRODUCT_CODE, "System": SYSTEM}
+LEGACY_TEMPLATE = re.compile(r"\{\{.*?\}\}", re.S)
+LEGACY_LINK = re.compile(r"\[\[([^|\]]*\|)?([^\]]+)\]\]")
+LEGACY_TAG = re.compile(r"<.*?>")
+# Sigle che in ProductCode/System identificano una pagina del sistema X
+X_SYSTEM_MARKERS = ["BX", "UX", "CX", "CUSTOM LINE", "BASIC LINE", "UNIQUE LINE"]
+
+# =========================
+# PARSER
+# =========================
+def _normalize(value):
+    value = value.strip()
+    if "\n" not in value: return value
+    return "\n".join(line.strip() for line in value.split("\n"))
+
+def _split_param(segment):
+    name, eq, value = segment.partition("=")
+    # Un "=" che sta dentro un template o un link annidato non separa nome e valore
+    if not eq or "{{" in name or "[[" in name: return _normalize(segment), ""
+    return _normalize(name), _normalize(value)
+
+def parse_infobox(wikitext, start=INFOBOX_START):
+    """Legge in una sola scansione i parametri di primo livello del template dell'infobox.
+
+    I `|` e gli `=` dentro template `{{...}}` o link `[[...]]` annidati non separano i
+    parametri; il template termina alla sua `}}` corrispondente.
+    """
+    if not wikitext: return {}
+    m = start.search(wikitext)
+    if not m: return {}
+    return _infobox_fields(wikitext, m)
+
+def _infobox_fields(wikitext, m, positions=None):
+    # `m`: il match dell'inizio del template. In `positions` (se c'è) la posizione del "|"
+    # dei parametri ProductCode e System, quando letti dal percorso veloce
+    fields = {}
+    pos = PARAMS_START.match(wikitext, m.end()).end()
+    while True:
+        p = PARAM.match(wikitext, pos)
+        if not p: break
+        name, value = _split_param(p.group(1))
+        fields[name] = value
+        if positions is not None and name in CODE_PATTERNS: positions.setdefault(name, p.start())
+        pos = p.end()
+    if wikitext.startswith("}}", pos):
+        return fields
+    return _parse_infobox_tokens(wikitext, m.end())
+
+def _parse_infobox_tokens(wikitext, begin):
+    fields = {}
+    depth = 1
+    seg_start, eq = None, None
+
+    def close(end):
+        if seg_start is None: return   # testo tra il nome del template e il primo "|"
+        if eq is None:
+            fields[_normalize(wikitext[seg_start:end])] = ""
+        else:
+            fields[_normalize(wikitext[seg_start:eq])] = _normalize(wikitext[eq + 1:end])
+
+    for tok in TOKENS.finditer(wikitext, begin):
+        t = tok.group()
+        if t == "{{" or t == "[[":
+            depth += 1
+        elif t == "}}" or t == "]]":
+            depth -= 1
+            if depth == 0:
+                close(tok.start())
+                return fields
+        elif depth == 1:
+            if t == "|":
+                close(tok.start())
+                seg_start, eq = tok.end(), None
+            elif eq is None:
+                eq = tok.start()
+    close(len(wikitext))   # template non chiuso: si tiene quanto letto
+    return fields
+
+def clean_value(val):
+    """Toglie template (anche annidati), note e tag, e riduce i link alla loro etichetta."""
+    if not val: return "n/a"
+    if "{" not in val and "[" not in val and "<" not in val:
+        val = val.strip()
+        return val if val else "n/a"
+    out = []
+    depth = 0
+    pos = 0
+    for tok in CLEAN_TOKENS.finditer(val):
+        if depth == 0: out.append(val[pos:tok.start()])
+        t = tok.group()
+        if t == "{{": depth += 1
+        elif t == "}}": depth = max(0, depth - 1)
+        pos = tok.end()
+    if depth == 0: out.append(val[pos:])
+    val = "".join(out).strip()
+    return val if val else "n/a"
+
+def clean_code(val):
+    """Pulizia di ProductCode e System identica a quella dello script originale.
+
+    I due valori servono solo a decidere se la pagina entra nel CSV: restano quelli di prima
+    (fino al primo `|`, anche dentro un link) così l'insieme delle righe non cambia.
+    """
+    if not val: return ""
+    if "{" not in val and "[" not in val and "<" not in val: return val.strip() or "n/a"
+    val = LEGACY_TAG.sub("", LEGACY_LINK.sub(r"\2", LEGACY_TEMPLATE.sub("", val)))
+    return val.strip() or "n/a"
+
+def is_x_system(p_code, system):
+    check_text = (p_code + " " + system).upper()
+    return any(k in check_text for k in X_SYSTEM_MARKERS)
+
+def find_image_filename(wikitext):
+    """Nome del file immagine di una pagina componente: il parametro `image`, altrimenti il primo [[File:...]]."""
+    if not wikitext: return None
+    first_file = None
+    for m in IMAGE_REF.finditer(wikitext):
+        if m.group(1): return m.group(1).strip()
+        if first_file is None: first_file = m.group(2).strip()
+    return first_file
+
+def parse_page(wikitext):
+    """Restituisce (campi dell'infobox, ProductCode, System) con una sola scansione della pagina.
+
+    ProductCode e System si leggono come faceva lo script originale (primo `|ProductCode=` della
+    pagina, anche fuori dall'infobox, fino a `|` o fine riga, con `clean_code`): decidono
+    KEEP/SKIP e non devono cambiare. Di solito sono parametri dell'infobox e la lettura dei
+    parametri ne dà già la posizione: basta verificare che il nome non compaia prima.
+    """
+    if not wikitext: return {}, "", ""
+    m = INFOBOX_START.search(wikitext)
+    positions = {}
+    fields = _infobox_fields(wikitext, m, positions) if m else {}
+    codes = []
+    for key, pattern in CODE_PATTERNS.items():
+        pos = positions.get(key)
+        # str.find non è una regex: sul testo prima del parametro costa pochissimo
+        found = pattern.match(wikitext, pos) if pos is not None and wikitext.find(key, 0, pos) == -1 else None
+        # Altrove nella pagina (niente infobox, annidato o prima dell'infobox): ricerca completa
+        if found is None: found = pattern.search(wikitext)
+        codes.append(clean_code(found.group(1)) if found else "")
+    return fields, codes[0], codes[1]
+
+# =========================
+# MICRO-BENCHMARK
+# =========================
+# Implementazioni precedenti, tenute qui solo come termine di confronto
+def _legacy_extract_infobox(wikitext):
+    if not wikitext: return {}
+    m = re.search(r"\{\{Beyblade Infobox(.*?)\n\}\}", wikitext, re.S | re.I)
+    if not m: return {}
+    block = m.group(1)
+    fields = {}
+    current = None
+    buf = []
+    for line in block.splitlines():
+        if line.strip().startswith("|"):
+            if current: fields[current] = "\n".join(buf).strip()
+            parts = line[1:].split("=", 1)
+            current = parts[0].strip()
+            buf = [parts[1].strip()] if len(parts) > 1 else []
+        else:
+            if current: buf.append(line.strip())
+    if current: fields[current] = "\n".join(buf).strip()
+    return fields
+
+def _legacy_clean_value(val):
+    if not val: return "n/a"
+    val = re.sub(r"\{\{.*?\}\}", "", val, flags=re.S)
+    val = re.sub(r"\[\[([^|\]]*\|)?([^\]]+)\]\]", r"\2", val)
+    val = re.sub(r"<.*?>", "", val)
+    return val.strip() if val.strip() else "n/a"
+
+def _legacy_page(wikitext, keys):
+    m = re.search(r"\|\s*ProductCode\s*=\s*([^\n|]+)", wikitext)
+    s = re.search(r"\|\s*System\s*=\s*([^\n|]+)", wikitext)
+    p_code = _legacy_clean_value(m.group(1)) if m else ""
+    system = _legacy_clean_value(s.group(1)) if s else ""
+    info = _legacy_extract_infobox(wikitext)
+    return is_x_system(p_code, system), p_code, system, [_legacy_clean_value(info.get(k)) for k in keys]
+
+def _new_page(wikitext, keys):
+    info, p_code, system = parse_page(wikitext)
+    return is_x_system(p_code, system), p_code, system, [clean_value(info.get(k)) for k in keys]
+
+def synthetic_corpus(csv_file="beyblade_x.csv"):
+    """Corpus di ripiego costruito dalle righe del CSV, quando non ci sono pagine reali.
+
+    Una pagina su due ha template annidati: un `{{Tabber}}` su più righe con `{{Img}}` dentro,
+    note `<ref>` con `{{Cite web|...}}` e `{{Nihongo|...}}` accanto ai link. Il parser precedente
+    chiude l'infobox al primo "\\n}}" e su queste pagine perde i campi successivi.
+    """
+    params = [("blade", "Blade"), ("over_blade", "OverBlade"), ("metal_blade", "MetalBlade"),
+              ("main_blade", "MainBlade"), ("assist_blade", "AssistBlade"), ("lock_chip", "LockChip"),
+              ("ratchet", "Ratchet"), ("ratchet_integrated_blade", "RatchetBlade"),
+              ("ratchet_integrated_bit", "RatchetBit"), ("bit", "Bit")]
+    cite = "<ref>{{Cite web|url=https://www.takaratomy.co.jp|title=Catalogo}}</ref>"
+    corpus = []
+    with open(csv_file, "r", encoding="utf-8") as f:
+        for idx, row in enumerate(csv.DictReader(f)):
+            name, nested = row["name"], idx % 2 == 1
+            if nested:
+                lines = ["{{Beyblade Infobox", f"|name = {name} {{{{Nihongo|{name}|ベイ}}}}",
+                         "|image = {{Tabber", f"|Box = {{{{Img|{name} box.png|[[Takara Tomy]]}}}}",
+                         f"|Toy = {name}.png", "}}",
+                         f"|ProductCode = BX-{idx:02d}{cite}",
+                         "|System = [[Beyblade X (System)|BX]]"]
+            else:
+                lines = ["{{Beyblade Infobox", f"|name = {name}", f"|image = {name}.png",
+                         f"|ProductCode = BX-{idx:02d}",
+                         "|System = [[Beyblade X (System)|BX]]"]
+            for col, key in params:
+                if row[col] == "n/a": continue
+                value = f"[[{col.replace('_', ' ').title()} - {row[col]}|{row[col]}]]"
+                if nested: value += f" {{{{Nihongo|{row[col]}|パーツ}}}}{cite}"
+                lines.append(f"|{key} = {value}")
+            lines += ["}}", f"'''{name}''' is a Beyblade released by [[Takara Tomy]].",
+                      "==Gallery==", "<gallery>", f"{name}.png", "</gallery>"]
+            corpus.append("\n".join(lines))
+    return corpus
+
+def cassette_corpus(directory=os.path.join("fixtures", "cassetta")):
+    """Wikitext delle pagine reali contenute nelle risposte API della cassetta (prop=revisions)."""
+    corpus = []
+    for meta_path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if (meta.get("params") or {}).get("prop") != "revisions": continue
+        with open(meta_path[:-len(".json")] + ".bin", "rb") as f:
+            body = json.loads(f.read())
+        for page in body.get("query", {}).get("pages", {}).values():
+            for rev in page.get("revisions", []):
+                corpus.append(rev.get("slots", {}).get("main", {}).get("*", ""))
+    return corpus
+
+def load_corpus(fixture_dir=os.path.join("fixtures", "wikitext"), cassette_dir=os.path.join("fixtures", "cassetta")):
+    """(pagine, descrizione): fixture salvate, altrimenti le pagine della cassetta, altrimenti sintetiche."""
+    files = sorted(glob.glob(os.path.join(fixture_dir, "*.wiki")))
+    if files:
+        corpus = []
+        for path in files:
+            with open(path, "r", encoding="utf-8") as f:
+                corpus.append(f.read())
+        return corpus, f"{len(corpus)} fixture in {fixture_dir}"
+    corpus = cassette_corpus(cassette_dir)
+    if corpus:
+        return corpus, f"{len(corpus)} pagine reali dalla cassetta in {cassette_dir}"
+    corpus = synthetic_corpus()
+    return corpus, f"{len(corpus)} pagine sintetiche da beyblade_x.csv (nessuna fixture né cassetta registrata)"
+
+def run_benchmark(fixture_dir=os.path.join("fixtures", "wikitext"), repeat=20):
+    corpus, source = load_corpus(fixture_dir)
+    keys = ["BladeX", "Blade", "MainBlade", "OverBlade", "MetalBlade", "AssistBlade", "LockChip",
+            "Lock Bit", "Ratchet", "RatchetBlade", "RatchetBit", "Bit", "PerformanceTip"]
+
+    def bench(fn, pages):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for text in pages: fn(text, keys)
+            best = min(best, time.perf_counter() - start)
+        return best / max(len(pages), 1) * 1e6
+
+    t_old, t_new = bench(_legacy_page, corpus), bench(_new_page, corpus)
+    # Confronto dell'intera tupla: decisione KEEP/SKIP, ProductCode, System e componenti
+    old, new = [_legacy_page(t, keys) for t in corpus], [_new_page(t, keys) for t in corpus]
+    same_pages = [t for t, o, n in zip(corpus, old, new) if o == n]
+    same = len(same_pages)
+    diff_keep = sum(o[0] != n[0] for o, n in zip(old, new))
+    diff_code = sum(o[1:3] != n[1:3] for o, n in zip(old, new))
+    diff_comp = [(o[3], n[3]) for o, n in zip(old, new) if o[0] and o[3] != n[3]]
+    print(f"[BENCH] Corpus: {source}")
+    print(f"    Parser precedente: {t_old:.1f} µs/pagina")
+    print(f"    Parser single-pass: {t_new:.1f} µs/pagina")
+    print(f"    Speedup: {t_old / t_new:.1f}x - risultato identico su {same}/{len(corpus)} pagine")
+    if 0 < same < len(corpus):
+        # Dove il parser precedente perde campi fa anche meno lavoro: il confronto equo è sulle pagine uguali
+        s_old, s_new = bench(_legacy_page, same_pages), bench(_new_page, same_pages)
+        print(f"    Sulle pagine con risultato identico: {s_old:.1f} -> {s_new:.1f} µs/pagina ({s_old / s_new:.1f}x)")
+    print(f"    Differenze: KEEP/SKIP {diff_keep}, ProductCode/System {diff_code}, componenti {len(diff_comp)} pagine tenute")
+    for o, n in diff_comp[:5]:
+        changed = [(k, a, b) for k, a, b in zip(keys, o, n) if a != b]
+        print("      " + "; ".join(f"{k}: {a!r} -> {b!r}" for k, a, b in changed))
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    run_benchmark(*sys.argv[1:2])
@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import glob
+import time
+import random
+import bisect
+import argparse
+import threading
+from datetime import datetime, timedelta
+import hashlib
+import pandas as pd
+
+# =========================
+# REGISTRO MATCH A SHARD MENSILI (JSON LINES)
+# =========================
+# Un file per mese, un match per riga: salvare un match tocca solo lo shard del mese
+# corrente, quindi tempo e dimensione dell'invio non crescono con lo storico.
+SHARD_DIR = "match_log"
+LEGACY_FILE = "match_stats.json"
+DATE_FORMATS = ("%d/%m/%Y", "%Y-%m-%d %H:%M:%S")
+COLUMNS = ["Data", "NomeGiocatore1", "BeyG1", "NomeGiocatore2", "BeyG2", "PunteggioBeyG1", "PunteggioBeyG2"]
+
+def parse_date(d_str):
+    """Data di un record nei due formati usati dall'archivio; None se non leggibile."""
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(d_str, fmt).date()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def shard_path(day, directory=SHARD_DIR):
+    # Percorso nel repository (sempre con "/"), usato anche come chiave per GitHub
+    # Anno a quattro cifre anche per datetime.min: strftime("%Y") non lo riempie di zeri su Linux
+    return f"{directory}/{day.year:04d}-{day.month:02d}.jsonl"
+
+def shard_for(record, directory=SHARD_DIR):
+    # I record senza data valida finiscono nel primo shard, come datetime.min nei filtri
+    return shard_path(parse_date(record.get("Data", "")) or datetime.min.date(), directory)
+
+def dumps(records):
+    return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+
+def iter_lines(lines):
+    for line in lines:
+        line = line.strip()
+        if line: yield json.loads(line)
+
+def loads(text):
+    return list(iter_lines(text.splitlines()))
+
+def iter_log(directory=SHARD_DIR):
+    """Legge i match dagli shard locali uno alla volta, in ordine cronologico di shard."""
+    for path in sorted(glob.glob(os.path.join(directory, "*.jsonl"))):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from iter_lines(f)
+
+def append(records, directory=SHARD_DIR):
+    """Aggiunge i record in coda agli shard locali del loro mese."""
+    by_shard = {}
+    for r in records: by_shard.setdefault(shard_for(r, directory), []).append(r)
+    os.makedirs(directory, exist_ok=True)
+    for path, rows in by_shard.items():
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(dumps(rows))
+    return sorted(by_shard)
+
+def migrate(src=LEGACY_FILE, directory=SHARD_DIR):
+    """Conversione una tantum dell'array di match_stats.json negli shard mensili."""
+    if glob.glob(os.path.join(directory, "*.jsonl")):
+        print(f"Errore: {directory}/ contiene già degli shard, migrazione annullata.")
+        return False
+    with open(src, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    shards = append(records, directory)
+    print(f"[OK] {len(records)} match migrati in {len(shards)} shard: {', '.join(os.path.basename(s) for s in shards)}")
+    return True
+
+# =========================
+# STORICO TIPIZZATO (DATAFRAME)
+# =========================
+def to_frame(records):
+    """DataFrame tipizzato dei match: colonne originali più "Giorno" (datetime64, NaT se la data
+    non è leggibile), giocatori e bey categorici e punteggi int8. Tutto vettoriale, senza cicli."""
+    df = pd.DataFrame.from_records(records)
+    df = df.reindex(columns=COLUMNS + [c for c in df.columns if c not in COLUMNS])
+    raw = df["Data"].astype("string")
+    giorno = pd.to_datetime(raw, format=DATE_FORMATS[0], errors="coerce")
+    giorno = giorno.fillna(pd.to_datetime(raw, format=DATE_FORMATS[1], errors="coerce").dt.normalize())
+    df["Giorno"] = giorno.astype("datetime64[ns]")
+    for col in ("NomeGiocatore1", "NomeGiocatore2", "BeyG1", "BeyG2"):
+        df[col] = df[col].astype("category")
+    for col in ("PunteggioBeyG1", "PunteggioBeyG2"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype("int8")
+    return df
+
+def frame_version(df):
+    """Impronta del contenuto dello storico: cambia se cambia anche un solo match."""
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+# =========================
+# EXPORT EXCEL IN STREAMING
+# =========================
+EXPORT_PLAYERS = ["Antonio", "Andrea", "Fabio"]
+
+def _write_sheet(workbook, name, df, header_fmt, autofilter=True):
+    # Con constant_memory le righe vanno scritte in ordine: ognuna viene scaricata su disco
+    # appena si passa alla successiva, quindi in memoria ne resta una sola
+    ws = workbook.add_worksheet(name)
+    ws.write_row(0, 0, list(df.columns), header_fmt)
+    values = df.astype(object)
+    for i, row in enumerate(values.where(df.notna(), None).itertuples(index=False, name=None), 1):
+        ws.write_row(i, 0, row)
+    if autofilter: ws.autofilter(0, 0, len(df), len(df.columns) - 1)
+
+def export_excel(df_history, path):
+    """Scrive su `path` il file Excel dello storico (match, punteggi per bey, un foglio per giocatore).
+
+    Il file viene prima scritto accanto con un nome temporaneo e poi rinominato, così chi lo
+    trova su disco lo trova sempre completo.
+    """
+    import xlsxwriter   # serve solo qui: l'app non lo carica finché nessuno chiede un export
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    sides = [df_history[[bey, score]].set_axis(["Bey", "Score"], axis=1)
+             for bey, score in (("BeyG1", "PunteggioBeyG1"), ("BeyG2", "PunteggioBeyG2"))]
+    df_concat = pd.concat(sides)
+    df_concat["Score"] = df_concat["Score"].astype("int64")   # int8 basta per il singolo match, non per le somme
+    df_scores = df_concat.groupby("Bey", observed=True)["Score"].sum().reset_index().sort_values(by="Score", ascending=False)
+
+    tmp = f"{path}.tmp"
+    workbook = xlsxwriter.Workbook(tmp, {"constant_memory": True})
+    header_fmt = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+    _write_sheet(workbook, "match history", df_history, header_fmt)
+    _write_sheet(workbook, "Punteggi Beyblade", df_scores, header_fmt, autofilter=False)
+    for u in EXPORT_PLAYERS:
+        df_u = df_history[(df_history["NomeGiocatore1"] == u) | (df_history["NomeGiocatore2"] == u)]
+        _write_sheet(workbook, u, df_u, header_fmt, autofilter=not df_u.empty)
+    workbook.close()
+    os.replace(tmp, path)
+    return path
+
+def synthetic_records(n, seed=0):
+    """Match casuali con la stessa forma di quelli reali, per il benchmark."""
+    rng = random.Random(seed)
+    players = ["Antonio", "Andrea", "Fabio"]
+    beys = [f"Bey {i} {rng.choice(['1-60', '3-60', '4-80'])} {rng.choice(['Rush', 'Flat', 'Ball'])}" for i in range(300)]
+    first = datetime(2025, 1, 1)
+    records = []
+    for i in range(n):
+        day = first + timedelta(days=rng.randrange(700))
+        # Un record su cinque nel vecchio formato con l'ora, come nell'archivio storico
+        data = day.strftime("%Y-%m-%d %H:%M:%S") if i % 5 == 0 else day.strftime("%d/%m/%Y")
+        pts = rng.randint(1, 3)
+        g1_wins = rng.random() < 0.5
+        p1, p2 = rng.sample(players, 2)
+        records.append({"Data": data, "NomeGiocatore1": p1, "BeyG1": rng.choice(beys),
+                        "NomeGiocatore2": p2, "BeyG2": rng.choice(beys),
+                        "PunteggioBeyG1": pts if g1_wins else -pts, "PunteggioBeyG2": -pts if g1_wins else pts})
+    return records
+
+def run_benchmark(n=100_000, repeat=5):
+    records = synthetic_records(n)
+    start_d, end_d, player = datetime(2025, 6, 1).date(), datetime(2025, 9, 30).date(), "Andrea"
+
+    def best(fn):
+        times = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            out = fn()
+            times.append(time.perf_counter() - t)
+        return min(times), out
+
+    def legacy_filter():
+        # Il ciclo per riga con doppio strptime usato prima da export e classifica
+        out = []
+        for r in records:
+            day = parse_date(r.get("Data", "")) or datetime.min.date()
+            if start_d <= day <= end_d and player in (r["NomeGiocatore1"], r["NomeGiocatore2"]):
+                out.append(r)
+        return out
+
+    t_load, df = best(lambda: to_frame(records))
+    lo, hi = pd.Timestamp(start_d), pd.Timestamp(end_d)
+    t_mask, sel = best(lambda: df[(df["Giorno"] >= lo) & (df["Giorno"] <= hi)
+                                  & ((df["NomeGiocatore1"] == player) | (df["NomeGiocatore2"] == player))])
+    t_legacy, legacy = best(legacy_filter)
+    print(f"[BENCH] {n} match sintetici ({df.memory_usage(deep=True).sum() / 1e6:.1f} MB tipizzati)")
+    print(f"    Caricamento tipizzato: {t_load * 1000:.0f} ms (una volta, poi in cache)")
+    print(f"    Filtro vettoriale: {t_mask * 1000:.1f} ms - {len(sel)} match")
+    print(f"    Filtro per riga (precedente): {t_legacy * 1000:.0f} ms - {len(legacy)} match")
+
+# =========================
+# AGGREGATI PER LA CLASSIFICA
+# =========================
+def _score(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+class Leaderboard:
+    """Aggregati materializzati per (giorno, giocatore, bey): partite, vittorie, somma dei punti
+    e somma dei punti nelle vittorie.
+
+    `add` li aggiorna con i soli match nuovi; `query` risponde a un intervallo di date sommando
+    i bucket dei giorni compresi, senza rileggere i singoli match.
+    """
+
+    def __init__(self, records=()):
+        self.days = {}         # giorno -> {(giocatore, bey): [partite, vittorie, punti, punti_vittorie]}
+        self.sorted_days = []
+        self.lock = threading.Lock()
+        self.add(records)
+
+    def add(self, records):
+        with self.lock:
+            for r in records:
+                day = parse_date(r.get("Data", "")) or datetime.min.date()
+                buckets = self.days.get(day)
+                if buckets is None:
+                    buckets = self.days[day] = {}
+                    bisect.insort(self.sorted_days, day)
+                s1, s2 = _score(r.get("PunteggioBeyG1")), _score(r.get("PunteggioBeyG2"))
+                for player, bey, score, won in ((r.get("NomeGiocatore1"), r.get("BeyG1"), s1, s1 > s2),
+                                                (r.get("NomeGiocatore2"), r.get("BeyG2"), s2, s2 > s1)):
+                    b = buckets.setdefault((player, bey), [0, 0, 0.0, 0.0])
+                    b[0] += 1
+                    b[1] += won
+                    b[2] += score
+                    if won: b[3] += score
+
+    def query(self, start, end, player=None, totals=None):
+        """Totali per bey tra `start` ed `end` compresi, eventualmente per un solo giocatore.
+
+        Con `totals` si accumula su un dizionario esistente (per sommare più shard).
+        """
+        totals = {} if totals is None else totals
+        with self.lock:
+            lo = bisect.bisect_left(self.sorted_days, start)
+            hi = bisect.bisect_right(self.sorted_days, end)
+            for day in self.sorted_days[lo:hi]:
+                for (p, bey), b in self.days[day].items():
+                    if bey == "-" or (player and p != player): continue
+                    t = totals.setdefault(bey, [0, 0, 0.0, 0.0])
+                    for i in range(4): t[i] += b[i]
+        return totals
+
+def shard_month(path):
+    """Primo giorno del mese di uno shard, dal nome del file; None se il nome non è nel formato atteso."""
+    try:
+        return datetime.strptime(os.path.basename(path), "%Y-%m.jsonl").date()
+    except ValueError:
+        return None
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Registro match a shard mensili")
+    parser.add_argument("comando", choices=["migra", "benchmark"],
+                        help="migra: converte match_stats.json in match_log/*.jsonl; "
+                             "benchmark: caricamento e filtro su 100k match sintetici")
+    args = parser.parse_args()
+    if args.comando == "migra":
+        sys.exit(0 if migrate() else 1)
+    run_benchmark()
@@ -0,0 +1,120 @@
+import io
+import numpy as np
+import pandas as pd
+
+# =========================
+# LETTURA DI META.CSV
+# =========================
+META_FILE = "meta.csv"
+COMBO_COLUMNS = ["Lock Chip", "Over Blade", "Main/Metal Blade (CX) / Blade (UX/BX)",
+                 "Assist Blade", "Ratchet", "Bit"]
+# Frecce UTF-8 lette come cp1252 da chi ha salvato il file (con il loro selettore di variante)
+MOJIBAKE = [("â¬†ï¸\x8f", "⬆️"), ("â¬‡ï¸\x8f", "⬇️"), ("â¬†ï¸", "⬆️"), ("â¬‡ï¸", "⬇️"),
+            ("â¬†", "⬆️"), ("â¬‡", "⬇️"), ("â€”", "—")]
+
+def read_meta(path=META_FILE):
+    """meta.csv già ripulito: codifica, frecce, colonne tipizzate e stringa "Combo" pronta."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = raw.decode("latin-1")
+    for bad, good in MOJIBAKE:
+        text = text.replace(bad, good)
+    df = pd.read_csv(io.StringIO(text))
+    df = df.loc[:, [c for c in df.columns if not c.startswith("Unnamed")]]
+
+    cols = [c for c in COMBO_COLUMNS if c in df.columns]
+    for c in cols:
+        df[c] = df[c].astype("string").str.strip().replace("", pd.NA)
+    if cols:
+        combo = df[cols[0]].fillna("")
+        for c in cols[1:]:
+            combo = combo.str.cat(df[c].fillna(""), sep=" ")
+        df.insert(0, "Combo", combo.str.split().str.join(" ").astype("string"))
+    else:
+        df.insert(0, "Combo", pd.Series("", index=df.index, dtype="string"))
+
+    for c in df.columns:
+        if c in ("Points", "Combo Rank") or c.endswith(" Points") or c.endswith(" Rank") or "Sample Size" in c:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    if "Rank Change" in df.columns:
+        df["Rank Change"] = df["Rank Change"].astype("string").fillna("-")
+    return df
+
+# =========================
+# COMBO DEL META COME MATRICE DI PEZZI
+# =========================
+LOCK_CHIP_COLUMN = "Lock Chip"
+METAL_LOCK_CHIPS = {"emperor", "valkyrie"}
+# Il meta indica il lock chip per materiale: diventano due pseudo-pezzi
+LOCK_CLASSES = {"Metal": "#metal", "Plastic": "#plastic"}
+
+def normalizza_nome(nome):
+    # Spazi e maiuscole non contano: "Low Orb" nell'inventario è "LowOrb" nel meta
+    return str(nome).replace(" ", "").lower()
+
+def owned_parts(inv):
+    """Chiavi dei pezzi posseduti (quantità > 0), compresi i pseudo-pezzi Metal/Plastic."""
+    owned = set()
+    for cat, items in inv.items():
+        for nome, qta in items.items():
+            if qta <= 0: continue
+            nome_norm = normalizza_nome(nome)
+            owned.add(nome_norm)
+            if cat == "lock_chip":
+                owned.add(LOCK_CLASSES["Metal"] if nome_norm in METAL_LOCK_CHIPS else LOCK_CLASSES["Plastic"])
+    return owned
+
+class ComboMatrix:
+    """Ogni pezzo del meta ha un indice; ogni combo è una riga booleana (combo x pezzi).
+
+    Un inventario si codifica come vettore sugli stessi indici e il confronto con tutte le
+    combo è un'unica operazione numpy: per ogni combo il numero di pezzi che mancano.
+    """
+
+    def __init__(self, combos):
+        # combos: per ogni riga del meta, lista di (colonna, valore) dei pezzi richiesti
+        self.part_ids = {}
+        self.labels = []
+        rows = []
+        for parts in combos:
+            ids = []
+            for col, value in parts:
+                key = LOCK_CLASSES.get(value, normalizza_nome(value)) if col == LOCK_CHIP_COLUMN else normalizza_nome(value)
+                if key not in self.part_ids:
+                    self.part_ids[key] = len(self.labels)
+                    self.labels.append(f"{value} (Lock Chip)" if key in LOCK_CLASSES.values() else value)
+                ids.append(self.part_ids[key])
+            rows.append(ids)
+        self.matrix = np.zeros((len(rows), len(self.labels)), dtype=bool)
+        for i, ids in enumerate(rows):
+            self.matrix[i, ids] = True
+
+    @classmethod
+    def from_frame(cls, df):
+        cols = [c for c in COMBO_COLUMNS if c in df.columns]
+        combos = []
+        for values in df[cols].itertuples(index=False):
+            combos.append([(c, str(v).strip()) for c, v in zip(cols, values)
+                           if isinstance(v, str) and v.strip()])
+        return cls(combos)
+
+    def encode(self, inv):
+        """Vettore booleano dei pezzi del meta presenti nell'inventario."""
+        vec = np.zeros(len(self.labels), dtype=bool)
+        ids = [self.part_ids[k] for k in owned_parts(inv) if k in self.part_ids]
+        vec[ids] = True
+        return vec
+
+    def missing(self, owned):
+        """Per ogni combo quanti pezzi mancano all'inventario codificato `owned`."""
+        return (self.matrix & ~owned).sum(axis=1)
+
+    def missing_part(self, owned):
+        """Per ogni combo il nome del primo pezzo mancante ("" se non ne manca nessuno)."""
+        gaps = self.matrix & ~owned
+        if not self.labels: return np.full(len(gaps), "", dtype=object)
+        first = gaps.argmax(axis=1)
+        return np.where(gaps.any(axis=1), np.array(self.labels, dtype=object)[first], "")
@@ -1,16 +1,15 @@
 import streamlit as st
-import pandas as pd
 import hashlib
 import os
 import json
-import requests
-import base64
 import time
-import re
-import io
+import base64
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from PIL import Image
-import google.generativeai as genai
+from data_store import NO_BASE, DataStore, GitHubFiles
+import catalogo
+from thumbnails import ThumbnailCache
 
 # =========================
 # CONFIGURAZIONE & STILE
@@ -60,6 +59,8 @@ def inject_css():
         }
         .slot-summary-name { font-weight: bold; color: #f1f5f9; text-transform: uppercase; }
         .slot-summary-alert { color: #fbbf24; font-weight: bold; margin-left: 8px; font-size: 0.85rem; }
+        .sprite-row { display: flex; flex-wrap: wrap; justify-content: center; gap: 8px; width: 100%; }
+        .sprite-cell { width: 80px; height: 80px; background-repeat: no-repeat; }
         .ai-response-area { 
             background-color: #1e293b; border: 1px solid #60a5fa; 
             padding: 25px; border-radius: 12px; color: #f1f5f9;
@@ -84,35 +85,110 @@ inject_css()
 # =========================
 GITHUB_TOKEN = st.secrets["github_token"]
 REPO = st.secrets["github_repo"]
-FILES = {"inv": "inventario.json", "decks": "decks.json", "stats": "match_stats.json"}
+FILES = {"inv": "inventario.json", "decks": "decks.json"}
 
-def github_action(file_key, data=None, method="GET"):
-    ts = int(time.time())
-    url = f"https://api.github.com/repos/{REPO}/contents/{FILES[file_key]}"
-    headers = {"Authorization": f"token {GITHUB_TOKEN}", "Accept": "application/vnd.github.v3+json"}
+@st.cache_resource
+def get_github():
+    # Contenuto, sha ed ETag di ogni file restano in memoria tra un rerun e l'altro
+    return GitHubFiles(GITHUB_TOKEN, REPO, FILES)
+
+def github_action(file_key, data=None, method="GET", base=NO_BASE):
     try:
-        r_get = requests.get(f"{url}?t={ts}", headers=headers)
-        sha = r_get.json().get("sha") if r_get.status_code == 200 else None
-        
         if method == "GET":
-            if r_get.status_code == 200:
-                return json.loads(base64.b64decode(r_get.json()["content"]).decode('utf-8'))
-            return [] if file_key == "stats" else None
+            content = github.read(file_key)
+            if content is None: return [] if file_key.endswith(".jsonl") else None
+            return content
         elif method == "PUT":
-            payload = {
-                "message": f"App Update {FILES[file_key]}", 
-                "content": base64.b64encode(json.dumps(data, indent=4).encode('utf-8')).decode('utf-8'), 
-                "sha": sha
-            }
-            return requests.put(url, headers=headers, json=payload).status_code in [200, 201]
+            return github.write(file_key, data, base)
     except Exception as e:
         print(f"Errore API GitHub: {e}")
         return False
     return False
 
+@st.cache_resource
+def get_store():
+    # Un solo archivio per processo, condiviso da tutte le sessioni: i click scrivono in locale
+    # e le modifiche partono verso GitHub accorpate, dopo qualche secondo di quiete
+    return DataStore(lambda key: github_action(key, method="GET"),
+                     lambda key, data, base: github_action(key, data, "PUT", base), FILES)
+
+@st.cache_data(ttl=600, show_spinner=False)
+def remote_shards():
+    # La cartella sul repository si rilegge al massimo ogni 10 minuti o con "Sincronizza",
+    # non a ogni rerun; gli errori non vengono messi in cache
+    shards = {f"{match_log.SHARD_DIR}/{name}": sha for name, sha in github.list(match_log.SHARD_DIR).items()
+              if name.endswith(".jsonl")}
+    # Uno shard cambiato sul repository (sha diverso da quello letto) va riletto
+    store.refresh([path for path, sha in shards.items() if github.sha(path) not in (None, sha)])
+    return sorted(shards)
+
+def match_shards():
+    """Percorsi degli shard mensili del registro match, remoti e non ancora inviati."""
+    try:
+        remote = remote_shards()
+    except Exception as e:
+        print(f"Errore API GitHub: {e}")
+        remote = []
+    return sorted(set(remote) | set(store.keys(match_log.SHARD_DIR + "/")))
+
+def iter_matches():
+    """Tutti i match registrati, letti uno shard mensile alla volta."""
+    for path in match_shards():
+        yield from store.get(path) or []
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_match_history():
+    # Svuotata a ogni salvataggio; il TTL copre i match registrati da altre istanze dell'app
+    df = match_log.to_frame(list(iter_matches()))
+    return df, match_log.frame_version(df)
+
+EXPORT_DIR = os.path.join(".cache", "export")
+EXPORT_KEEP = 20   # file Excel tenuti su disco
+
+@st.cache_resource
+def get_export_jobs():
+    # Un solo worker: gli export girano in sequenza, fuori dal thread dello script
+    return ThreadPoolExecutor(max_workers=1), {}
+
+def start_export(df_history, start_date, version):
+    """Percorso del file Excel per (data di inizio, versione dell'archivio), avviandone la
+    generazione in background se non è già su disco. Restituisce (percorso, job o None)."""
+    key = hashlib.sha1(f"{start_date.isoformat()}|{version}".encode()).hexdigest()[:16]
+    path = os.path.join(EXPORT_DIR, f"{key}.xlsx")
+    if os.path.exists(path): return path, None
+    pool, jobs = get_export_jobs()
+    job = jobs.get(key)
+    # Un job terminato senza file su disco è fallito oppure il suo file è stato eliminato: si rifà
+    if job is None or job.done():
+        old = sorted((os.path.join(EXPORT_DIR, f) for f in os.listdir(EXPORT_DIR) if f.endswith(".xlsx")),
+                     key=os.path.getmtime) if os.path.isdir(EXPORT_DIR) else []
+        for f in old[:-EXPORT_KEEP]: os.remove(f)
+        # I job riusciti non servono più (fa fede il file): il dizionario non cresce senza limite
+        for k in [k for k, j in jobs.items() if j.done() and not j.exception()]: del jobs[k]
+        job = jobs[key] = pool.submit(match_log.export_excel, df_history, path)
+    return path, job
+
+@st.cache_resource
+def get_leaderboards():
+    # shard -> (versione del contenuto in archivio, aggregati della classifica)
+    return {}
+
+def shard_leaderboard(path):
+    """Aggregati di uno shard, ricalcolati solo se il suo contenuto nell'archivio è cambiato."""
+    boards = get_leaderboards()
+    cached = boards.get(path)
+    if cached is None or cached[0] != store.version(path):
+        records = store.get(path) or []
+        cached = boards[path] = (store.version(path), match_log.Leaderboard(records))
+    return cached[1]
+
+def bump_data_version():
+    # Cambia a ogni modifica di inventario o Beyblade nella sessione: fa da chiave alle cache derivate
+    st.session_state.data_version = st.session_state.get("data_version", 0) + 1
+
 def force_load():
-    inv_c = github_action("inv", method="GET")
-    deck_c = github_action("decks", method="GET")
+    inv_c = store.get("inv")
+    deck_c = store.get("decks")
     new_users = {}
     
     req_keys = ["lock_chip", "blade", "over_blade", "metal_blade", "main_blade", "assist_blade", "r_i_blade", "ratchet", "bit", "r_i_bit"]
@@ -157,16 +233,15 @@ def force_load():
             "decks": decks_obj
         }
     st.session_state.users = new_users
+    bump_data_version()
 
 def save_cloud():
     inv_data = {u: d["inv"] for u, d in st.session_state.users.items()}
     deck_data = {u: d["decks"] for u, d in st.session_state.users.items()}
-    if github_action("inv", inv_data, "PUT") and github_action("decks", deck_data, "PUT"):
-        st.toast("✅ Dati salvati!", icon="💾")
-    else: st.error("❌ Errore sincronizzazione")
-
-if 'users' not in st.session_state:
-    force_load()
+    store.put("inv", inv_data)
+    store.put("decks", deck_data)
+    bump_data_version()
+    st.toast("✅ Dati salvati!", icon="💾")
 
 # =========================
 # LOGIN PERSISTENTE
@@ -176,7 +251,6 @@ url_user = st.query_params.get("user")
 
 if url_user in valid_users and 'user_sel' not in st.session_state:
     st.session_state.user_sel = url_user
-    force_load()
 
 if 'user_sel' not in st.session_state:
     @st.dialog("Accesso Officina")
@@ -186,54 +260,127 @@ if 'user_sel' not in st.session_state:
             if st.button(u, use_container_width=True):
                 st.session_state.user_sel = u
                 st.query_params["user"] = u 
-                force_load(); st.rerun()
+                st.rerun()
     user_dialog(); st.stop()
 
+# Client GitHub e archivio (con requests) solo dopo il login; i dati si caricano qui una volta
+github = get_github()
+store = get_store()
+if 'users' not in st.session_state:
+    force_load()
+
+# Moduli pesanti (pandas, numpy) importati solo dopo il login: la finestra di accesso non li usa
+import pandas as pd
+import match_log
+import meta
+
 # =========================
 # DATABASE E CACHE
 # =========================
 @st.cache_data
 def load_db():
-    if not os.path.exists("beyblade_x.csv"): return pd.DataFrame(), {}, {}
-    df = pd.read_csv("beyblade_x.csv").fillna("")
-    img_map = {}
-    theory_opts = {}
-    mapping = [('lock_chip', 'lock_chip_image', 'lock_chip'), 
-               ('blade', 'blade_image', 'blade'), 
-               ('over_blade', 'over_blade_image', 'over_blade'), 
-               ('metal_blade', 'metal_blade_image', 'metal_blade'), 
-               ('main_blade', 'main_blade_image', 'main_blade'), 
-               ('assist_blade', 'assist_blade_image', 'assist_blade'), 
-               ('ratchet_integrated_blade', 'ratchet_integrated_blade_image', 'r_i_blade'),
-               ('ratchet', 'ratchet_image', 'ratchet'), 
-               ('bit', 'bit_image', 'bit'), 
-               ('ratchet_integrated_bit', 'ratchet_integrated_bit_image', 'r_i_bit')]
-    
-    for _, _, state_key in mapping:
-        theory_opts[state_key] = ["-"]
+    # Artefatto precompilato dal job notturno (catalogo.pkl); se manca o non corrisponde al CSV
+    # lo stesso catalogo viene ricostruito dal CSV
+    start = time.perf_counter()
+    catalog, origine = catalogo.load_catalog()
+    if catalog is None: return pd.DataFrame(), {}, {}, catalogo.SearchIndex([])
+    df = pd.DataFrame(catalog["columns"])
+    search_index = catalogo.SearchIndex.from_state(catalog["search_index"])
+    print(f"[AVVIO] Catalogo caricato da {origine} in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return df, catalog["img_map"], catalog["theory_opts"], search_index
 
-    for csv_col, img_col, state_key in mapping:
-        if csv_col in df.columns:
-            theory_opts[state_key] = ["-"] + sorted([x for x in df[csv_col].unique().tolist() if x and x != "n/a"])
-    
-    for _, r in df.iterrows():
-        for c_col, i_col, _ in mapping:
-            if c_col in df.columns and i_col in df.columns:
-                val, img = str(r[c_col]), str(r[i_col])
-                if val and val != "n/a" and img and img != "n/a":
-                    img_map[val] = img
+@st.cache_data
+def load_image_manifest(mtime):
+    # mtime fa da chiave: la cache si invalida quando il job notturno aggiorna il manifest
+    with open(os.path.join("images", "manifest.json"), "r", encoding="utf-8") as f:
+        return json.load(f).get("urls", {})
 
-    df['_search'] = df.astype(str).apply(lambda x: ' '.join(x).lower(), axis=1)
-    return df, img_map, theory_opts
+def image_path(url):
+    manifest_path = os.path.join("images", "manifest.json")
+    urls = load_image_manifest(os.path.getmtime(manifest_path)) if os.path.exists(manifest_path) else {}
+    # Fallback sul vecchio schema (md5 dell'URL) per le immagini non ancora migrate
+    blob = urls.get(url) or f"{hashlib.md5(url.encode()).hexdigest()}.png"
+    return os.path.join("images", blob)
+
+THUMB_CACHE_BYTES = 32 * 1024 * 1024   # tetto della cache miniature, condiviso da tutte le sessioni
 
 @st.cache_resource
+def get_thumb_cache():
+    return ThumbnailCache(THUMB_CACHE_BYTES)
+
 def get_img(url, size=(100, 100)):
+    """Byte della miniatura per st.image: pre-generata dal job notturno oppure ridimensionata al volo."""
     if not url or url == "n/a": return None
-    h = hashlib.md5(url.encode()).hexdigest()
-    path = os.path.join("images", f"{h}.png")
-    if os.path.exists(path):
-        return Image.open(path).resize(size, Image.Resampling.LANCZOS)
-    return None
+    return get_thumb_cache().get(image_path(url), size)
+
+SPRITE_INDEX = os.path.join("static", "sprites_80.json")
+
+@st.cache_data
+def load_sprite_index(mtime):
+    # Foglio sprite generato dal job notturno; mtime come chiave per ricaricarlo quando cambia
+    with open(SPRITE_INDEX, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def parts_strip_html(urls, size=80):
+    """Miniature delle componenti in un solo blocco HTML: offset nel foglio sprite servito da
+    app/static, oppure data URI base64 per le immagini che nel foglio non ci sono."""
+    sprite = load_sprite_index(os.path.getmtime(SPRITE_INDEX)) if os.path.exists(SPRITE_INDEX) else None
+    cells = []
+    for url in urls:
+        if sprite and sprite["size"] == size and url in sprite["tiles"]:
+            x, y = sprite["tiles"][url]
+            style = f"background-image: url(app/static/{sprite['file']}); background-position: -{x}px -{y}px"
+        else:
+            data = get_img(url, size=(size, size))
+            if not data: continue
+            mime = "image/webp" if data[:4] == b"RIFF" else "image/png"
+            style = f"background-image: url(data:{mime};base64,{base64.b64encode(data).decode()}); background-size: cover"
+        cells.append(f"<div class='sprite-cell' style='{style}'></div>")
+    return f"<div class='sprite-row'>{''.join(cells)}</div>" if cells else ""
+
+@st.cache_data
+def load_meta_data(mtime):
+    # Lettura e pulizia di meta.csv una volta per versione del file (mtime come chiave)
+    return meta.read_meta()
+
+@st.cache_resource
+def get_combo_matrix(mtime):
+    # Indici dei pezzi e matrice combo x pezzi, costruiti una volta per versione di meta.csv
+    return meta.ComboMatrix.from_frame(load_meta_data(mtime))
+
+def meta_mtime():
+    return os.path.getmtime(meta.META_FILE) if os.path.exists(meta.META_FILE) else None
+
+@st.cache_data
+def get_meta_beys(mtime):
+    combos = load_meta_data(mtime)["Combo"]
+    return sorted(set(combos[combos != ""]))
+
+PAGE_SIZE = 10
+
+def _turn_page(key, step, pages):
+    # Callback dei pulsanti: gira prima del rerun, quindi la pagina è già giusta quando si disegna
+    page = st.session_state.get(f"page_{key}", 0) + step
+    st.session_state[f"page_{key}"] = min(max(page, 0), pages - 1)
+
+def paginate(items, key, reset_on=None, per_page=PAGE_SIZE):
+    """Solo gli elementi della pagina corrente, con i controlli di pagina quando servono.
+
+    La pagina sta in session_state sotto una chiave fissa, quindi sopravvive ai rerun;
+    torna alla prima quando cambia `reset_on` (ad esempio il testo cercato).
+    """
+    pages = max(1, -(-len(items) // per_page))
+    if st.session_state.get(f"page_q_{key}") != reset_on:
+        st.session_state[f"page_q_{key}"] = reset_on
+        st.session_state[f"page_{key}"] = 0
+    page = min(max(st.session_state.get(f"page_{key}", 0), 0), pages - 1)
+    st.session_state[f"page_{key}"] = page
+    if pages > 1:
+        c1, c2, c3 = st.columns([0.2, 0.6, 0.2])
+        c1.button("◀", key=f"prev_{key}", disabled=page == 0, on_click=_turn_page, args=(key, -1, pages))
+        c3.button("▶", key=f"next_{key}", disabled=page >= pages - 1, on_click=_turn_page, args=(key, 1, pages))
+        c2.markdown(f"Pagina {page + 1} di {pages} · {len(items)} risultati")
+    return items[page * per_page:(page + 1) * per_page]
 
 def get_bey_name_and_comps(curr):
     t_sys = curr.get("tipo", "BX/UX")
@@ -250,7 +397,25 @@ def get_bey_name_and_comps(curr):
     nome_bey = " ".join(parts).strip() or "Nuovo Beyblade"
     return nome_bey, parts, k_order
 
-df_db, global_img_map, theory_opts = load_db()
+def get_bey_index(user):
+    """id -> (bey, nome, componenti) dei Beyblade di `user`, tenuto nella sessione.
+
+    Si ricostruisce solo quando cambia `data_version` (salvataggi, ricarica dei dati e modifiche
+    nel Beyblade Builder): nei rerun senza modifiche nomi e componenti non vengono ricalcolati.
+    """
+    beys = st.session_state.users[user]["decks"]["beys"]
+    firma = st.session_state.get("data_version", 0)
+    indici = st.session_state.setdefault("bey_index", {})
+    cached = indici.get(user)
+    if cached is None or cached[0] != firma:
+        index = {}
+        for b in beys:
+            nome, parts, _ = get_bey_name_and_comps(b)
+            index[b.get("id")] = (b, nome, parts)
+        cached = indici[user] = (firma, index)
+    return cached[1]
+
+df_db, global_img_map, theory_opts, search_index = load_db()
 user_sel = st.session_state.user_sel
 user_data = st.session_state.users[user_sel]
 
@@ -264,6 +429,24 @@ if st.sidebar.button("Esci / Cambia Utente"):
         del st.session_state[key]
     st.rerun()
 
+with st.sidebar.expander("📊 Diagnostica"):
+    t = get_thumb_cache().stats()
+    st.caption(f"Miniature: {t['hits']} hit, {t['misses']} miss, {t['entries']} in cache, "
+               f"{t['bytes'] / 1e6:.1f} / {t['budget'] / 1e6:.0f} MB")
+
+if store.last_error: st.sidebar.warning(f"⚠️ {store.last_error}")
+elif store.pending: st.sidebar.caption(f"⏳ {store.pending} file da sincronizzare con GitHub")
+if st.sidebar.button("🔄 Sincronizza"):
+    with st.spinner("Sincronizzazione con GitHub..."):
+        ok = store.flush()
+        store.refresh()
+        remote_shards.clear()
+        load_match_history.clear()
+        force_load()
+    user_data = st.session_state.users[user_sel]
+    if ok: st.sidebar.success("Sincronizzato!")
+    else: st.sidebar.error("❌ Errore sincronizzazione")
+
 # =========================
 # MENU DI NAVIGAZIONE
 # =========================
@@ -274,11 +457,14 @@ if menu_scelta == "Inventario":
 
     # --- TAB 1: AGGIUNGI ---
     with tab1:
-        search_q = st.text_input("Cerca Beyblade...", "").lower()
-        filtered = df_db[df_db['_search'].str.contains(search_q)] if search_q else df_db.head(10)
-        for i, (_, row) in enumerate(filtered.iterrows()):
-            with st.expander(f"**{row['name'].upper()}**"):
-                with st.container(border=True):
+        search_q = st.text_input("Cerca Beyblade...", "")
+        positions = search_index.search(search_q) if search_q.strip() else list(range(len(df_db)))
+        # Si costruisce solo la pagina visibile, e i widget di una voce solo quando viene aperta
+        for pos in paginate(positions, "catalogo", reset_on=search_q):
+            row = df_db.iloc[pos]
+            i = row.name   # etichetta della riga nel CSV: chiave stabile tra pagine e ricerche
+            with st.container(border=True):
+                if st.toggle(f"**{row['name'].upper()}**", key=f"cat_open_{i}"):
                     img = get_img(row['blade_image'] or row['beyblade_page_image'], size=(150, 150))
                     if img: st.image(img)
                     comps = [("lock_chip", "lock_chip"), ("blade", "blade"), 
@@ -335,6 +521,7 @@ elif menu_scelta == "Builder":
             new_id = hashlib.md5(str(time.time()).encode()).hexdigest()[:8]
             user_data["decks"]["beys"].append({"id": new_id, "tipo": "BX/UX", "is_new": True})
             st.session_state.last_edited_bey = new_id
+            st.session_state[f"page_beys_{user_sel}"] = 0   # i nuovi Beyblade sono in cima alla lista
             save_cloud(); st.rerun()
             
         search_bey = st.text_input("Cerca Beyblade...", "").lower()
@@ -342,8 +529,10 @@ elif menu_scelta == "Builder":
         inv_opts = {cat: (["-"] + sorted(list(items.keys()))) for cat, items in user_data["inv"].items()}
         tipologie = ["BX/UX", "BX/UX+R-I-Bit", "CX", "CX+R-I-Bit", "CX Infinity", "CX Infinity+R-I-Bit", "R-I-Blade+Bit", "BX/UX Theory", "BX/UX+R-I-Bit Theory", "CX Theory", "CX+R-I-Bit Theory", "CX Infinity Theory", "CX Infinity+R-I-Bit Theory", "R-I-Blade+Bit Theory"]
         
+        bey_index = get_bey_index(user_sel)
+        
         def bey_sort_key(b):
-            nome, _, _ = get_bey_name_and_comps(b)
+            nome = bey_index[b.get("id")][1]
             # Aggiunta (Theory) alla chiave di ordinamento se il sistema lo prevede
             if "Theory" in b.get("tipo", ""):
                 nome += " (Theory)"
@@ -352,8 +541,9 @@ elif menu_scelta == "Builder":
             
         user_data["decks"]["beys"].sort(key=bey_sort_key)
         
+        visibili = []
         for b_idx, bey in enumerate(user_data["decks"]["beys"]):
-            nome_bey, _, _ = get_bey_name_and_comps(bey)
+            nome_bey = bey_index[bey.get("id")][1]
             
             # Aggiunta automatica (Theory) al nome visualizzato se il sistema contiene "Theory"
             if "Theory" in bey.get("tipo", ""):
@@ -361,14 +551,22 @@ elif menu_scelta == "Builder":
             
             if search_bey and search_bey not in nome_bey.lower():
                 continue
+            visibili.append((b_idx, bey, nome_bey))
                 
-            is_expanded = (st.session_state.get("last_edited_bey") == bey["id"])
+        for b_idx, bey, nome_bey in paginate(visibili, f"beys_{user_sel}", reset_on=search_bey):
+            # Il Beyblade appena creato o modificato si apre una volta sola (il nome nel toggle
+            # cambia con le componenti); poi l'utente può richiuderlo
+            if st.session_state.get("last_edited_bey") == bey["id"]:
+                st.session_state[f"bey_open_{bey['id']}"] = True
+                st.session_state.last_edited_bey = None
             
-            with st.expander(nome_bey.upper(), expanded=is_expanded):
+            with st.container(border=True):
+                if not st.toggle(nome_bey.upper(), key=f"bey_open_{bey['id']}"): continue
                 tipo = st.selectbox("Sistema", tipologie, index=tipologie.index(bey.get("tipo", "BX/UX")), key=f"tb_sys_{bey['id']}")
                 if tipo != bey.get("tipo"):
                     bey["tipo"] = tipo
                     st.session_state.last_edited_bey = bey["id"]
+                    bump_data_version()
                     st.rerun()
 
                 is_th = "Theory" in tipo
@@ -380,6 +578,7 @@ elif menu_scelta == "Builder":
                     if bey.get(k_comp) != res:
                         bey[k_comp] = res
                         st.session_state.last_edited_bey = bey["id"]
+                        bump_data_version()
                         st.rerun()
 
                 if "CX Infinity" in tipo:
@@ -422,14 +621,10 @@ elif menu_scelta == "Builder":
                         k_imgs = ["b", "r", "bi"]
 
                 st.write("") 
-                cols = st.columns(len(k_imgs) if len(k_imgs) > 0 else 1)
-                col_idx = 0
-                for k in k_imgs:
-                    v = bey.get(k)
-                    if v and v != "-":
-                        img_map_val = global_img_map.get(v)
-                        img_obj = get_img(img_map_val)
-                        if img_obj: cols[col_idx].image(img_obj, width=80); col_idx += 1
+                # Tutte le miniature in un unico blocco HTML invece di un st.image per componente
+                img_urls = [global_img_map.get(bey.get(k)) for k in k_imgs if bey.get(k) and bey.get(k) != "-"]
+                strip = parts_strip_html([u for u in img_urls if u])
+                if strip: st.markdown(strip, unsafe_allow_html=True)
                         
                 st.markdown("<hr>", unsafe_allow_html=True)
                 c1, c2 = st.columns(2)
@@ -450,10 +645,10 @@ elif menu_scelta == "Builder":
 
     # --- DECK BUILDER ---
     with tab_deck:
+        bey_index = get_bey_index(user_sel)
         bey_options = {"-": "- Nessuno -"}
-        for b in user_data["decks"]["beys"]:
-            n, _, _ = get_bey_name_and_comps(b)
-            bey_options[b["id"]] = n
+        for b_id, (_, n, _) in bey_index.items():
+            bey_options[b_id] = n
             
         bey_list_display = ["-"] + [b["id"] for b in user_data["decks"]["beys"]]
         
@@ -461,32 +656,24 @@ elif menu_scelta == "Builder":
             return bey_options.get(b_id, "-")
             
         for d_idx, deck in enumerate(user_data["decks"]["deck_list"]):
-            all_deck_comps = []
+            # Un solo passaggio sugli slot: nomi, componenti e conteggio dei pezzi del deck
             slot_names = []
-            
+            slot_parts = []
             for s_idx in range(3):
                 b_id = deck["slots"].get(str(s_idx), "-")
-                if b_id != "-" and b_id in bey_options:
-                    bey = next((x for x in user_data["decks"]["beys"] if x["id"] == b_id), None)
-                    if bey:
-                        n, parts, _ = get_bey_name_and_comps(bey)
-                        all_deck_comps.extend(parts)
-                        slot_names.append(n)
-                    else:
-                        slot_names.append(f"Slot {s_idx+1} Vuoto")
+                entry = bey_index.get(b_id) if b_id != "-" else None
+                if entry:
+                    slot_names.append(entry[1])
+                    slot_parts.append(entry[2])
                 else:
                     slot_names.append(f"Slot {s_idx+1} Vuoto")
+                    slot_parts.append([])
+            conteggio = Counter(p for parts in slot_parts for p in parts)
+            duplicati = {p for p, n in conteggio.items() if n > 1}
 
             with st.expander(deck['name'].upper(), expanded=False):
                 for s_idx in range(3):
-                    b_id = deck["slots"].get(str(s_idx), "-")
-                    ha_duplicati = False
-                    if b_id != "-" and b_id in bey_options:
-                        bey = next((x for x in user_data["decks"]["beys"] if x["id"] == b_id), None)
-                        if bey:
-                            _, parts, _ = get_bey_name_and_comps(bey)
-                            if any(all_deck_comps.count(p) > 1 for p in parts):
-                                ha_duplicati = True
+                    ha_duplicati = any(p in duplicati for p in slot_parts[s_idx])
                     
                     alert = f"<span class='slot-summary-alert'>⚠️ DUPLICATO</span>" if ha_duplicati else ""
                     st.markdown(f"<div class='slot-summary-box'><span class='slot-summary-name'>{slot_names[s_idx]}</span>{alert}</div>", unsafe_allow_html=True)
@@ -543,29 +730,11 @@ elif menu_scelta == "Match!":
                 index=range(1, 14)
             )
 
-        def get_meta_beys():
-            beys = []
-            if os.path.exists("meta.csv"):
-                import csv
-                for encoding in ['utf-8', 'latin-1']:
-                    try:
-                        with open("meta.csv", "r", encoding=encoding) as f:
-                            reader = csv.reader(f)
-                            next(reader, None) # Salta l'intestazione
-                            for parts in reader:
-                                if len(parts) >= 6:
-                                    comps = [p.strip() for p in parts[:6] if p.strip()]
-                                    if comps: beys.append(" ".join(comps))
-                        break
-                    except Exception:
-                        pass
-            return sorted(list(set(beys)))
-
         def get_bey_names(player_name, suffix):
             names = ["-"]
             if player_name == "Esterno":
                 with st.expander(f"⚙️ Configura Bey Esterni ({suffix})"):
-                    meta_list = ["Inserisci manualmente"] + get_meta_beys()
+                    meta_list = ["Inserisci manualmente"] + (get_meta_beys(meta_mtime()) if meta_mtime() else [])
                     for i in range(3):
                         sel = st.selectbox(f"Seleziona Bey {i+1} ({suffix})", meta_list, key=f"ext_sel_{suffix}_{i}")
                         if sel == "Inserisci manualmente":
@@ -574,9 +743,9 @@ elif menu_scelta == "Match!":
                         else:
                             names.append(sel)
             else:
-                p_beys = st.session_state.users[player_name]["decks"]["beys"]
-                for bey in p_beys:
-                    n, _, _ = get_bey_name_and_comps(bey)
+                p_index = get_bey_index(player_name)
+                for bey in st.session_state.users[player_name]["decks"]["beys"]:
+                    n = p_index[bey.get("id")][1]
                     if n and n != "Nuovo Beyblade":
                         names.append(n)
             
@@ -655,15 +824,22 @@ elif menu_scelta == "Match!":
                     })
                 
                 with st.spinner("Aggiornamento archivio..."):
-                    full_archive = github_action("stats", method="GET") or []
-                    full_archive.extend(new_records)
-                    if github_action("stats", full_archive, "PUT"):
+                    # Si tocca solo lo shard del mese corrente, non l'intero storico
+                    shard = match_log.shard_path(datetime.now().date())
+                    shard_records = store.get(shard)
+                    if shard_records is False:
+                        st.error("Errore salvataggio statistiche.")
+                    else:
+                        board = shard_leaderboard(shard)
+                        store.put(shard, shard_records + new_records)
+                        # Aggiornamento incrementale della classifica con i soli match nuovi
+                        board.add(new_records)
+                        get_leaderboards()[shard] = (store.version(shard), board)
+                        load_match_history.clear()
                         st.success("Scontri archiviati con successo!")
                         st.session_state.match_counter += 1
                         time.sleep(1)
                         st.rerun()
-                    else:
-                        st.error("Errore salvataggio statistiche.")
 
         st.markdown("---")
         st.markdown("### 📥 Esporta Statistiche in Excel")
@@ -671,76 +847,45 @@ elif menu_scelta == "Match!":
         start_date = st.date_input("Esporta dati a partire da:", value=datetime.today().date())
         
         if st.button("⚙️ Prepara File Excel", use_container_width=True):
-            with st.spinner("Recupero dati e generazione Excel..."):
-                stats_data = github_action("stats", method="GET") or []
-                if not stats_data:
-                    st.warning("Nessun dato presente nel registro.")
-                else:
-                    filtered_data = []
-                    for row in stats_data:
-                        d_str = row.get("Data", "")
-                        try:
-                            row_date = datetime.strptime(d_str, "%d/%m/%Y").date()
-                        except ValueError:
-                            try:
-                                row_date = datetime.strptime(d_str, "%Y-%m-%d %H:%M:%S").date()
-                            except ValueError:
-                                row_date = datetime.min.date()
-                                
-                        if row_date >= start_date:
-                            filtered_data.append(row)
-                            
-                    if not filtered_data:
-                        st.warning("Nessun dato trovato a partire da questa data.")
-                    else:
-                        df_history = pd.DataFrame(filtered_data)
-                        
-                        df1 = df_history[['BeyG1', 'PunteggioBeyG1']].rename(columns={'BeyG1': 'Bey', 'PunteggioBeyG1': 'Score'})
-                        df2 = df_history[['BeyG2', 'PunteggioBeyG2']].rename(columns={'BeyG2': 'Bey', 'PunteggioBeyG2': 'Score'})
-                        
-                        df_concat = pd.concat([df1, df2])
-                        df_concat['Score'] = pd.to_numeric(df_concat['Score'], errors='coerce').fillna(0)
-                        df_scores = df_concat.groupby('Bey')['Score'].sum().reset_index().sort_values(by='Score', ascending=False)
-                        
-                        output = io.BytesIO()
-                        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                            df_history.to_excel(writer, sheet_name='match history', index=False)
-                            worksheet_history = writer.sheets['match history']
-                            worksheet_history.autofilter(0, 0, len(df_history), len(df_history.columns) - 1)
-                            
-                            df_scores.to_excel(writer, sheet_name='Punteggi Beyblade', index=False)
-                            
-                            for u in ["Antonio", "Andrea", "Fabio"]:
-                                if 'NomeGiocatore1' in df_history.columns and 'NomeGiocatore2' in df_history.columns:
-                                    df_u = df_history[(df_history['NomeGiocatore1'] == u) | (df_history['NomeGiocatore2'] == u)]
-                                else:
-                                    df_u = pd.DataFrame() 
-                                    
-                                df_u.to_excel(writer, sheet_name=u, index=False)
-                                worksheet_u = writer.sheets[u]
-                                if not df_u.empty:
-                                    worksheet_u.autofilter(0, 0, len(df_u), len(df_u.columns) - 1)
-                                    
-                        st.session_state.excel_bytes = output.getvalue()
-                        st.success("✅ File Excel pronto!")
-
-        if 'excel_bytes' in st.session_state:
-            st.download_button(
-                label="📥 SCARICA EXCEL (.xlsx)",
-                data=st.session_state.excel_bytes,
-                file_name=f"Beyblade_Match_History_{datetime.now().strftime('%d_%m_%Y')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                use_container_width=True,
-                type="primary"
-            )
+            df_all, versione = load_match_history()
+            df_history = df_all[df_all['Giorno'] >= pd.Timestamp(start_date)].drop(columns='Giorno')
+            if df_all.empty:
+                st.warning("Nessun dato presente nel registro.")
+            elif df_history.empty:
+                st.warning("Nessun dato trovato a partire da questa data.")
+            else:
+                # In sessione resta solo il percorso: il file vive su disco ed è condiviso tra sessioni
+                st.session_state.excel_path, _ = start_export(df_history, start_date, versione)
+
+        excel_path = st.session_state.get('excel_path')
+        if excel_path and os.path.exists(excel_path):
+            with open(excel_path, "rb") as f:
+                st.download_button(
+                    label="📥 SCARICA EXCEL (.xlsx)",
+                    data=f,
+                    file_name=f"Beyblade_Match_History_{datetime.now().strftime('%d_%m_%Y')}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    use_container_width=True,
+                    type="primary"
+                )
+        elif excel_path:
+            job = get_export_jobs()[1].get(os.path.splitext(os.path.basename(excel_path))[0])
+            if job is None or (job.done() and not job.exception()):
+                del st.session_state['excel_path']   # file rimosso o app riavviata: va rigenerato
+                st.rerun()
+            elif job.done() and job.exception():
+                st.error(f"Errore generazione Excel: {job.exception()}")
+            else:
+                st.info("⏳ File Excel in preparazione...")
+                if st.button("🔄 Aggiorna stato", use_container_width=True): st.rerun()
 
 # --- TAB 6: CLASSIFICA BEYBLADE ---
     with tab6:
         st.markdown("### 🏆 Classifica Globale Beyblade")
         
-        stats_data = github_action("stats", method="GET") or []
+        shards = match_shards()
         
-        if not stats_data:
+        if not shards:
             st.info("Nessun match registrato finora nel cloud.")
         else:
             # Layout filtri: tre colonne
@@ -767,56 +912,21 @@ elif menu_scelta == "Match!":
             else:
                 start_d = end_d = date_range
 
-            filtered_data = []
-            for row in stats_data:
-                d_str = row.get("Data", "")
-                try:
-                    row_date = datetime.strptime(d_str, "%d/%m/%Y").date()
-                except ValueError:
-                    try:
-                        row_date = datetime.strptime(d_str, "%Y-%m-%d %H:%M:%S").date()
-                    except ValueError:
-                        row_date = datetime.min.date()
-                
-                if start_d <= row_date <= end_d:
-                    filtered_data.append(row)
+            # Somma dei bucket (giorno, giocatore, bey) del periodo, solo sugli shard dei mesi coinvolti
+            totali = {}
+            for path in shards:
+                mese = match_log.shard_month(path)
+                if mese and not (start_d.replace(day=1) <= mese <= end_d): continue
+                shard_leaderboard(path).query(start_d, end_d, None if filtro_utente == "Tutti" else filtro_utente, totali)
 
-            if not filtered_data:
+            if not totali:
                 st.warning("Nessun dato trovato per il periodo selezionato.")
             else:
-                df_storico = pd.DataFrame(filtered_data)
-                
-                # Conversione punti in numerico per i calcoli
-                df_storico['PunteggioBeyG1'] = pd.to_numeric(df_storico['PunteggioBeyG1'], errors='coerce').fillna(0)
-                df_storico['PunteggioBeyG2'] = pd.to_numeric(df_storico['PunteggioBeyG2'], errors='coerce').fillna(0)
-
-                # Determiniamo chi ha vinto il match per il calcolo del Winrate
-                df_storico['VittoriaG1'] = df_storico['PunteggioBeyG1'] > df_storico['PunteggioBeyG2']
-                df_storico['VittoriaG2'] = df_storico['PunteggioBeyG2'] > df_storico['PunteggioBeyG1']
-
-                # Prepariamo i due dataframe da unire
-                df_g1 = df_storico[['NomeGiocatore1', 'BeyG1', 'PunteggioBeyG1', 'VittoriaG1']].rename(
-                    columns={'NomeGiocatore1': 'Giocatore', 'BeyG1': 'Bey', 'PunteggioBeyG1': 'Punteggio', 'VittoriaG1': 'Vittoria'}
-                )
-                df_g2 = df_storico[['NomeGiocatore2', 'BeyG2', 'PunteggioBeyG2', 'VittoriaG2']].rename(
-                    columns={'NomeGiocatore2': 'Giocatore', 'BeyG2': 'Bey', 'PunteggioBeyG2': 'Punteggio', 'VittoriaG2': 'Vittoria'}
+                # Bey -> [partite, vittorie, somma punti, somma punti nelle vittorie]
+                df_classifica = pd.DataFrame(
+                    [(bey, t[0], t[1], t[2], t[3]) for bey, t in totali.items()],
+                    columns=['Bey', 'Partite', 'Vittorie_Totali', 'Somma_Punti', 'Somma_Punti_Positivi']
                 )
-                
-                df_totale = pd.concat([df_g1, df_g2])
-                
-                # 1. Ignoriamo i beyblade con nome "-"
-                df_totale = df_totale[df_totale['Bey'] != "-"]
-                
-                if filtro_utente != "Tutti":
-                    df_totale = df_totale[df_totale['Giocatore'] == filtro_utente]
-                
-                # --- CALCOLO AGGREGATO ---
-                # Raggruppiamo per Beyblade
-                df_classifica = df_totale.groupby('Bey').agg(
-                    Partite=('Punteggio', 'count'),
-                    Vittorie_Totali=('Vittoria', 'sum'),
-                    Somma_Punti=('Punteggio', 'sum')
-                ).reset_index()
 
                 # 3. Calcolo Winrate (Vittorie / Partite * 100)
                 df_classifica['Winrate'] = (df_classifica['Vittorie_Totali'] / df_classifica['Partite'] * 100).round(1)
@@ -825,12 +935,9 @@ elif menu_scelta == "Match!":
                 df_classifica['Media Punti'] = (df_classifica['Somma_Punti'] / df_classifica['Partite']).round(1)
 
                 # 4. Calcolo Media Punti Positivi (solo match vinti)
-                df_vinti = df_totale[df_totale['Vittoria'] == True]
-                df_media_pos = df_vinti.groupby('Bey')['Punteggio'].mean().round(1).reset_index()
-                df_media_pos = df_media_pos.rename(columns={'Punteggio': 'Media Punti Positivi'})
-
-                # Uniamo la media positiva alla classifica principale
-                df_classifica = pd.merge(df_classifica, df_media_pos, on='Bey', how='left').fillna(0)
+                df_classifica['Media Punti Positivi'] = (
+                    df_classifica['Somma_Punti_Positivi'] / df_classifica['Vittorie_Totali'].where(df_classifica['Vittorie_Totali'] > 0)
+                ).round(1).fillna(0)
 
                 # 5. Filtro minimo partite
                 df_classifica = df_classifica[df_classifica['Partite'] >= min_partite]
@@ -862,111 +969,42 @@ elif menu_scelta == "Match!":
 elif menu_scelta == "Meta":
     tab_rank, tab_blades = st.tabs(["🏆 Ranking", "🗡️ Blades"])
 
-    # --- FUNZIONE DI CARICAMENTO DATI ---
-    @st.cache_data
-    def load_meta_data():
-        if os.path.exists("meta.csv"):
-            try:
-                return pd.read_csv("meta.csv", encoding="utf-8")
-            except Exception:
-                return pd.read_csv("meta.csv", encoding="latin-1")
-        return pd.DataFrame()
-
-    df_meta = load_meta_data()
+    meta_versione = meta_mtime()
+    df_meta = load_meta_data(meta_versione) if meta_versione else pd.DataFrame()
 
 # --- TAB RANKING ---
     with tab_rank:
         st.markdown("### 🏆 Ranking Meta WBO")
         
         if not df_meta.empty:
-            # Identifichiamo le colonne dei pezzi da unire
-            colonne_componenti = [
-                "Lock Chip", "Over Blade", "Main/Metal Blade (CX) / Blade (UX/BX)", 
-                "Assist Blade", "Ratchet", "Bit"
-            ]
-            colonne_extra = ["Points", "Combo Rank", "Rank Change"]
-            
-            colonne_presenti_comp = [c for c in colonne_componenti if c in df_meta.columns]
-            colonne_presenti_extra = [c for c in colonne_extra if c in df_meta.columns]
-            
-            df_rank = df_meta[colonne_presenti_comp + colonne_presenti_extra].copy()
-            
-            # 1. Unione delle colonne dei pezzi in un'unica stringa
-            def unisci_combo(row):
-                parti = [str(row[c]).strip() for c in colonne_presenti_comp if pd.notna(row[c]) and str(row[c]).strip() != ""]
-                return " ".join(parti)
-            
-            df_rank.insert(0, "Combo", df_rank.apply(unisci_combo, axis=1))
+            # Combo già unita, frecce corrette e colonne tipizzate da meta.read_meta
+            col_ordine = ["Combo", "Points", "Combo Rank", "Rank Change"]
+            df_rank = df_meta[[c for c in col_ordine if c in df_meta.columns]]
             
             # --- LOGICA FILTRO PER POSSEDUTI ---
-            filtra_posseduti = st.checkbox("✅ Filtra per posseduti", value=False, help="Mostra solo i Beyblade di cui hai tutte le componenti nell'inventario.")
+            filtro_posseduti = st.radio(
+                "Filtro", ["Tutte", "✅ Filtra per posseduti", "🛒 Manca un solo pezzo"], horizontal=True,
+                help="Mostra solo i Beyblade di cui hai tutte le componenti nell'inventario, oppure quelli a cui ne manca una sola."
+            )
             
-            if filtra_posseduti:
-                # Estraiamo tutti i pezzi posseduti dall'utente
-                inv_utente = user_data.get("inv", {})
-                pezzi_posseduti_norm = set()
-                lock_chips_posseduti_norm = set()
-                
-                # Funzione per rimuovere spazi e maiuscole per un confronto infallibile
-                def normalizza_nome(nome):
-                    return str(nome).replace(" ", "").lower()
-                
-                for cat, items in inv_utente.items():
-                    for nome, qta in items.items():
-                        if qta > 0:
-                            nome_norm = normalizza_nome(nome)
-                            pezzi_posseduti_norm.add(nome_norm)
-                            if cat == "lock_chip":
-                                lock_chips_posseduti_norm.add(nome_norm)
-                
-                lock_chips_metal = {"emperor", "valkyrie"}
-                
-                # Ha almeno un lock chip Metal?
-                ha_metal = any(lc in lock_chips_metal for lc in lock_chips_posseduti_norm)
-                # Ha almeno un lock chip Plastic? (Qualsiasi lock chip che non è in lock_chips_metal)
-                ha_plastic = any(lc not in lock_chips_metal for lc in lock_chips_posseduti_norm)
+            if filtro_posseduti != "Tutte":
+                combo_matrix = get_combo_matrix(meta_versione)
+                # Il vettore dei pezzi posseduti si ricalcola solo quando l'inventario cambia
+                firma_inv = (user_sel, st.session_state.get("data_version", 0))
+                cache_inv = st.session_state.get("meta_inv")
+                if not cache_inv or cache_inv[0] != firma_inv:
+                    cache_inv = (firma_inv, combo_matrix.encode(user_data.get("inv", {})))
+                    st.session_state.meta_inv = cache_inv
+                posseduti = cache_inv[1]
                 
-                def possiede_tutte_componenti(row):
-                    for col in colonne_presenti_comp:
-                        pezzo_richiesto = str(row[col]).strip()
-                        if not pezzo_richiesto or pezzo_richiesto.lower() == "nan":
-                            continue # Componente non richiesta
-                            
-                        pezzo_norm = normalizza_nome(pezzo_richiesto)
-                        
-                        if col == "Lock Chip":
-                            if pezzo_richiesto == "Metal" and not ha_metal:
-                                return False
-                            elif pezzo_richiesto == "Plastic" and not ha_plastic:
-                                return False
-                            # Se in futuro il meta indicherà un lock chip per nome invece che per categoria
-                            elif pezzo_richiesto not in ["Metal", "Plastic"] and pezzo_norm not in pezzi_posseduti_norm:
-                                return False
-                        else:
-                            if pezzo_norm not in pezzi_posseduti_norm:
-                                return False
-                    return True
-
-                # Applichiamo il filtro riga per riga e manteniamo solo quelle valide
-                mask_posseduti = df_rank.apply(possiede_tutte_componenti, axis=1)
-                df_rank = df_rank[mask_posseduti]
+                mancanti = combo_matrix.missing(posseduti)
+                if filtro_posseduti == "✅ Filtra per posseduti":
+                    df_rank = df_rank[mancanti == 0]
+                else:
+                    df_rank = df_rank.assign(Manca=combo_matrix.missing_part(posseduti))[mancanti == 1]
 
-            # Rimuoviamo le colonne singole dopo aver filtrato
-            df_rank = df_rank.drop(columns=colonne_presenti_comp)
-            
-            if "Rank Change" in df_rank.columns:
-                df_rank["Rank Change"] = df_rank["Rank Change"].astype(str)
-                df_rank["Rank Change"] = df_rank["Rank Change"].replace(
-                    {r'.*â¬†.*': '⬆️', r'.*â¬‡.*': '⬇️', r'.*â€”.*': '—'}, regex=True
-                )
-                df_rank["Rank Change"] = df_rank["Rank Change"].replace({'nan': '-'})
-            
-            if "Combo Rank" in df_rank.columns:
-                df_rank["Combo Rank"] = pd.to_numeric(df_rank["Combo Rank"], errors='coerce')
-                
-            col_ordine = ["Combo", "Points", "Combo Rank", "Rank Change"]
-            col_ordine_presenti = [c for c in col_ordine if c in df_rank.columns]
-            df_rank = df_rank[col_ordine_presenti]
+            col_ordine = ["Combo", "Manca", "Points", "Combo Rank", "Rank Change"]
+            df_rank = df_rank[[c for c in col_ordine if c in df_rank.columns]]
                 
             ricerca_rank = st.text_input("🔍 Ricerca", key="search_rank").lower()
             
@@ -977,11 +1015,8 @@ elif menu_scelta == "Meta":
                 mask = df_rank.astype(str).apply(lambda x: x.str.lower().str.contains(ricerca_rank, regex=False)).any(axis=1)
                 df_rank = df_rank[mask]
                 
-            # 1. Calcoliamo la lunghezza della stringa più lunga nella colonna Combo
-            if not df_rank.empty:
-                max_chars = df_rank["Combo"].astype(str).map(len).max()
-            else:
-                max_chars = 20 # Valore di riserva se la tabella è vuota
+            # 1. Lunghezza della combo più lunga del meta (fissa anche quando i filtri cambiano)
+            max_chars = df_meta["Combo"].str.len().max() if not df_meta.empty else 20
                 
             # 2. Convertiamo i caratteri in pixel (circa 9 pixel per carattere + 20px di margine)
             larghezza_pixel_combo = int(max_chars * 9) + 20
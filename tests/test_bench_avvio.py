@@ -0,0 +1,35 @@
+import os
+
+import bench_avvio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APP = '''import os
+import streamlit as st
+from data_store import DataStore
+from . import locale
+
+if not st.session_state.get("ok"):
+    st.text_input("password")
+    st.stop()
+
+import pandas as pd
+from match_log import to_frame
+'''
+
+def test_app_imports_split_at_login(tmp_path):
+    path = tmp_path / "app.py"
+    path.write_text(APP, encoding="utf-8")
+    assert bench_avvio.app_imports(str(path)) == (["os", "streamlit", "data_store"], ["pandas", "match_log"])
+
+def test_real_app_keeps_heavy_imports_after_login():
+    login, _ = bench_avvio.app_imports(os.path.join(ROOT, bench_avvio.APP_FILE))
+    for heavy in ("pandas", "google.generativeai", "PIL.Image", "xlsxwriter", "requests"):
+        assert heavy not in login
+
+def test_available_skips_missing_modules():
+    assert bench_avvio.available(["json", "modulo_che_non_esiste", "pacchetto_assente.sub"]) == ["json"]
+
+def test_importtime_line_format():
+    m = bench_avvio.LINE.match("import time:       351 |       1204 |   encodings")
+    assert m.group(2) == "1204" and len(m.group(3)) == 3 and m.group(4) == "encodings"
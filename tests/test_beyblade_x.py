@@ -0,0 +1,447 @@
+import os
+import csv
+import json
+import time
+import random
+import threading
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import beyblade_x
+from beyblade_x import ImageStore
+
+def png_bytes(color=(200, 30, 30, 255), size=(40, 40)):
+    out = BytesIO()
+    Image.new("RGBA", size, color).save(out, "PNG")
+    return out.getvalue()
+
+# =========================
+# RATE LIMITER
+# =========================
+def test_token_bucket_burst_then_rate():
+    bucket = beyblade_x.TokenBucket(rate=100, burst=3)
+    start = time.monotonic()
+    for _ in range(3): bucket.acquire()
+    assert time.monotonic() - start < 0.02
+    for _ in range(5): bucket.acquire()
+    assert time.monotonic() - start >= 0.04
+
+def test_token_bucket_shared_between_threads():
+    bucket = beyblade_x.TokenBucket(rate=200, burst=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(5)]) for _ in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    # 20 gettoni con 1 iniziale: almeno 19 / 200 secondi qualunque sia il numero di thread
+    assert time.monotonic() - start >= 19 / 200 * 0.9
+
+# =========================
+# QUERY A BLOCCHI
+# =========================
+def test_query_titles_batches_and_follows_aliases(monkeypatch):
+    calls = []
+    def api_call(params, label=""):
+        titles = params["titles"].split("|")
+        calls.append(titles)
+        q = {"pages": {}}
+        aliases = {"Bit_Flat": ("normalized", "Bit Flat"), "Bit - R": ("redirects", "Bit - Rush")}
+        for t in titles:
+            if t in aliases:
+                kind, target = aliases[t]
+                q.setdefault(kind, []).append({"from": t, "to": target})
+                t = target
+            if t != "Missing": q["pages"][t] = {"title": t, "pageid": len(q["pages"]) + 1}
+        return {"query": q}
+    monkeypatch.setattr(beyblade_x, "api_call", api_call)
+    titles = [f"Bey {i}" for i in range(120)] + ["Bit_Flat", "Bit - R", "Missing", "Bey 0", "n/a", ""]
+    pages = beyblade_x.query_titles(titles, {"prop": "info"})
+    assert sorted(len(c) for c in calls) == [23, 50, 50]
+    assert len(pages) == 122 and "Missing" not in pages
+    assert pages["Bit_Flat"]["title"] == "Bit Flat"
+    assert pages["Bit - R"]["title"] == "Bit - Rush"
+
+def test_query_titles_follows_continue(monkeypatch):
+    def api_call(params, label=""):
+        if "rvcontinue" not in params:
+            return {"query": {"pages": {"1": {"title": "A", "revisions": [1]}}}, "continue": {"rvcontinue": "x"}}
+        return {"query": {"pages": {"2": {"title": "B", "revisions": [2]}}}}
+    monkeypatch.setattr(beyblade_x, "api_call", api_call)
+    pages = beyblade_x.query_titles(["A", "B"], {"prop": "revisions"})
+    assert pages == {"A": {"title": "A", "revisions": [1]}, "B": {"title": "B", "revisions": [2]}}
+
+# =========================
+# CASSETTA
+# =========================
+class FakeResponse:
+    def __init__(self, status_code, content, headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+def test_cassette_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(beyblade_x.rate_limiter, "rate", 1e9)
+    big = png_bytes(size=(400, 300))
+    responses = {beyblade_x.API_URL: FakeResponse(200, b'{"query": {}}', {"Set-Cookie": "x", "ETag": "a"}),
+                 "https://img/a.png": FakeResponse(200, big),
+                 "https://img/rate.png": FakeResponse(429, b"")}
+    class Session:
+        def get(self, url, params=None, headers=None, timeout=None):
+            return responses[url]
+    rec = beyblade_x.Transport(Session(), "registra", str(tmp_path))
+    rec.get(beyblade_x.API_URL, params={"action": "query"})
+    rec.get("https://img/a.png")
+    rec.get("https://img/rate.png")
+
+    play = beyblade_x.Transport(None, "riproduci", str(tmp_path))
+    api = play.get(beyblade_x.API_URL, params={"action": "query"})
+    assert api.json() == {"query": {}} and "Set-Cookie" not in api.headers
+    img = play.get("https://img/a.png")
+    assert max(Image.open(BytesIO(img.content)).size) <= beyblade_x.CASSETTE_IMG_SIZE
+    assert play.bytes == len(b'{"query": {}}') + len(big)
+    # Le risposte temporanee non vengono registrate
+    with pytest.raises(beyblade_x.CassetteMiss):
+        play.get("https://img/rate.png")
+
+# =========================
+# FORMATO E BUDGET DELLE IMMAGINI
+# =========================
+def noisy_image(size=(300, 300), seed=0):
+    rnd = random.Random(seed)
+    img = Image.new("RGBA", size)
+    img.putdata([(rnd.randrange(256), rnd.randrange(256), rnd.randrange(256), 255) for _ in range(size[0] * size[1])])
+    return img
+
+def test_encode_image_fits_budget_or_returns_smallest():
+    img = noisy_image((120, 120))
+    best = beyblade_x.encode_image(img, "webp", 10**9)
+    budget = len(best) * 3 // 4
+    assert len(beyblade_x.encode_image(img, "webp", budget)) <= budget
+    # Budget impossibile: la versione più piccola tra quelle provate
+    assert beyblade_x.encode_image(img, "webp", 1) == beyblade_x.encode_image(img, "webp", 0)
+    png8 = beyblade_x.encode_image(img, "png8", 1)
+    assert Image.open(BytesIO(png8)).mode == "P"
+
+def test_render_image_width_and_thumbnails():
+    master, thumbs = beyblade_x.render_image(Image.open(BytesIO(png_bytes(size=(600, 400)))), "webp")
+    assert Image.open(BytesIO(master)).size == (300, 200)
+    assert sorted(thumbs) == sorted(beyblade_x.THUMB_SIZES)
+    assert all(Image.open(BytesIO(data)).size == (s, s) for s, data in thumbs.items())
+
+def test_migrate_images_converts_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(beyblade_x, "IMG_PROCESS_WORKERS", 1)
+    os.makedirs("images")
+    url = "https://wiki/legacy.png"
+    with open(os.path.join("images", ImageStore.legacy_name(url)), "wb") as f:
+        f.write(png_bytes(size=(300, 300)))
+    write_csv(beyblade_x.CSV_FILE, [url])
+    beyblade_x.migrate_images("webp")
+    store = ImageStore()
+    blob = store.urls[url]
+    assert store.format == "webp" and blob.endswith(".webp") and store.has(url)
+    files = sorted(os.listdir("images"))
+    # Seconda esecuzione nello stesso formato: nessuna ricompressione
+    beyblade_x.migrate_images("webp")
+    assert sorted(os.listdir("images")) == files and ImageStore().urls[url] == blob
+
+# =========================
+# PULIZIA DI IMAGES/
+# =========================
+@pytest.fixture
+def images(tmp_path):
+    directory = tmp_path / "images"
+    directory.mkdir()
+    return directory
+
+def touch(directory, name):
+    (directory / name).write_bytes(b"x")
+
+def test_add_blob_deduplicates_identical_images(images):
+    store = ImageStore(str(images))
+    rendered = beyblade_x.render_image(Image.open(BytesIO(png_bytes())), "png")
+    blob = store.add_blob(rendered, "png")
+    assert store.add_blob(rendered, "png") == blob
+    store.record("https://a/1.png", blob)
+    store.record("https://b/copia.png", blob)
+    stem = blob[:-len(".png")]
+    assert sorted(os.listdir(images)) == sorted([blob] + [f"{stem}_{s}.png" for s in beyblade_x.THUMB_SIZES])
+    assert store.has("https://b/copia.png")
+
+def test_conditional_headers_need_the_file_on_disk(images):
+    store = ImageStore(str(images))
+    store.record("https://a/1.png?cb=1", "aaa.webp", {"ETag": '"e1"', "Last-Modified": "Mon, 01 Jan 2024"})
+    assert store.conditional_headers("https://a/1.png?cb=2") == {}
+    touch(images, "aaa.webp")
+    # Il cache-buster non conta: stesso file sul wiki
+    assert store.conditional_headers("https://a/1.png?cb=2") == {
+        "If-None-Match": '"e1"', "If-Modified-Since": "Mon, 01 Jan 2024"}
+    store.save()
+    assert ImageStore(str(images)).conditional_headers("https://a/1.png") == {
+        "If-None-Match": '"e1"', "If-Modified-Since": "Mon, 01 Jan 2024"}
+
+def test_gc_removes_only_unreferenced(images):
+    store = ImageStore(str(images))
+    store.record("https://a/1.png", "aaa.webp", {"ETag": "1"})
+    store.record("https://a/2.png", "bbb.webp", {"ETag": "2"})
+    for name in ("aaa.webp", "aaa_80.webp", "bbb.webp", "bbb_80.webp", "orfano.png"):
+        touch(images, name)
+    assert store.gc({"https://a/1.png"}) == 3
+    assert sorted(os.listdir(images)) == ["aaa.webp", "aaa_80.webp"]
+    assert list(store.urls) == ["https://a/1.png"]
+    assert [s["blob"] for s in store.sources.values()] == ["aaa.webp"]
+
+def test_gc_keeps_legacy_files_of_referenced_urls(images):
+    store = ImageStore(str(images))
+    url, old = "https://a/legacy.png", "https://a/vecchio.png"
+    touch(images, ImageStore.legacy_name(url))
+    touch(images, ImageStore.legacy_name(old))
+    assert store.gc({url}) == 1
+    assert os.listdir(images) == [ImageStore.legacy_name(url)]
+
+# =========================
+# SINCRONIZZAZIONE CON ERRORI
+# =========================
+def write_csv(path, urls):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=["name", "blade_image"])
+        w.writeheader()
+        for i, url in enumerate(urls): w.writerow({"name": f"Bey {i}", "blade_image": url})
+
+def test_sync_errors_skip_gc(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(beyblade_x, "IMG_PROCESS_WORKERS", 1)
+    legacy_url, new_url = "https://wiki/legacy.png", "https://wiki/nuova.png"
+    os.makedirs("images")
+    with open(os.path.join("images", ImageStore.legacy_name(legacy_url)), "wb") as f:
+        f.write(png_bytes())
+    touch(tmp_path / "images", "orfano.png")
+    write_csv(beyblade_x.CSV_FILE, [legacy_url, new_url])
+
+    def broken(url, headers=None):
+        raise ConnectionError(url)
+    monkeypatch.setattr(beyblade_x, "download_image", broken)
+    beyblade_x.download_and_optimize_images()
+    # Download fallito: il file orfano resta, il file del vecchio schema è stato convertito
+    store = ImageStore()
+    assert os.path.exists(os.path.join("images", "orfano.png"))
+    assert store.has(legacy_url) and not store.has(new_url)
+
+    monkeypatch.setattr(beyblade_x, "download_image",
+                        lambda url, headers=None: (200, png_bytes((0, 0, 200, 255)), {"ETag": "e"}, 0.0))
+    beyblade_x.download_and_optimize_images()
+    store = ImageStore()
+    assert store.has(legacy_url) and store.has(new_url)
+    assert not os.path.exists(os.path.join("images", "orfano.png"))
+
+def test_sync_bounds_images_in_flight(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(beyblade_x, "IMG_PROCESS_WORKERS", 1)
+    monkeypatch.setattr(beyblade_x, "IMG_QUEUE_SIZE", 3)
+    urls = [f"https://wiki/{i}.png" for i in range(12)]
+    legacy_url = "https://wiki/legacy.png"
+    os.makedirs("images")
+    with open(os.path.join("images", ImageStore.legacy_name(legacy_url)), "wb") as f:
+        f.write(png_bytes())
+    write_csv(beyblade_x.CSV_FILE, urls + [legacy_url])
+
+    # Immagini scaricate (o in conversione) e non ancora salvate nell'archivio
+    counts = {"started": 0, "saved": 0, "peak": 0}
+    def download(url, headers=None):
+        counts["started"] += 1
+        counts["peak"] = max(counts["peak"], counts["started"] - counts["saved"])
+        return 200, png_bytes((len(url), 0, 0, 255)), {}, 0.0
+    record = ImageStore.record
+    def saved(self, url, blob, headers=None):
+        counts["saved"] += 1
+        record(self, url, blob, headers)
+    monkeypatch.setattr(beyblade_x, "download_image", download)
+    monkeypatch.setattr(ImageStore, "record", saved)
+    beyblade_x.download_and_optimize_images()
+    assert counts["started"] == 12 and counts["saved"] == 12
+    assert counts["peak"] <= 3
+    assert ImageStore().has(legacy_url)
+
+# =========================
+# MANIFEST INCREMENTALE
+# =========================
+def row_for(title):
+    return dict({f: "n/a" for f in beyblade_x.FIELDS}, name=title)
+
+@pytest.fixture
+def wiki(tmp_path, monkeypatch):
+    """Wiki finta: revisioni modificabili dal test, elenco dei titoli riscaricati a ogni giro."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(beyblade_x, "component_cache", beyblade_x.ComponentCache(str(tmp_path / "componenti.json")))
+    state = {"revids": {}, "scraped": []}
+    monkeypatch.setattr(beyblade_x, "get_beyblade_infobox_pages", lambda: list(state["revids"]))
+    monkeypatch.setattr(beyblade_x, "get_page_info",
+                        lambda titles: {t: {"revid": state["revids"][t]} for t in titles})
+    def scrape(titles, info):
+        state["scraped"].append(list(titles))
+        return {t: row_for(t) for t in titles if not t.startswith("Set")}
+    monkeypatch.setattr(beyblade_x, "scrape_titles", scrape)
+    return state
+
+def csv_names():
+    return list(beyblade_x.load_csv_rows())
+
+def test_incremental_refetches_only_changed_pages(wiki):
+    wiki["revids"] = {"A": 1, "B": 1, "Set X": 1}
+    beyblade_x.create_csv(incremental=True)
+    assert wiki["scraped"] == [["A", "B", "Set X"]]
+    assert csv_names() == ["A", "B"]
+    assert beyblade_x.load_manifest()["Set X"] == {"revid": 1, "keep": False}
+
+    wiki["revids"] = {"A": 1, "B": 2, "Set X": 1, "C": 1}
+    beyblade_x.create_csv(incremental=True)
+    assert wiki["scraped"][-1] == ["B", "C"]
+    assert csv_names() == ["A", "B", "C"]
+
+def test_incremental_no_changes_leaves_files_untouched(wiki):
+    wiki["revids"] = {"A": 1, "B": 1}
+    beyblade_x.create_csv()
+    before = (os.path.getmtime(beyblade_x.CSV_FILE), open(beyblade_x.MANIFEST_FILE).read())
+    beyblade_x.create_csv(incremental=True)
+    assert len(wiki["scraped"]) == 1
+    assert (os.path.getmtime(beyblade_x.CSV_FILE), open(beyblade_x.MANIFEST_FILE).read()) == before
+
+def test_incremental_drops_deleted_and_restores_missing_rows(wiki):
+    wiki["revids"] = {"A": 1, "B": 1, "C": 1}
+    beyblade_x.create_csv()
+    # Una riga sparita dal CSV viene riscaricata anche se la revisione è la stessa
+    rows = beyblade_x.load_csv_rows()
+    del rows["A"]
+    beyblade_x.write_csv(rows.values())
+    del wiki["revids"]["C"]
+    beyblade_x.create_csv(incremental=True)
+    assert wiki["scraped"][-1] == ["A"]
+    assert csv_names() == ["A", "B"]
+    assert sorted(beyblade_x.load_manifest()) == ["A", "B"]
+
+# =========================
+# CACHE DELLE COMPONENTI
+# =========================
+def test_component_cache_skips_failures_and_persists(tmp_path):
+    path = str(tmp_path / "componenti.json")
+    cache = beyblade_x.ComponentCache(path)
+    cache.put("blade", "Dran", "Blade - Dran", "https://img/dran.png")
+    cache.put("blade", "Ignota", "n/a", "n/a")
+    assert ("blade", "Dran") in cache and ("blade", "Ignota") not in cache
+    cache.save()
+    assert beyblade_x.ComponentCache(path).get("blade", "Dran")["image"] == "https://img/dran.png"
+
+def test_component_cache_expires_and_trims(tmp_path):
+    path = str(tmp_path / "componenti.json")
+    cache = beyblade_x.ComponentCache(path, ttl=100, max_entries=2)
+    for i, age in enumerate((10, 20, 30, 500)):
+        cache.put("bit", f"B{i}", f"Bit - B{i}", "n/a")
+        cache.entries[f"bit|B{i}"]["ts"] -= age
+    cache.save()
+    # Oltre il limite restano le due più recenti, e al caricamento si scartano le scadute
+    assert sorted(cache.entries) == ["bit|B0", "bit|B1"]
+    cache = beyblade_x.ComponentCache(path, ttl=15, max_entries=2)
+    assert list(cache.entries) == ["bit|B0"]
+
+def test_component_cache_refresh_ignores_older_entries(tmp_path):
+    cache = beyblade_x.ComponentCache(str(tmp_path / "componenti.json"))
+    cache.put("ratchet", "3-60", "Ratchet - 3-60", "n/a")
+    cache.entries["ratchet|3-60"]["ts"] -= 1
+    cache.refresh()
+    assert cache.get("ratchet", "3-60") is None
+    cache.put("ratchet", "3-60", "Ratchet - 3-60", "https://img/360.png")
+    assert cache.get("ratchet", "3-60")["image"] == "https://img/360.png"
+
+def test_fill_images_resolves_each_component_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(beyblade_x, "component_cache", beyblade_x.ComponentCache(str(tmp_path / "componenti.json")))
+    resolved = []
+    def resolve(titles):
+        resolved.extend(titles)
+        return {t: t for t in titles}
+    monkeypatch.setattr(beyblade_x, "resolve_component_pages", resolve)
+    monkeypatch.setattr(beyblade_x, "get_infobox_images", lambda pages: {p: f"https://img/{p}" for p in pages})
+    monkeypatch.setattr(beyblade_x, "get_pageimages", lambda titles: {})
+    comp = next(iter(beyblade_x.COMPONENTS))
+    rows = [dict(row_for(f"Bey {i}"), **{comp: "Dran"}) for i in range(3)]
+    beyblade_x.fill_images(rows)
+    beyblade_x.fill_images([dict(row_for("Bey 9"), **{comp: "Dran"})])
+    assert len(resolved) == 1
+    assert beyblade_x.component_cache.hits == 3 and beyblade_x.component_cache.misses == 1
+    assert all(row[f"{comp}_image"] == f"https://img/{resolved[0]}" for row in rows)
+
+# =========================
+# SCRITTURA ATOMICA E CHECKPOINT
+# =========================
+def test_atomic_open_keeps_original_on_error(tmp_path):
+    path = str(tmp_path / "dati.csv")
+    with beyblade_x.atomic_open(path) as f: f.write("vecchio")
+    with pytest.raises(RuntimeError):
+        with beyblade_x.atomic_open(path) as f:
+            f.write("nuovo a metà")
+            raise RuntimeError
+    assert open(path).read() == "vecchio"
+    assert os.listdir(tmp_path) == ["dati.csv"]
+
+def test_checkpoint_ignores_truncated_last_line(tmp_path, monkeypatch):
+    monkeypatch.setattr(beyblade_x, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(beyblade_x, "CHECKPOINT_FILE", str(tmp_path / "checkpoint.jsonl"))
+    beyblade_x.append_checkpoint([{"title": "A", "revid": 1, "row": None}])
+    beyblade_x.append_checkpoint([{"title": "B", "revid": 2, "row": {"name": "B"}}])
+    with open(beyblade_x.CHECKPOINT_FILE, "a") as f: f.write('{"title": "C", "re')
+    assert sorted(beyblade_x.load_checkpoint()) == ["A", "B"]
+    beyblade_x.clear_checkpoint()
+    assert beyblade_x.load_checkpoint() == {}
+
+def test_scrape_titles_resumes_from_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(beyblade_x, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(beyblade_x, "CHECKPOINT_FILE", str(tmp_path / "checkpoint.jsonl"))
+    monkeypatch.setattr(beyblade_x, "CHECKPOINT_EVERY", 2)
+    monkeypatch.setattr(beyblade_x, "component_cache", beyblade_x.ComponentCache(str(tmp_path / "componenti.json")))
+    monkeypatch.setattr(beyblade_x, "fill_images", lambda rows: None)
+    fetched = []
+    def get_wikitexts(titles):
+        if "D" in titles and not fetched.count("stop"):
+            fetched.append("stop")
+            raise ConnectionError
+        fetched.extend(titles)
+        return {t: t for t in titles}
+    monkeypatch.setattr(beyblade_x, "get_wikitexts", get_wikitexts)
+    monkeypatch.setattr(beyblade_x, "parse_title", lambda t, text, idx, total: row_for(t))
+    titles = ["A", "B", "C", "D"]
+    info = {t: {"revid": 1} for t in titles}
+    with pytest.raises(ConnectionError):
+        beyblade_x.scrape_titles(titles, info)
+    # Al secondo giro "B" è cambiata: si riscarica insieme alle pagine non ancora salvate
+    info["B"] = {"revid": 2}
+    rows = beyblade_x.scrape_titles(titles, info)
+    assert fetched == ["A", "B", "stop", "B", "C", "D"]
+    assert list(rows) == titles
+
+# =========================
+# FOGLIO SPRITE
+# =========================
+def test_sprite_sheet_positions_and_stale_sheets(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(beyblade_x, "SPRITE_COLUMNS", 2)
+    os.makedirs("images")
+    store = ImageStore()
+    urls = [f"https://wiki/{i}.png" for i in range(3)]
+    for i, url in enumerate(urls[:2]):
+        img = Image.open(BytesIO(png_bytes((i * 100, 0, 0, 255))))
+        store.record(url, store.add_blob(beyblade_x.render_image(img, beyblade_x.IMG_FORMAT)))
+    store.save()
+    # Il terzo è un file del vecchio schema, senza miniature pre-generate
+    with open(os.path.join("images", ImageStore.legacy_name(urls[2])), "wb") as f:
+        f.write(png_bytes(size=(300, 300)))
+    write_csv(beyblade_x.CSV_FILE, urls + ["n/a"])
+    os.makedirs("static")
+    touch(tmp_path / "static", "sprites_80_vecchio.webp")
+
+    beyblade_x.build_sprite_sheet()
+    with open(os.path.join("static", "sprites_80.json"), encoding="utf-8") as f:
+        index = json.load(f)
+    assert index["tiles"] == {urls[0]: [0, 0], urls[1]: [80, 0], urls[2]: [0, 80]}
+    assert sorted(os.listdir("static")) == sorted([index["file"], "sprites_80.json"])
+    with Image.open(os.path.join("static", index["file"])) as sheet:
+        assert sheet.size == (index["width"], index["height"]) == (160, 160)
@@ -0,0 +1,115 @@
+import os
+import csv
+import sys
+import pickle
+import subprocess
+
+import pytest
+
+import catalogo
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def row(name, blade="", ratchet="", bit=""):
+    return {"name": name, "blade": blade, "ratchet": ratchet, "bit": bit}
+
+@pytest.fixture
+def index():
+    return catalogo.SearchIndex([
+        row("DranBuster 1-60A", "DranBuster", "1-60", "Accel"),
+        row("DranSword 3-60F", "DranSword", "3-60", "Flat"),
+        row("HellsScythe 4-60T", "HellsScythe", "4-60", "Taper"),
+        row("WizardRod 5-70DB", "WizardRod", "5-70", "Disk Ball"),
+        row("SharkEdge 3-80GB", "SharkEdge", "3-80", "Gear Ball"),
+    ])
+
+@pytest.fixture(scope="module")
+def real_index():
+    with open(os.path.join(ROOT, catalogo.CSV_FILE), "r", encoding="utf-8") as f:
+        return catalogo.SearchIndex(list(csv.DictReader(f)))
+
+def names(index, hits):
+    return [index.names[d] for d in hits]
+
+def test_tokenize_splits_camel_case_and_codes():
+    assert catalogo.tokenize("DranBuster 2-60HN") == ["dranbuster", "dran", "buster", "2-60hn", "260hn", "2", "60", "hn"]
+
+def test_exact_and_prefix(index):
+    assert names(index, index.search("dran")) == ["DranBuster 1-60A", "DranSword 3-60F"]
+    assert names(index, index.search("hells")) == ["HellsScythe 4-60T"]
+    assert names(index, index.search("disk ball")) == ["WizardRod 5-70DB"]
+
+def test_fuzzy_only_for_typos(index):
+    assert names(index, index.search("dranbustr")) == ["DranBuster 1-60A"]
+    assert names(index, index.search("wizrdrod")) == ["WizardRod 5-70DB"]
+
+def test_codes_with_digits_are_not_fuzzy(index):
+    assert names(index, index.search("3-60")) == ["DranSword 3-60F"]
+    assert index.search("3-70") == []
+
+def test_fuzzy_skipped_when_prefix_matches(index):
+    # "shark" è un prefisso: niente corrispondenze approssimate aggiunte
+    assert set(index._matches("shark")) == {"shark", "sharkedge"}
+
+def test_ratchet_codes_on_real_catalog(real_index):
+    # Solo le righe che hanno davvero quel codice (o un token che inizia così), non ogni "X-60"
+    for code in ("3-60", "4-80"):
+        hits = real_index.search(code)
+        allowed = set()
+        for tok, docs in real_index.postings.items():
+            if tok.startswith(code): allowed.update(docs)
+        assert hits and set(hits) == allowed
+
+def test_state_round_trip(index):
+    state = pickle.loads(pickle.dumps(index.to_state(), protocol=catalogo.PICKLE_PROTOCOL))
+    restored = catalogo.SearchIndex.from_state(state)
+    for q in ("dran", "dranbustr", "3-60", "gear ball"):
+        assert restored.search(q) == index.search(q)
+
+def test_write_catalog_skips_unchanged_csv(tmp_path):
+    src = os.path.join(ROOT, catalogo.CSV_FILE)
+    path = tmp_path / "catalogo.pkl"
+    assert catalogo.write_catalog(src, str(path))
+    first = path.read_bytes()
+    assert not catalogo.write_catalog(src, str(path))
+    assert path.read_bytes() == first
+    catalog, origine = catalogo.load_catalog(src, str(path))
+    assert origine == str(path) and catalog["version"] == catalogo.CATALOG_VERSION
+
+def test_catalog_bytes_do_not_depend_on_hash_seed(tmp_path):
+    # L'artefatto è versionato: due giri sullo stesso CSV devono dare gli stessi byte
+    src = os.path.join(ROOT, catalogo.CSV_FILE)
+    outputs = []
+    for seed in ("1", "2"):
+        path = tmp_path / f"catalogo_{seed}.pkl"
+        code = f"import catalogo; catalogo.write_catalog({src!r}, {str(path)!r})"
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+        outputs.append(path.read_bytes())
+    assert outputs[0] == outputs[1]
+
+def test_build_catalog_options_and_images():
+    raw = ("name,blade,blade_image,ratchet,ratchet_image\n"
+           "A,Dran,https://img/dran.png,3-60,n/a\n"
+           "B,Wizard,N/A,3-60,https://img/360.png\n"
+           "C,n/a,,1-60,\n").encode("utf-8")
+    catalog = catalogo.build_catalog(raw)
+    assert catalog["columns"]["blade"] == ["Dran", "Wizard", ""]
+    assert catalog["theory_opts"]["blade"] == ["-", "Dran", "Wizard"]
+    assert catalog["theory_opts"]["ratchet"] == ["-", "1-60", "3-60"]
+    assert catalog["img_map"] == {"Dran": "https://img/dran.png", "3-60": "https://img/360.png"}
+
+def test_load_catalog_falls_back_to_csv(tmp_path):
+    src = tmp_path / "beyblade_x.csv"
+    src.write_text("name,blade\nA,Dran\n", encoding="utf-8")
+    path = tmp_path / "catalogo.pkl"
+    path.write_bytes(b"non un pickle")
+    catalog, origine = catalogo.load_catalog(str(src), str(path))
+    assert origine == str(src) and catalog["columns"]["name"] == ["A"]
+    assert catalogo.write_catalog(str(src), str(path))
+    assert catalogo.load_catalog(str(src), str(path))[1] == str(path)
+    # CSV cambiato: l'artefatto non vale più
+    src.write_text("name,blade\nB,Dran\n", encoding="utf-8")
+    catalog, origine = catalogo.load_catalog(str(src), str(path))
+    assert origine == str(src) and catalog["columns"]["name"] == ["B"]
+    assert catalogo.load_catalog(str(tmp_path / "manca.csv"), str(path)) == (None, None)
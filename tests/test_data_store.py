@@ -0,0 +1,228 @@
+import base64
+import hashlib
+
+from data_store import NO_BASE, DataStore, GitHubFiles, decode_file, encode_file, merge_json
+
+# =========================
+# REPOSITORY GITHUB FINTO
+# =========================
+class Response:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        if self.status_code >= 400: raise RuntimeError(self.status_code)
+
+class FakeRepo:
+    """Contents API in memoria: GET con ETag, PUT che rifiuta (409) uno sha non aggiornato."""
+
+    def __init__(self):
+        self.files = {}   # percorso -> testo
+
+    def session(self):
+        return FakeSession(self)
+
+    @staticmethod
+    def sha(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def content(self, path):
+        return decode_file(path, self.files[path])
+
+    def set(self, path, data):
+        self.files[path] = encode_file(path, data)
+
+class FakeSession:
+    def __init__(self, repo):
+        self.repo = repo
+
+    def get(self, url, headers=None, timeout=None):
+        path = url.split("/contents/", 1)[1]
+        if path not in self.repo.files: return Response(404)
+        sha = self.repo.sha(self.repo.files[path])
+        if (headers or {}).get("If-None-Match") == sha: return Response(304)
+        raw = base64.b64encode(self.repo.files[path].encode("utf-8")).decode("utf-8")
+        return Response(200, {"content": raw, "sha": sha}, {"ETag": sha})
+
+    def put(self, url, json=None, timeout=None):
+        path = url.split("/contents/", 1)[1]
+        current = self.repo.files.get(path)
+        if current is not None and json.get("sha") != self.repo.sha(current): return Response(409)
+        self.repo.files[path] = base64.b64decode(json["content"]).decode("utf-8")
+        return Response(200, {"content": {"sha": self.repo.sha(self.repo.files[path])}})
+
+def client(repo, files=None):
+    github = GitHubFiles("token", "owner/repo", files or {})
+    github.session = repo.session()
+    return github
+
+def store_for(github, directory, files=None):
+    # Invio solo con flush() esplicito: il timer non scatta durante il test
+    return DataStore(github.read, github.write, files or {}, directory=str(directory), delay=3600)
+
+# =========================
+# FUSIONE A TRE VIE
+# =========================
+def test_merge_json_keeps_both_sides():
+    base = {"a": 1, "b": {"x": 1}}
+    local = {"a": 2, "b": {"x": 1}, "c": 3}
+    remote = {"a": 1, "b": {"x": 1, "y": 2}}
+    assert merge_json(base, local, remote) == {"a": 2, "b": {"x": 1, "y": 2}, "c": 3}
+
+def test_merge_json_deletions():
+    base = {"a": 1, "b": 2}
+    assert merge_json(base, {"a": 1}, {"a": 1, "b": 2, "c": 3}) == {"a": 1, "c": 3}
+    assert merge_json(base, {"a": 1, "b": 2, "c": 3}, {"b": 2}) == {"b": 2, "c": 3}
+
+def test_merge_json_appended_lists():
+    assert merge_json([1], [1, "a"], [1, "b"]) == [1, "b", "a"]
+    # Liste riscritte (non solo allungate): vince la versione locale
+    assert merge_json([1, 2], [2], [1, 2, 3]) == [2]
+
+def test_merge_json_conflict_prefers_local():
+    assert merge_json(1, 2, 3) == 2
+    assert merge_json(None, "locale", "remoto") == "locale"
+
+# =========================
+# SCRITTURE CONCORRENTI
+# =========================
+def test_write_merges_and_returns_written_content():
+    repo = FakeRepo()
+    repo.set("inventario.json", {"r": 1})
+    a, b = client(repo), client(repo)
+    assert a.read("inventario.json") == {"r": 1}
+    assert b.write("inventario.json", {"r": 1, "b": 1}) == {"r": 1, "b": 1}
+    written = a.write("inventario.json", {"r": 1, "a": 1})
+    assert written == {"r": 1, "a": 1, "b": 1}
+    assert repo.content("inventario.json") == written
+
+def test_interleaved_writers_do_not_lose_changes(tmp_path):
+    repo = FakeRepo()
+    repo.set("decks.json", {"r1": 1})
+    files = {"decks": "decks.json"}
+    a = store_for(client(repo, files), tmp_path / "a", files)
+    b = store_for(client(repo, files), tmp_path / "b", files)
+
+    data_a, data_b = a.get("decks"), b.get("decks")
+    b.put("decks", dict(data_b, b1=1))
+    assert b.flush()
+    a.put("decks", dict(data_a, a1=1))
+    assert a.flush()
+    # L'archivio adotta il contenuto fuso: il salvataggio successivo non cancella b1
+    assert a.get("decks") == {"r1": 1, "b1": 1, "a1": 1}
+    a.put("decks", dict(a.get("decks"), a2=1))
+    assert a.flush()
+    assert repo.content("decks.json") == {"r1": 1, "b1": 1, "a1": 1, "a2": 1}
+
+def test_local_write_during_push_is_rebased(tmp_path):
+    repo = FakeRepo()
+    repo.set("decks.json", {"r1": 1})
+    files = {"decks": "decks.json"}
+    github = client(repo, files)
+    other = client(repo, files)
+    store = None
+
+    def push(key, data, base):
+        # Un altro scrittore e una nuova scrittura locale arrivano mentre l'invio è in corso
+        if "late" not in store.data[key]:
+            other.write(key, dict(other.read(key), b1=1))
+            store.put(key, dict(data, late=1))
+        return github.write(key, data, base)
+
+    store = DataStore(github.read, push, files, directory=str(tmp_path), delay=3600)
+    store.put("decks", dict(store.get("decks"), a1=1))
+    assert not store.flush()                  # la scrittura tardiva resta da inviare
+    assert store.get("decks") == {"r1": 1, "b1": 1, "a1": 1, "late": 1}
+    assert store.flush()
+    assert repo.content("decks.json") == {"r1": 1, "b1": 1, "a1": 1, "late": 1}
+
+def test_journal_replay_merges_with_remote(tmp_path):
+    repo = FakeRepo()
+    repo.set("inventario.json", {"r1": 1})
+    files = {"inv": "inventario.json"}
+    store = store_for(client(repo, files), tmp_path, files)
+    store.put("inv", dict(store.get("inv"), a1=1))
+    # Riavvio prima dell'invio; nel frattempo un altro scrittore modifica il file
+    repo.set("inventario.json", {"r1": 1, "b1": 1})
+    restarted = store_for(client(repo, files), tmp_path, files)
+    assert restarted.flush()
+    assert repo.content("inventario.json") == {"r1": 1, "b1": 1, "a1": 1}
+    assert restarted.get("inv") == {"r1": 1, "b1": 1, "a1": 1}
+
+def test_failed_push_stays_pending(tmp_path):
+    store = DataStore(lambda key: {}, lambda key, data, base: False, {}, directory=str(tmp_path), delay=3600)
+    store.put("inv", {"a": 1})
+    assert not store.flush()
+    assert store.pending == 1 and store.last_error
+    store.timer.cancel()
+
+def test_write_without_base_keeps_old_behaviour():
+    repo = FakeRepo()
+    github = client(repo)
+    assert github.write("nuovo.json", {"a": 1}, NO_BASE) == {"a": 1}
+    assert repo.content("nuovo.json") == {"a": 1}
+
+# =========================
+# ARCHIVIO LOCALE CON INVIO DIFFERITO
+# =========================
+class Remote:
+    """fetch/push in memoria che contano le chiamate."""
+
+    def __init__(self, **files):
+        self.files = files
+        self.fetches = []
+        self.pushes = []
+
+    def fetch(self, key):
+        self.fetches.append(key)
+        return self.files.get(key, {})
+
+    def push(self, key, data, base):
+        self.pushes.append(key)
+        self.files[key] = data
+        return data
+
+def test_writes_are_batched_into_one_push(tmp_path):
+    remote = Remote(inv={"blade": {}})
+    store = DataStore(remote.fetch, remote.push, {}, directory=str(tmp_path), delay=3600)
+    for i in range(5):
+        inv = store.get("inv")
+        inv["blade"][f"B{i}"] = 1
+        store.put("inv", inv)
+    assert remote.fetches == ["inv"] and remote.pushes == [] and store.pending == 1
+    assert store.flush() and remote.pushes == ["inv"]
+    assert len(remote.files["inv"]["blade"]) == 5 and store.last_error is None
+
+def test_get_returns_a_copy(tmp_path):
+    remote = Remote(inv={"blade": {"Dran": 1}})
+    store = DataStore(remote.fetch, remote.push, {}, directory=str(tmp_path), delay=3600)
+    store.get("inv")["blade"]["Dran"] = 99
+    assert store.get("inv") == {"blade": {"Dran": 1}}
+
+def test_pending_writes_survive_restart(tmp_path):
+    remote = Remote()
+    store = DataStore(remote.fetch, remote.push, {"inv": "inventario.json"}, directory=str(tmp_path), delay=3600)
+    store.put("inv", {"blade": {"Dran": 1}})
+    store.timer.cancel()
+    assert remote.pushes == []
+    # Riavvio prima dell'invio: il nuovo archivio riparte dal journal (e lo invia subito)
+    restarted = DataStore(remote.fetch, remote.push, {"inv": "inventario.json"}, directory=str(tmp_path), delay=3600)
+    assert restarted.get("inv") == {"blade": {"Dran": 1}}
+    assert restarted.flush() and remote.pushes == ["inv"] and remote.fetches == []
+    assert remote.files["inv"] == {"blade": {"Dran": 1}}
+
+def test_refresh_keeps_unsent_changes(tmp_path):
+    remote = Remote(a={"x": 1}, b={"y": 1})
+    store = DataStore(remote.fetch, remote.push, {}, directory=str(tmp_path), delay=3600)
+    store.get("a")
+    store.put("b", {"y": 2})
+    version = store.version("b")
+    store.refresh()
+    assert store.keys() == ["b"] and store.version("a") is None and store.version("b") == version
+    remote.files["a"] = {"x": 2}
+    assert store.get("a") == {"x": 2} and store.get("b") == {"y": 2}
@@ -0,0 +1,95 @@
+import re
+
+import pytest
+
+import infobox_parser as ip
+
+def legacy_codes(text):
+    # Lettura di ProductCode/System dello script originale: prima occorrenza nell'intera pagina
+    m = re.search(r"\|\s*ProductCode\s*=\s*([^\n|]+)", text)
+    s = re.search(r"\|\s*System\s*=\s*([^\n|]+)", text)
+    return ip._legacy_clean_value(m.group(1)) if m else "", ip._legacy_clean_value(s.group(1)) if s else ""
+
+PAGE = """{{Beyblade Infobox
+|name = DranSword 3-60F
+|image = {{Tabber
+|Box = {{Img|DranSword box.png|[[Takara Tomy]]}}
+|Toy = DranSword.png
+}}
+|ProductCode = BX-01<ref>{{Cite web|url=https://x|title=[[Catalogo]]}}</ref>
+|System = [[Beyblade X (System)|BX]]
+|Blade = [[Blade - DranSword|DranSword]] {{Nihongo|DranSword|ドランソード}}
+|Ratchet = [[Ratchet - 3-60|3-60]]
+|Bit = [[Bit - Flat|Flat]]<ref name="a"/>
+}}
+'''DranSword''' is a Beyblade.
+"""
+
+def test_parse_infobox_handles_nesting():
+    fields = ip.parse_infobox(PAGE)
+    assert list(fields) == ["name", "image", "ProductCode", "System", "Blade", "Ratchet", "Bit"]
+    assert fields["image"].startswith("{{Tabber") and fields["image"].endswith("}}")
+    assert ip.clean_value(fields["Blade"]) == "DranSword"
+    assert ip.clean_value(fields["Ratchet"]) == "3-60"
+    assert ip.clean_value(fields["Bit"]) == "Flat"
+
+def test_parse_infobox_deep_nesting_uses_token_path():
+    text = "{{Beyblade Infobox\n|Blade = {{a|{{b|{{c|{{d|x}}}}}}}} [[Blade - Y|Y]]\n|Bit = Ball\n}}"
+    fields = ip.parse_infobox(text)
+    assert ip.clean_value(fields["Blade"]) == "Y"
+    assert fields["Bit"] == "Ball"
+
+def test_parse_infobox_missing_or_unclosed():
+    assert ip.parse_infobox("") == {}
+    assert ip.parse_infobox("no infobox here") == {}
+    assert ip.parse_infobox("{{Beyblade Infobox\n|Bit = Ball\n|Ratchet = 1-60") == {"Bit": "Ball", "Ratchet": "1-60"}
+
+@pytest.mark.parametrize("text", [
+    PAGE,
+    # Codici prima dell'infobox, annidati in un parametro, dopo l'infobox, assenti
+    "|ProductCode = UX-99\n" + PAGE,
+    PAGE.replace("|name = DranSword 3-60F", "|name = {{x|System=Burst}}"),
+    PAGE.replace("|System = [[Beyblade X (System)|BX]]\n", "") + "\n|System = CX\n",
+    PAGE.replace("|ProductCode", "|Code"),
+    "{{Beyblade Infobox\n|ProductCode =\n|System = BX\n}}\n|ProductCode = BX-02",
+    "no infobox |ProductCode = BX-03 |System = [[UX]]",
+    "",
+])
+def test_parse_page_codes_match_legacy(text):
+    _, p_code, system = ip.parse_page(text)
+    assert (p_code, system) == legacy_codes(text)
+
+def test_parse_page_on_synthetic_corpus():
+    keys = ["Blade", "MainBlade", "LockChip", "Ratchet", "Bit"]
+    for text in ip.synthetic_corpus():
+        old, new = ip._legacy_page(text, keys), ip._new_page(text, keys)
+        assert old[:3] == new[:3]
+        assert all(v != "n/a" for k, v in zip(keys, new[3]) if f"|{k} =" in text)
+
+def test_clean_value():
+    assert ip.clean_value("") == "n/a"
+    assert ip.clean_value("  Flat ") == "Flat"
+    assert ip.clean_value("{{Nihongo|a|b}}") == "n/a"
+    assert ip.clean_value("[[Bit - Flat|Flat]] {{x|{{y}}}}<ref>nota</ref>") == "Flat"
+
+def test_is_x_system():
+    assert ip.is_x_system("BX-01", "")
+    assert ip.is_x_system("", "Custom Line")
+    assert not ip.is_x_system("B-100", "Burst")
+
+def test_find_image_filename():
+    assert ip.find_image_filename("{{Part\n|image = Flat.png\n}} [[File:Other.png]]") == "Flat.png"
+    assert ip.find_image_filename("text [[File: Bit Flat.png|thumb]]") == "Bit Flat.png"
+    assert ip.find_image_filename("") is None
+
+def test_load_corpus_prefers_cassette_pages(tmp_path):
+    import json
+    cassette = tmp_path / "cassetta"
+    cassette.mkdir()
+    body = {"query": {"pages": {"1": {"title": "Bey", "revisions": [{"slots": {"main": {"*": PAGE}}}]}}}}
+    (cassette / "a.json").write_text(json.dumps({"url": "api", "params": {"prop": "revisions"}, "status": 200}))
+    (cassette / "a.bin").write_bytes(json.dumps(body).encode())
+    (cassette / "b.json").write_text(json.dumps({"url": "api", "params": {"prop": "info"}, "status": 200}))
+    (cassette / "b.bin").write_bytes(b"{}")
+    corpus, source = ip.load_corpus(str(tmp_path / "wikitext"), str(cassette))
+    assert corpus == [PAGE] and "cassetta" in source
@@ -0,0 +1,116 @@
+import os
+from datetime import date
+
+import pandas as pd
+
+import match_log
+from data_store import DataStore
+from test_data_store import FakeRepo, client, store_for
+
+def record(day, g1="Antonio", g2="Andrea", s1=3, s2=-3, bey1="A", bey2="B"):
+    return {"Data": day, "NomeGiocatore1": g1, "BeyG1": bey1, "NomeGiocatore2": g2, "BeyG2": bey2,
+            "PunteggioBeyG1": s1, "PunteggioBeyG2": s2}
+
+# =========================
+# SHARD MENSILI
+# =========================
+def test_shard_for_both_date_formats():
+    assert match_log.shard_for(record("05/04/2026")) == "match_log/2026-04.jsonl"
+    assert match_log.shard_for(record("2026-05-01 10:00:00")) == "match_log/2026-05.jsonl"
+    assert match_log.shard_for(record("boh")) == "match_log/0001-01.jsonl"
+    assert match_log.shard_month("match_log/2026-04.jsonl") == date(2026, 4, 1)
+    assert match_log.shard_month("match_log/altro.jsonl") is None
+
+def test_append_and_iter_log(tmp_path):
+    records = [record("30/04/2026"), record("01/05/2026"), record("02/05/2026")]
+    shards = match_log.append(records, str(tmp_path))
+    assert [p.rsplit("/", 1)[1] for p in shards] == ["2026-04.jsonl", "2026-05.jsonl"]
+    match_log.append([record("03/05/2026")], str(tmp_path))
+    assert list(match_log.iter_log(str(tmp_path))) == records + [record("03/05/2026")]
+
+def test_two_writers_appending_to_one_shard(tmp_path):
+    repo = FakeRepo()
+    shard = match_log.shard_path(date(2026, 5, 1))
+    first = record("01/05/2026")
+    repo.set(shard, [first])
+    a = store_for(client(repo), tmp_path / "a")
+    b = store_for(client(repo), tmp_path / "b")
+
+    rows_a, rows_b = a.get(shard), b.get(shard)
+    mine, theirs = record("02/05/2026", bey1="A1"), record("02/05/2026", bey1="B1")
+    b.put(shard, rows_b + [theirs])
+    assert b.flush()
+    a.put(shard, rows_a + [mine])
+    assert a.flush()
+    # Salvataggio successivo della stessa istanza: il record dell'altra resta nello shard
+    later = record("03/05/2026", bey1="A2")
+    a.put(shard, a.get(shard) + [later])
+    assert a.flush()
+    assert repo.content(shard) == [first, theirs, mine, later]
+
+def test_new_shard_created_by_two_writers(tmp_path):
+    repo = FakeRepo()
+    shard = match_log.shard_path(date(2026, 6, 1))
+    # Come github_action: uno shard che non esiste ancora si legge come lista vuota
+    stores = [DataStore(lambda key, gh=gh: gh.read(key) or [], gh.write, {}, directory=str(tmp_path / name), delay=3600)
+              for name, gh in (("a", client(repo)), ("b", client(repo)))]
+    rows = [s.get(shard) for s in stores]
+    for s, rows_s, r in zip(stores, rows, (record("01/06/2026", bey1="A"), record("01/06/2026", bey1="B"))):
+        s.put(shard, rows_s + [r])
+    assert all(s.flush() for s in stores)
+    assert sorted(r["BeyG1"] for r in repo.content(shard)) == ["A", "B"]
+
+# =========================
+# CLASSIFICA INCREMENTALE
+# =========================
+def test_leaderboard_add_matches_full_rebuild():
+    records = match_log.synthetic_records(500, seed=3)
+    incremental = match_log.Leaderboard(records[:200])
+    incremental.add(records[200:350])
+    incremental.add(records[350:])
+    full = match_log.Leaderboard(records)
+    start, end = date(2025, 3, 1), date(2025, 11, 30)
+    assert incremental.query(start, end) == full.query(start, end)
+    assert incremental.query(start, end, "Fabio") == full.query(start, end, "Fabio")
+
+def test_leaderboard_totals():
+    board = match_log.Leaderboard([record("01/05/2026", s1=3, s2=-3), record("02/05/2026", s1=-1, s2=1)])
+    board.add([record("2026-05-03 12:00:00", bey2="-", s1=2, s2=-2)])
+    totals = board.query(date(2026, 5, 1), date(2026, 5, 31))
+    # [partite, vittorie, punti, punti nelle vittorie]; il bey "-" non compare
+    assert totals == {"A": [3, 2, 4.0, 5.0], "B": [2, 1, -2.0, 1.0]}
+    assert board.query(date(2026, 5, 2), date(2026, 5, 2), "Andrea") == {"B": [1, 1, 1.0, 1.0]}
+    assert board.query(date(2026, 6, 1), date(2026, 6, 30)) == {}
+
+# =========================
+# STORICO TIPIZZATO
+# =========================
+def test_to_frame_types_and_dates():
+    df = match_log.to_frame([record("05/03/2024"), record("2024-03-06 18:30:00", s1="2"), record("boh")])
+    assert [str(d.date()) if not pd.isna(d) else None for d in df["Giorno"]] == ["2024-03-05", "2024-03-06", None]
+    assert df["Giorno"].dtype == "datetime64[ns]"
+    assert df["BeyG1"].dtype == "category" and df["PunteggioBeyG1"].dtype == "int8"
+    assert list(df["PunteggioBeyG1"]) == [3, 2, 3]
+    assert list(df.columns[:len(match_log.COLUMNS)]) == match_log.COLUMNS
+
+def test_frame_version_changes_with_content():
+    records = [record("05/03/2024"), record("06/03/2024")]
+    version = match_log.frame_version(match_log.to_frame(records))
+    assert match_log.frame_version(match_log.to_frame([dict(r) for r in records])) == version
+    records[1]["PunteggioBeyG2"] = 1
+    assert match_log.frame_version(match_log.to_frame(records)) != version
+
+# =========================
+# EXPORT EXCEL
+# =========================
+def test_export_excel_sheets_and_totals(tmp_path):
+    df = match_log.to_frame([record("05/03/2024", s1=100, s2=-100)] * 2 + [record("06/03/2024", g2="Fabio", bey2="C")])
+    path = str(tmp_path / "export" / "storico.xlsx")
+    assert match_log.export_excel(df, path) == path
+    assert os.listdir(tmp_path / "export") == ["storico.xlsx"]
+    sheets = pd.read_excel(path, sheet_name=None)
+    assert list(sheets) == ["match history", "Punteggi Beyblade"] + match_log.EXPORT_PLAYERS
+    assert len(sheets["match history"]) == 3 and len(sheets["Fabio"]) == 1
+    # Somme oltre il limite di int8
+    scores = dict(zip(sheets["Punteggi Beyblade"]["Bey"], sheets["Punteggi Beyblade"]["Score"]))
+    assert scores == {"A": 203, "B": -200, "C": -3}
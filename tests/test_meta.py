@@ -0,0 +1,58 @@
+import pandas as pd
+
+import meta
+from meta import ComboMatrix
+
+# =========================
+# MATRICE COMBO X PEZZI
+# =========================
+def frame(rows):
+    return pd.DataFrame(rows, columns=meta.COMBO_COLUMNS)
+
+def test_owned_parts_normalizes_and_adds_lock_class():
+    inv = {"lock_chip": {"Emperor": 1, "Dran": 1}, "bit": {"Low Orb": 2, "Ball": 0}}
+    assert meta.owned_parts(inv) == {"emperor", "dran", "#metal", "#plastic", "loworb"}
+    assert meta.owned_parts({"lock_chip": {"Valkyrie": 1}}) == {"valkyrie", "#metal"}
+
+def test_missing_counts_and_first_missing_part():
+    df = frame([["Metal", None, "Pegasus", None, "3-60", "LowOrb"],
+                ["Plastic", "Wheel", "Cobalt Drake", "Heavy", "1-60", "Hexa"],
+                [None, None, "Pegasus", None, "3-60", "Ball"]])
+    matrix = ComboMatrix.from_frame(df)
+    inv = {"lock_chip": {"Valkyrie": 1}, "blade": {"Pegasus": 1}, "ratchet": {"3-60": 1}, "bit": {"Low Orb": 1}}
+    owned = matrix.encode(inv)
+    assert list(matrix.missing(owned)) == [0, 6, 1]
+    assert list(matrix.missing_part(owned)) == ["", "Plastic (Lock Chip)", "Ball"]
+    # Inventario vuoto: manca tutto, a partire dal primo pezzo della combo
+    empty = matrix.encode({})
+    assert list(matrix.missing(empty)) == [4, 6, 3]
+    assert list(matrix.missing_part(empty)) == ["Metal (Lock Chip)", "Plastic (Lock Chip)", "Pegasus"]
+
+def test_empty_meta():
+    matrix = ComboMatrix.from_frame(frame([[None] * len(meta.COMBO_COLUMNS)]))
+    owned = matrix.encode({"bit": {"Ball": 1}})
+    assert list(matrix.missing(owned)) == [0] and list(matrix.missing_part(owned)) == [""]
+
+# =========================
+# LETTURA DI META.CSV
+# =========================
+HEADER = ",".join(['"Rank Change"', '"Combo Rank"', '"Points"'] + [f'"{c}"' for c in meta.COMBO_COLUMNS] + ['"Unnamed: 9"'])
+
+def test_read_meta_fixes_mojibake_and_builds_combo(tmp_path):
+    text = HEADER + "\n" + "â¬†ï¸\x8f 2,1,120, ,, Pegasus ,,3-60,LowOrb,\nâ€”,2,x,Metal,,Dran,,1-60,Hexa,\n"
+    path = tmp_path / "meta.csv"
+    path.write_bytes(text.encode("utf-8"))
+    df = meta.read_meta(str(path))
+    assert list(df["Rank Change"]) == ["⬆️ 2", "—"]
+    assert list(df["Combo"]) == ["Pegasus 3-60 LowOrb", "Metal Dran 1-60 Hexa"]
+    assert df["Points"].isna().tolist() == [False, True] and df["Combo Rank"].tolist() == [1, 2]
+    assert "Unnamed: 9" not in df.columns
+    assert pd.isna(df.loc[0, meta.COMBO_COLUMNS[0]])
+
+def test_read_meta_latin1_and_bom(tmp_path):
+    row = "-,1,10,Plastic,,Wizard Rod,,9-60,Ball,\n"
+    path = tmp_path / "meta.csv"
+    path.write_bytes((HEADER + "\n" + row.replace("Rod", "Rod é")).encode("latin-1"))
+    assert meta.read_meta(str(path))["Combo"][0] == "Plastic Wizard Rod é 9-60 Ball"
+    path.write_bytes((HEADER + "\n" + row).encode("utf-8-sig"))
+    assert meta.read_meta(str(path)).columns[1] == "Rank Change"
@@ -0,0 +1,79 @@
+import os
+
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# L'app all'import legge i secrets e si collega a GitHub: gli script di prova eseguono solo
+# le definizioni che servono, prese da streamlit_app.py, e poi lo scenario indicato
+def helpers_app(root, wanted, scenario):
+    import os
+    import ast
+    import streamlit as st
+    path = os.path.join(root, "streamlit_app.py")
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    body = [n for n in tree.body if getattr(n, "name", None) in wanted
+            or isinstance(n, ast.Assign) and any(getattr(t, "id", None) in wanted for t in n.targets)]
+    ns = {"st": st}
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, "exec"), ns)
+
+    if scenario == "pagine":
+        q = st.text_input("Cerca")
+        items = [f"Bey {i}" for i in range(25) if q in f"Bey {i}"]
+        st.session_state.shown = ns["paginate"](items, "test", reset_on=q)
+    elif scenario == "indice":
+        if "users" not in st.session_state:
+            st.session_state.users = {"Fabio": {"decks": {"beys": [
+                {"id": "a", "tipo": "BX/UX", "b": "DranSword", "r": "3-60", "bi": "F"},
+                {"id": "b", "tipo": "CX", "lc": "Emperor", "mb": "Brave", "ab": "Heavy", "r": "-", "bi": "Hexa"}]}}}
+        if st.button("Modifica", key="modifica"):
+            st.session_state.users["Fabio"]["decks"]["beys"][0]["bi"] = "Ball"
+            ns["bump_data_version"]()
+        index = ns["get_bey_index"]("Fabio")
+        st.session_state.nomi = {k: v[1] for k, v in index.items()}
+        st.session_state.parti = {k: v[2] for k, v in index.items()}
+        st.session_state.indice_id = id(index)
+
+def pagination_app():
+    return AppTest.from_function(helpers_app, args=(ROOT, {"PAGE_SIZE", "_turn_page", "paginate"}, "pagine"))
+
+def page_label(at):
+    return next(m.value for m in at.markdown if m.value.startswith("Pagina"))
+
+def test_paginate_turns_pages_and_resets_on_search():
+    at = pagination_app().run()
+    assert at.session_state.shown == [f"Bey {i}" for i in range(10)]
+    assert page_label(at).startswith("Pagina 1 di 3") and at.button(key="prev_test").disabled
+    at.button(key="next_test").click().run()
+    at.button(key="next_test").click().run()
+    assert at.session_state.shown == [f"Bey {i}" for i in range(20, 25)]
+    assert page_label(at).startswith("Pagina 3 di 3") and at.button(key="next_test").disabled
+    # Nuova ricerca: si torna alla prima pagina, senza controlli se basta una pagina sola
+    at.text_input[0].input("Bey 1").run()
+    assert at.session_state.shown == ["Bey 1"] + [f"Bey {i}" for i in range(10, 19)]
+    at.text_input[0].input("Bey 2").run()
+    assert at.session_state.shown == ["Bey 2"] + [f"Bey {i}" for i in range(20, 25)]
+    assert not [m for m in at.markdown if m.value.startswith("Pagina")]
+
+def test_paginate_clamps_page_when_results_shrink():
+    at = pagination_app().run()
+    at.session_state["page_test"] = 7
+    at.run()
+    assert at.session_state.shown == [f"Bey {i}" for i in range(20, 25)]
+    assert at.session_state["page_test"] == 2
+
+# =========================
+# INDICE DEI BEYBLADE
+# =========================
+def test_bey_index_rebuilt_only_on_data_version():
+    at = AppTest.from_function(helpers_app, args=(
+        ROOT, {"get_bey_name_and_comps", "bump_data_version", "get_bey_index"}, "indice")).run()
+    assert at.session_state.nomi == {"a": "DranSword 3-60 F", "b": "Emperor Brave Heavy Hexa"}
+    assert at.session_state.parti["b"] == ["Emperor", "Brave", "Heavy", "Hexa"]
+    first = at.session_state.indice_id
+    at.run()
+    assert at.session_state.indice_id == first
+    at.button(key="modifica").click().run()
+    assert at.session_state.indice_id != first
+    assert at.session_state.nomi["a"] == "DranSword 3-60 Ball"
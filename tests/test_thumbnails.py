@@ -0,0 +1,36 @@
+from io import BytesIO
+
+from PIL import Image
+
+from thumbnails import ThumbnailCache, render_thumbnail, sidecar_path
+
+def save_png(path, color=(200, 30, 30, 255), size=(300, 200)):
+    Image.new("RGBA", size, color).save(path, "PNG")
+    return str(path)
+
+def test_render_prefers_pregenerated_sidecar(tmp_path):
+    path = save_png(tmp_path / "aaa.png")
+    with open(sidecar_path(path, 80), "wb") as f: f.write(b"miniatura")
+    assert sidecar_path(path, 80) == str(tmp_path / "aaa_80.png")
+    assert render_thumbnail(path, (80, 80)) == b"miniatura"
+    # Dimensione non standard: resize al volo
+    assert Image.open(BytesIO(render_thumbnail(path, (60, 60)))).size == (60, 60)
+
+def test_cache_hits_and_lru_budget(tmp_path):
+    paths = [save_png(tmp_path / f"{i}.png", (i * 40, 0, 0, 255)) for i in range(3)]
+    one = len(render_thumbnail(paths[0], (50, 50)))
+    cache = ThumbnailCache(budget=one * 2 + one // 2)
+    cache.get(paths[0], (50, 50))
+    cache.get(paths[1], (50, 50))
+    cache.get(paths[0], (50, 50))       # ora la meno recente è paths[1]
+    cache.get(paths[2], (50, 50))
+    assert list(cache.entries) == [(paths[0], (50, 50)), (paths[2], (50, 50))]
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 3 and stats["bytes"] <= stats["budget"]
+
+def test_cache_skips_missing_and_oversized(tmp_path):
+    path = save_png(tmp_path / "grande.png")
+    cache = ThumbnailCache(budget=10)
+    assert cache.get(str(tmp_path / "manca.png"), (50, 50)) is None
+    assert cache.get(path, (50, 50))
+    assert cache.entries == {} and cache.bytes == 0
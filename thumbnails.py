@@ -0,0 +1,66 @@
+import os
+import threading
+from io import BytesIO
+from collections import OrderedDict
+
+# =========================
+# CACHE MINIATURE (LRU CON BUDGET IN BYTE)
+# =========================
+STANDARD_SIZES = (80, 100, 150)   # lati delle miniature pre-generate dal job notturno
+
+def sidecar_path(path, size):
+    """Miniatura quadrata pre-generata accanto all'immagine: images/<blob>_<lato>.<ext>."""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{size}{ext}"
+
+def render_thumbnail(path, size):
+    """Byte codificati della miniatura: il file pre-generato se c'è, altrimenti un resize al volo."""
+    if size[0] == size[1] and size[0] in STANDARD_SIZES and os.path.exists(sidecar_path(path, size[0])):
+        with open(sidecar_path(path, size[0]), "rb") as f:
+            return f.read()
+    from PIL import Image   # solo per i resize al volo: con le miniature pre-generate non serve
+    with Image.open(path) as img:
+        fmt = "WEBP" if img.format == "WEBP" else "PNG"
+        out = BytesIO()
+        img.resize(size, Image.Resampling.LANCZOS).save(out, fmt)
+    return out.getvalue()
+
+class ThumbnailCache:
+    """Miniature già codificate (bytes, non oggetti PIL) con politica LRU e tetto in byte.
+
+    Condivisa da tutte le sessioni: oltre `budget` byte si scartano le meno usate di recente,
+    quindi la memoria resta limitata qualunque sia il numero di utenti e di immagini viste.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, size):
+        key = (path, size)
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        if not os.path.exists(path): return None
+        data = render_thumbnail(path, size)
+        with self.lock:
+            if key not in self.entries and len(data) <= self.budget:
+                self.entries[key] = data
+                self.bytes += len(data)
+                while self.bytes > self.budget:
+                    _, old = self.entries.popitem(last=False)
+                    self.bytes -= len(old)
+        return data
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "bytes": self.bytes,
+                    "entries": len(self.entries), "budget": self.budget}